@@ -0,0 +1,218 @@
+import itertools
+import os
+import random
+import threading
+import time
+import metricas
+
+# Planificador de las llamadas salientes a OpenAI. Cada llamada pasa por:
+#   1. Coalescencia: si ya hay una idéntica en vuelo (misma clave), se
+#      espera su resultado en lugar de repetirla.
+#   2. Admisión: una cola con prioridad y tamaño máximo; el chat va antes que
+#      el TTS. Una llamada sale cuando su endpoint tiene un token en su cubo
+#      (límite de solicitudes por minuto) y hay un lugar libre de
+#      concurrencia. Si la cola está llena o la espera excede el máximo se
+#      rechaza con SaturacionOpenAI en vez de acumular trabajo.
+#   3. Reintentos: un 429 vacía el cubo del endpoint y la llamada vuelve a
+#      la cola tras un backoff exponencial con jitter (o el Retry-After).
+# Las llamadas se ejecutan en el hilo de quien llama; el planificador solo
+# decide cuándo.
+PRIORIDADES = {"chat": 0, "transcripcion": 0, "tts": 1}
+RPM_DEFAULT = {"chat": 500, "transcripcion": 50, "tts": 50}
+CONCURRENCIA_DEFAULT = 16
+COLA_MAXIMA_DEFAULT = 64
+ESPERA_MAXIMA_S_DEFAULT = 30
+REINTENTOS_429 = 4
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAXIMO_S = 20
+
+
+class SaturacionOpenAI(Exception):
+    pass
+
+
+def es_limite_de_tasa(error):
+    return getattr(error, "status_code", None) == 429
+
+
+def _retry_after(error):
+    respuesta = getattr(error, "response", None)
+    cabeceras = getattr(respuesta, "headers", None) or {}
+    try:
+        return float(cabeceras.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CuboTokens:
+    def __init__(self, por_minuto, capacidad=None):
+        self.tasa = por_minuto / 60.0
+        self.capacidad = float(capacidad or max(1, por_minuto // 10))
+        self.tokens = self.capacidad
+        self.ultimo = time.monotonic()
+
+    def _rellenar(self, ahora):
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+        self.ultimo = ahora
+
+    def disponible(self, ahora):
+        self._rellenar(ahora)
+        return self.tokens >= 1
+
+    def espera(self, ahora):
+        self._rellenar(ahora)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.tasa
+
+    def tomar(self):
+        self.tokens -= 1
+
+    def vaciar(self, ahora, segundos=0.0):
+        # Tras un 429: sin tokens y, si el proveedor lo pidió, en negativo
+        # para que nadie salga antes del Retry-After.
+        self._rellenar(ahora)
+        self.tokens = min(self.tokens, 0.0) - segundos * self.tasa
+
+
+class _EnVuelo:
+    __slots__ = ("evento", "resultado", "error", "seguidores")
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+        self.seguidores = 0
+
+
+class PlanificadorOpenAI:
+    def __init__(self, rpm=None, concurrencia=CONCURRENCIA_DEFAULT, cola_maxima=COLA_MAXIMA_DEFAULT,
+                 espera_maxima_s=ESPERA_MAXIMA_S_DEFAULT, reintentos=REINTENTOS_429):
+        rpm = {**RPM_DEFAULT, **(rpm or {})}
+        self.cubos = {endpoint: CuboTokens(valor) for endpoint, valor in rpm.items()}
+        self.concurrencia = concurrencia
+        self.cola_maxima = cola_maxima
+        self.espera_maxima_s = espera_maxima_s
+        self.reintentos = reintentos
+        self._condicion = threading.Condition()
+        self._esperando = []
+        self._secuencia = itertools.count()
+        self._en_curso = 0
+        self._en_vuelo = {}
+
+    def _publicar_profundidad(self):
+        for endpoint in self.cubos:
+            metricas.fijar('openai_cola', sum(1 for t in self._esperando if t[2] == endpoint), endpoint=endpoint)
+        metricas.fijar('openai_en_curso', self._en_curso)
+
+    def _admitir(self, endpoint, prioridad):
+        cubo = self.cubos[endpoint]
+        limite = time.monotonic() + self.espera_maxima_s
+        with self._condicion:
+            if len(self._esperando) >= self.cola_maxima:
+                metricas.contar('openai_rechazos', endpoint=endpoint, motivo='cola_llena')
+                raise SaturacionOpenAI("Cola de solicitudes a OpenAI llena")
+            ticket = (prioridad, next(self._secuencia), endpoint)
+            self._esperando.append(ticket)
+            self._publicar_profundidad()
+            inicio = time.monotonic()
+            try:
+                while True:
+                    ahora = time.monotonic()
+                    # Sale el ticket de mayor prioridad entre los que tienen
+                    # token disponible; uno sin token no bloquea a los demás.
+                    listos = sorted(t for t in self._esperando if self.cubos[t[2]].disponible(ahora))
+                    if self._en_curso < self.concurrencia and listos and listos[0] == ticket:
+                        cubo.tomar()
+                        self._en_curso += 1
+                        break
+                    if ahora >= limite:
+                        metricas.contar('openai_rechazos', endpoint=endpoint, motivo='espera')
+                        raise SaturacionOpenAI("Tiempo de espera agotado en la cola de OpenAI")
+                    espera = cubo.espera(ahora) or (limite - ahora)
+                    self._condicion.wait(min(espera, limite - ahora))
+            finally:
+                self._esperando.remove(ticket)
+                self._publicar_profundidad()
+                self._condicion.notify_all()
+        metricas.observar('openai_espera', time.monotonic() - inicio, endpoint=endpoint)
+
+    def _liberar(self):
+        with self._condicion:
+            self._en_curso -= 1
+            self._publicar_profundidad()
+            self._condicion.notify_all()
+
+    def _ejecutar_con_reintentos(self, endpoint, funcion, prioridad):
+        for intento in range(self.reintentos + 1):
+            self._admitir(endpoint, prioridad)
+            try:
+                return funcion()
+            except Exception as e:
+                if not es_limite_de_tasa(e) or intento == self.reintentos:
+                    raise
+                metricas.contar('openai_429', endpoint=endpoint)
+                espera = _retry_after(e)
+                with self._condicion:
+                    self.cubos[endpoint].vaciar(time.monotonic(), espera or 0.0)
+                if espera is None:
+                    espera = min(BACKOFF_MAXIMO_S, BACKOFF_BASE_S * 2 ** intento) * random.uniform(0.5, 1.5)
+            finally:
+                self._liberar()
+            time.sleep(espera)
+
+    def ejecutar(self, endpoint, funcion, clave=None, prioridad=None):
+        prioridad = PRIORIDADES.get(endpoint, 1) if prioridad is None else prioridad
+        if clave is None:
+            return self._ejecutar_con_reintentos(endpoint, funcion, prioridad)
+
+        clave = (endpoint, clave)
+        with self._condicion:
+            en_vuelo = self._en_vuelo.get(clave)
+            lider = en_vuelo is None
+            if lider:
+                en_vuelo = self._en_vuelo[clave] = _EnVuelo()
+            else:
+                en_vuelo.seguidores += 1
+
+        if not lider:
+            metricas.contar('openai_coalescidas', endpoint=endpoint)
+            en_vuelo.evento.wait()
+            if en_vuelo.error is not None:
+                raise en_vuelo.error
+            return en_vuelo.resultado
+
+        try:
+            en_vuelo.resultado = self._ejecutar_con_reintentos(endpoint, funcion, prioridad)
+            return en_vuelo.resultado
+        except Exception as e:
+            en_vuelo.error = e
+            raise
+        finally:
+            with self._condicion:
+                self._en_vuelo.pop(clave, None)
+            en_vuelo.evento.set()
+
+
+def _rpm_desde_entorno():
+    rpm = {}
+    for endpoint in RPM_DEFAULT:
+        valor = os.getenv(f"MIASESOR_OPENAI_RPM_{endpoint.upper()}")
+        if valor:
+            rpm[endpoint] = float(valor)
+    return rpm
+
+
+_planificador = None
+_lock_planificador = threading.Lock()
+
+
+def obtener_planificador():
+    global _planificador
+    with _lock_planificador:
+        if _planificador is None:
+            _planificador = PlanificadorOpenAI(
+                rpm=_rpm_desde_entorno(),
+                concurrencia=int(os.getenv("MIASESOR_OPENAI_CONCURRENCIA") or CONCURRENCIA_DEFAULT),
+                cola_maxima=int(os.getenv("MIASESOR_OPENAI_COLA_MAXIMA") or COLA_MAXIMA_DEFAULT),
+                espera_maxima_s=float(os.getenv("MIASESOR_OPENAI_ESPERA_MAXIMA_S") or ESPERA_MAXIMA_S_DEFAULT),
+            )
+        return _planificador
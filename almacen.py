@@ -0,0 +1,142 @@
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+from versiones import version_datos
+
+ARCHIVO_INSTANTANEA = "instantanea.json"
+
+
+def directorio_cache():
+    return os.getenv("MIASESOR_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+
+class Instantanea:
+    # Versión inmutable del panel de Banxico y sus pronósticos. Nunca se
+    # modifica después de publicarse: una actualización crea otra instancia.
+
+    def __init__(self, datos, pronosticos, series_fallidas=None, actualizado=None, origen=None, motores=None,
+                 diferencias=None, sensibilidades=None):
+        self.datos = datos
+        self.pronosticos = pronosticos
+        self.series_fallidas = list(series_fallidas or [])
+        # Modelo que produjo cada pronóstico (sarimax, conjunto o uno de
+        # la cascada de respaldo).
+        self.motores = dict(motores or {})
+        # Qué cambió en el panel respecto a la versión anterior
+        # (versiones.diferencias_datos).
+        self.diferencias = diferencias
+        # Coeficientes de los modelos ajustados para evaluar escenarios de
+        # las exógenas sin reajustar (escenarios.py).
+        self.sensibilidades = dict(sensibilidades or {})
+        self.actualizado = actualizado or datetime.now().astimezone()
+        self.origen = origen
+        self.version_datos = version_datos(datos)
+        self.version_pronosticos = version_datos(pronosticos)
+
+    @property
+    def version(self):
+        return f"{self.version_datos}-{self.version_pronosticos}"
+
+
+_actual = None
+_lock = threading.Lock()
+
+
+def actual():
+    return _actual
+
+
+def publicar(instantanea):
+    global _actual
+    with _lock:
+        _actual = instantanea
+    return instantanea
+
+
+def _df_a_dict(df):
+    # Los floats de Python se serializan con repr, así que el DataFrame se
+    # reconstruye con los mismos bits y conserva su huella de versión.
+    return {
+        "indice": [fecha.isoformat() for fecha in df.index],
+        "columnas": [str(columna) for columna in df.columns],
+        "valores": df.to_numpy().tolist(),
+    }
+
+
+def _df_desde_dict(datos):
+    import pandas as pd
+
+    return pd.DataFrame(
+        datos["valores"],
+        index=pd.DatetimeIndex(datos["indice"]),
+        columns=datos["columnas"],
+        dtype=float
+    )
+
+
+def instantanea_a_dict(instantanea):
+    return {
+        "version": instantanea.version,
+        "actualizado": instantanea.actualizado.isoformat(),
+        "series_fallidas": instantanea.series_fallidas,
+        "motores": instantanea.motores,
+        "diferencias": instantanea.diferencias,
+        "sensibilidades": instantanea.sensibilidades,
+        "datos": _df_a_dict(instantanea.datos),
+        "pronosticos": {
+            serie: _df_a_dict(df) for serie, df in (instantanea.pronosticos or {}).items()
+        },
+    }
+
+
+def instantanea_desde_dict(contenido):
+    pronosticos = {
+        serie: _df_desde_dict(df) for serie, df in (contenido.get("pronosticos") or {}).items()
+    }
+    return Instantanea(
+        _df_desde_dict(contenido["datos"]),
+        pronosticos or None,
+        contenido.get("series_fallidas"),
+        datetime.fromisoformat(contenido["actualizado"]),
+        origen="disco",
+        motores=contenido.get("motores"),
+        diferencias=contenido.get("diferencias"),
+        sensibilidades=contenido.get("sensibilidades")
+    )
+
+
+def escribir_json_atomico(ruta, contenido):
+    # Un temporal único por escritura: dos hilos del mismo proceso pueden
+    # escribir el mismo destino (programador, refresco forzado, sincronización).
+    directorio = os.path.dirname(ruta) or "."
+    os.makedirs(directorio, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=f".{os.path.basename(ruta)}.", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w", encoding="utf-8") as archivo:
+            json.dump(contenido, archivo, ensure_ascii=False)
+        # mkstemp crea el archivo con 0600; el JSON lo leen otros procesos.
+        os.chmod(temporal, 0o644)
+        os.replace(temporal, ruta)
+    except BaseException:
+        try:
+            os.remove(temporal)
+        except OSError:
+            pass
+        raise
+
+
+def guardar_instantanea(instantanea, ruta=None):
+    ruta = ruta or os.path.join(directorio_cache(), ARCHIVO_INSTANTANEA)
+    escribir_json_atomico(ruta, instantanea_a_dict(instantanea))
+    return ruta
+
+
+def cargar_instantanea(ruta=None):
+    ruta = ruta or os.path.join(directorio_cache(), ARCHIVO_INSTANTANEA)
+    try:
+        with open(ruta, "r", encoding="utf-8") as archivo:
+            return instantanea_desde_dict(json.load(archivo))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
@@ -0,0 +1,199 @@
+import copy
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from versiones import version_datos
+
+SERIES_CETES = ['CETE_28D', 'CETE_91D', 'CETE_182D', 'CETE_364D']
+VENTANAS_DEFAULT = (4, 12, 26, 52)
+ESTADISTICAS = ['media', 'desviacion', 'minimo', 'maximo', 'zscore']
+# Motores por versión del panel: sesiones con versiones distintas (antes y
+# después de un refresco) no se obligan a recalcular desde cero.
+MAX_MOTORES = 4
+
+
+class AnaliticaMovil:
+    # Estadísticas móviles (media, desviación, mínimo, máximo y z-score) por
+    # serie y ventana. Los resultados viven en buffers que crecen por bloques,
+    # así agregar semanas nuevas solo recalcula las filas nuevas.
+
+    def __init__(self, ventanas=VENTANAS_DEFAULT, series=SERIES_CETES):
+        self.ventanas = tuple(sorted(set(int(v) for v in ventanas if int(v) >= 2)))
+        self.series_base = list(series)
+        self.series = []
+        self.version = None
+        self._n = 0
+        self._fechas = np.empty(0, dtype='datetime64[ns]')
+        self._valores = np.empty((0, 0))
+        self._resultados = {}
+
+    def __len__(self):
+        return self._n
+
+    def _asegurar_capacidad(self, n):
+        capacidad = len(self._fechas)
+        if n <= capacidad:
+            return
+        nueva = max(n, capacidad * 2, 64)
+        fechas = np.empty(nueva, dtype='datetime64[ns]')
+        fechas[:self._n] = self._fechas[:self._n]
+        valores = np.full((nueva, len(self.series)), np.nan)
+        valores[:self._n] = self._valores[:self._n]
+        self._fechas, self._valores = fechas, valores
+        for ventana, resultado in self._resultados.items():
+            ampliado = np.full((nueva, len(self.series), len(ESTADISTICAS)), np.nan)
+            ampliado[:self._n] = resultado[:self._n]
+            self._resultados[ventana] = ampliado
+
+    def _calcular_filas(self, inicio, fin):
+        # Calcula las filas [inicio, fin) usando solo las (ventana - 1)
+        # observaciones previas: O(ventana) por fila nueva.
+        for ventana in self.ventanas:
+            resultado = self._resultados[ventana]
+            desde = max(inicio, ventana - 1)
+            if desde >= fin:
+                continue
+            bloque = self._valores[desde - ventana + 1:fin]
+            vistas = sliding_window_view(bloque, ventana, axis=0)
+            media = vistas.mean(axis=-1)
+            desviacion = vistas.std(axis=-1, ddof=1)
+            actual = self._valores[desde:fin]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                # Desviación NaN (faltantes en la ventana): z-score desconocido,
+                # no "en la media".
+                zscore = np.where(desviacion > 0, (actual - media) / desviacion,
+                                  np.where(np.isnan(desviacion), np.nan, 0.0))
+            resultado[desde:fin, :, 0] = media
+            resultado[desde:fin, :, 1] = desviacion
+            resultado[desde:fin, :, 2] = vistas.min(axis=-1)
+            resultado[desde:fin, :, 3] = vistas.max(axis=-1)
+            resultado[desde:fin, :, 4] = zscore
+
+    def calcular(self, datos_df):
+        self.series = [s for s in self.series_base if s in datos_df.columns]
+        self._n = 0
+        self._fechas = np.empty(0, dtype='datetime64[ns]')
+        self._valores = np.empty((0, len(self.series)))
+        self._resultados = {v: np.empty((0, len(self.series), len(ESTADISTICAS))) for v in self.ventanas}
+        self._agregar_filas(datos_df)
+        self.version = version_datos(datos_df)
+        return self
+
+    def _agregar_filas(self, nuevas):
+        k = len(nuevas)
+        if k == 0:
+            return
+        inicio = self._n
+        self._asegurar_capacidad(inicio + k)
+        self._fechas[inicio:inicio + k] = nuevas.index.to_numpy(dtype='datetime64[ns]')
+        self._valores[inicio:inicio + k] = nuevas[self.series].to_numpy(dtype=np.float64)
+        self._n = inicio + k
+        self._calcular_filas(inicio, self._n)
+
+    def agregar(self, nuevas_filas):
+        if self._n > 0 and len(nuevas_filas) > 0 and nuevas_filas.index[0] <= self._fechas[self._n - 1]:
+            raise ValueError("Las filas nuevas deben ser posteriores a la última semana calculada")
+        self._agregar_filas(nuevas_filas)
+        return self
+
+    def _es_extension(self, datos_df):
+        if self._n == 0 or len(datos_df) < self._n:
+            return False
+        if [s for s in self.series_base if s in datos_df.columns] != self.series:
+            return False
+        if not np.array_equal(datos_df.index[:self._n].to_numpy(dtype='datetime64[ns]'), self._fechas[:self._n]):
+            return False
+        previos = datos_df[self.series].iloc[:self._n].to_numpy(dtype=np.float64)
+        return np.array_equal(previos, self._valores[:self._n], equal_nan=True)
+
+    def actualizar(self, datos_df):
+        version = version_datos(datos_df)
+        if version is not None and version == self.version:
+            return self
+        if self._es_extension(datos_df):
+            self._agregar_filas(datos_df.iloc[self._n:])
+            self.version = version
+            return self
+        return self.calcular(datos_df)
+
+    def copia(self):
+        # _agregar_filas escribe en los buffers: la copia no comparte arreglos.
+        otra = copy.copy(self)
+        otra.series = list(self.series)
+        otra._fechas = self._fechas.copy()
+        otra._valores = self._valores.copy()
+        otra._resultados = {ventana: resultado.copy() for ventana, resultado in self._resultados.items()}
+        return otra
+
+    def estadisticas(self, serie, ventana):
+        if serie not in self.series or ventana not in self._resultados:
+            return None
+        columna = self.series.index(serie)
+        return pd.DataFrame(
+            self._resultados[ventana][:self._n, columna, :].copy(),
+            index=pd.DatetimeIndex(self._fechas[:self._n]),
+            columns=ESTADISTICAS
+        )
+
+    def resumen(self, serie, ventanas=None):
+        if serie not in self.series or self._n == 0:
+            return None
+        columna = self.series.index(serie)
+        resumen = {
+            "serie": serie,
+            "fecha": str(pd.Timestamp(self._fechas[self._n - 1]).date()),
+            "tasa_actual": round(float(self._valores[self._n - 1, columna]), 4),
+            "ventanas": {}
+        }
+        for ventana in (ventanas or self.ventanas):
+            if ventana not in self._resultados:
+                continue
+            fila = self._resultados[ventana][self._n - 1, columna]
+            if np.isnan(fila[0]):
+                continue
+            resumen["ventanas"][f"{ventana}_semanas"] = {
+                nombre: round(float(valor), 4) for nombre, valor in zip(ESTADISTICAS, fila)
+            }
+        return resumen
+
+
+_motores = OrderedDict()
+_lock_motor = threading.Lock()
+
+
+def analitica_para(datos_df):
+    # Un motor publicado en _motores no se vuelve a modificar, así que se lee
+    # sin candado. Una versión nueva parte de una copia del motor del que es
+    # extensión (solo calcula las semanas nuevas) o se calcula completa.
+    if datos_df is None or len(datos_df) == 0:
+        return None
+    version = version_datos(datos_df)
+    with _lock_motor:
+        motor = _motores.get(version)
+        if motor is not None:
+            _motores.move_to_end(version)
+            return motor
+        candidatos = list(reversed(_motores.values()))
+
+    base = next((m for m in candidatos if m._es_extension(datos_df)), None)
+    motor = base.copia() if base is not None else AnaliticaMovil()
+    motor.actualizar(datos_df)
+
+    with _lock_motor:
+        motor = _motores.setdefault(version, motor)
+        _motores.move_to_end(version)
+        while len(_motores) > MAX_MOTORES:
+            _motores.popitem(last=False)
+    return motor
+
+
+def estadisticas_moviles(datos_df, serie, ventana):
+    motor = analitica_para(datos_df)
+    return motor.estadisticas(serie, ventana) if motor is not None else None
+
+
+def resumen_analitica(datos_df, serie, ventanas=None):
+    motor = analitica_para(datos_df)
+    return motor.resumen(serie, ventanas) if motor is not None else None
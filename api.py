@@ -0,0 +1,277 @@
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import numpy as np
+import almacen
+import metricas
+from graficas import SERIES_CETES, ETIQUETAS_CETES
+from recomendaciones import evaluar_recomendacion
+
+# API de solo lectura sobre la instantánea vigente. Cada cuerpo se arma una
+# sola vez por versión de datos (y por parámetros) y se guarda ya
+# serializado y comprimido; las peticiones siguientes solo copian bytes, y
+# las que traen If-None-Match/If-Modified-Since vigentes reciben un 304 sin
+# tocar la caché.
+MAX_RESPUESTAS_CACHE = 256
+TAMANO_MINIMO_GZIP = 1024
+SEMANAS_PANEL_DEFAULT = 52
+CACHE_CONTROL = "public, max-age=60"
+# generar_pronostico_sarimax usa el intervalo de confianza de 95%.
+CUANTILES_PRONOSTICO = {
+    "0.025": "limite_inferior",
+    "0.5": "pronostico",
+    "0.975": "limite_superior",
+}
+
+_cache_respuestas = OrderedDict()
+_lock_cache = threading.Lock()
+
+
+class ErrorAPI(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.mensaje = mensaje
+
+
+def _fechas(indice):
+    return [fecha.strftime('%Y-%m-%d') for fecha in indice]
+
+
+def _valores(serie):
+    valores = serie.to_numpy(dtype=float)
+    return [float(v) if np.isfinite(v) else None for v in valores]
+
+
+def _contenido_version(instantanea):
+    return {
+        "version": instantanea.version,
+        "version_datos": instantanea.version_datos,
+        "version_pronosticos": instantanea.version_pronosticos,
+        "actualizado": instantanea.actualizado.isoformat(),
+        "ultima_fecha": instantanea.datos.index[-1].strftime('%Y-%m-%d') if len(instantanea.datos) else None,
+        "series_fallidas": instantanea.series_fallidas,
+        "motores": instantanea.motores,
+        "diferencias": instantanea.diferencias,
+    }
+
+
+def _validar_panel(instantanea, semanas=SEMANAS_PANEL_DEFAULT, series=None):
+    if series:
+        faltantes = [s for s in series if s not in instantanea.datos.columns]
+        if faltantes:
+            raise ErrorAPI(400, f"Series desconocidas: {', '.join(faltantes)}")
+    return {"semanas": semanas, "series": series}
+
+
+def _contenido_panel(instantanea, semanas=SEMANAS_PANEL_DEFAULT, series=None):
+    datos = instantanea.datos
+    if series:
+        datos = datos[list(series)]
+    if semanas and semanas > 0:
+        datos = datos.iloc[-semanas:]
+    return {
+        "version": instantanea.version_datos,
+        "fechas": _fechas(datos.index),
+        "series": {columna: _valores(datos[columna]) for columna in datos.columns},
+    }
+
+
+def _pronostico_plazo(instantanea, plazo):
+    df = (instantanea.pronosticos or {}).get(plazo)
+    if df is None:
+        raise ErrorAPI(404, f"No hay pronóstico disponible para {plazo}")
+    return {
+        "plazo": plazo,
+        "nombre": ETIQUETAS_CETES.get(plazo, plazo),
+        "motor": instantanea.motores.get(plazo),
+        "fechas": _fechas(df.index),
+        "cuantiles": {
+            cuantil: _valores(df[columna]) for cuantil, columna in CUANTILES_PRONOSTICO.items() if columna in df.columns
+        },
+    }
+
+
+def _contenido_pronosticos(instantanea, plazo=None):
+    if plazo is not None:
+        return {"version": instantanea.version, **_pronostico_plazo(instantanea, plazo)}
+    return {
+        "version": instantanea.version,
+        "pronosticos": {
+            serie: _pronostico_plazo(instantanea, serie) for serie in SERIES_CETES if serie in (instantanea.pronosticos or {})
+        },
+    }
+
+
+def _recomendacion_plazo(instantanea, plazo):
+    resultado = evaluar_recomendacion(instantanea.datos, instantanea.pronosticos, plazo)
+    if "error" in resultado:
+        raise ErrorAPI(404, resultado["error"])
+    return resultado
+
+
+def _contenido_recomendaciones(instantanea, plazo=None):
+    if plazo is not None:
+        return {"version": instantanea.version, **_recomendacion_plazo(instantanea, plazo)}
+    recomendaciones = {}
+    for serie in SERIES_CETES:
+        resultado = evaluar_recomendacion(instantanea.datos, instantanea.pronosticos, serie)
+        if "error" not in resultado and resultado["plazo"] == serie:
+            recomendaciones[serie] = resultado
+    return {"version": instantanea.version, "recomendaciones": recomendaciones}
+
+
+def _validar_escenario(instantanea, **cambios):
+    # Un escenario por petición; cada parámetro es una lista de cambios
+    # acumulados separados por comas (ej: tasa_objetivo_pb=-25,-25,-50).
+    from escenarios import VARIABLES_ESCENARIO, normalizar_escenario
+
+    escenario = {}
+    for parametro, valor in cambios.items():
+        if parametro not in VARIABLES_ESCENARIO:
+            continue
+        try:
+            escenario[parametro] = [float(parte) for parte in valor.split(",") if parte.strip()]
+        except ValueError:
+            raise ErrorAPI(400, f"{parametro} debe ser una lista de números separados por comas")
+    semanas = max((len(valores) for valores in escenario.values()), default=1) or 1
+    _, error = normalizar_escenario(escenario, semanas)
+    if error:
+        raise ErrorAPI(400, error)
+    return {"escenario": escenario}
+
+
+def _contenido_escenario(instantanea, escenario):
+    from escenarios import resumen_escenarios
+
+    resultado = resumen_escenarios(instantanea, [escenario])
+    if "error" in resultado:
+        raise ErrorAPI(400 if instantanea.sensibilidades else 404, resultado["error"])
+    return resultado
+
+
+RECURSOS = {
+    "version": _contenido_version,
+    "panel": _contenido_panel,
+    "pronosticos": _contenido_pronosticos,
+    "recomendaciones": _contenido_recomendaciones,
+    "escenario": _contenido_escenario,
+}
+# Validan y normalizan los parámetros antes de responder 304 o de armar la
+# llave de la caché.
+VALIDADORES = {
+    "panel": _validar_panel,
+    "escenario": _validar_escenario,
+}
+# Los escenarios ya se guardan por su huella en escenarios.py; sus cuerpos no
+# entran a esta caché para que parámetros arbitrarios no desplacen los del
+# panel y los pronósticos.
+RECURSOS_SIN_CACHE = {"escenario"}
+
+
+def _serializar(contenido):
+    cuerpo = json.dumps(contenido, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    comprimido = gzip.compress(cuerpo, compresslevel=6, mtime=0) if len(cuerpo) >= TAMANO_MINIMO_GZIP else None
+    return cuerpo, comprimido
+
+
+def _cuerpos(instantanea, recurso, argumentos):
+    if recurso in RECURSOS_SIN_CACHE:
+        return _serializar(RECURSOS[recurso](instantanea, **argumentos))
+
+    parametros = tuple(sorted(argumentos.items()))
+    clave = (instantanea.version, recurso, parametros)
+    with _lock_cache:
+        if clave in _cache_respuestas:
+            _cache_respuestas.move_to_end(clave)
+            return _cache_respuestas[clave]
+
+    cuerpos = _serializar(RECURSOS[recurso](instantanea, **dict(parametros)))
+
+    with _lock_cache:
+        _cache_respuestas[clave] = cuerpos
+        _cache_respuestas.move_to_end(clave)
+        while len(_cache_respuestas) > MAX_RESPUESTAS_CACHE:
+            _cache_respuestas.popitem(last=False)
+    return cuerpos
+
+
+def _acepta_gzip(cabeceras):
+    for parte in (cabeceras.get("accept-encoding") or "").split(","):
+        token, _, calidad = parte.strip().partition(";")
+        if token.strip().lower() in ("gzip", "*"):
+            calidad = calidad.strip()
+            if calidad.startswith("q="):
+                try:
+                    return float(calidad[2:]) > 0
+                except ValueError:
+                    return False
+            return True
+    return False
+
+
+def _no_modificado(cabeceras, etiqueta, actualizado):
+    si_no_coincide = cabeceras.get("if-none-match")
+    if si_no_coincide:
+        # Comparación débil: la misma versión vale para el cuerpo con y sin gzip.
+        etiquetas = {e.strip().removeprefix("W/") for e in si_no_coincide.split(",")}
+        return "*" in etiquetas or etiqueta.removeprefix("W/") in etiquetas
+
+    si_modificado = cabeceras.get("if-modified-since")
+    if si_modificado:
+        try:
+            desde = parsedate_to_datetime(si_modificado)
+        except (TypeError, ValueError):
+            return False
+        if desde.tzinfo is None:
+            desde = desde.replace(tzinfo=timezone.utc)
+        return actualizado.replace(microsecond=0) <= desde
+    return False
+
+
+def _error(recurso, estado, mensaje):
+    metricas.contar('api_respuestas', recurso=recurso, estado=estado)
+    return estado, json.dumps({"error": mensaje}, ensure_ascii=False).encode("utf-8"), {"Cache-Control": "no-store"}
+
+
+def responder(recurso, parametros=None, cabeceras=None):
+    # Devuelve (estado, cuerpo, cabeceras). `cabeceras` debe aceptar
+    # .get() con nombres en minúsculas, como las de Starlette.
+    cabeceras = cabeceras or {}
+    parametros = tuple(sorted((k, v) for k, v in (parametros or {}).items() if v is not None))
+    instantanea = almacen.actual()
+    if instantanea is None:
+        return _error(recurso, 503, "Los datos aún no están disponibles")
+
+    plazo = dict(parametros).get("plazo")
+    if plazo is not None and plazo not in SERIES_CETES:
+        return _error(recurso, 404, f"Plazo desconocido: {plazo}")
+    try:
+        validar = VALIDADORES.get(recurso)
+        argumentos = validar(instantanea, **dict(parametros)) if validar else dict(parametros)
+    except ErrorAPI as e:
+        return _error(recurso, e.estado, e.mensaje)
+
+    etiqueta = f'W/"{instantanea.version}"'
+    comunes = {
+        "ETag": etiqueta,
+        "Last-Modified": format_datetime(instantanea.actualizado.astimezone(timezone.utc), usegmt=True),
+        "Cache-Control": CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+    if _no_modificado(cabeceras, etiqueta, instantanea.actualizado):
+        metricas.contar('api_respuestas', recurso=recurso, estado=304)
+        return 304, b"", comunes
+
+    try:
+        cuerpo, comprimido = _cuerpos(instantanea, recurso, argumentos)
+    except ErrorAPI as e:
+        return _error(recurso, e.estado, e.mensaje)
+
+    metricas.contar('api_respuestas', recurso=recurso, estado=200)
+    if comprimido is not None and _acepta_gzip(cabeceras):
+        return 200, comprimido, {**comunes, "Content-Encoding": "gzip"}
+    return 200, cuerpo, comunes
@@ -0,0 +1,84 @@
+import importlib
+import logging
+import threading
+import time
+
+# Se importa antes que cualquier otro módulo de la app para medir el
+# arranque completo del proceso.
+_INICIO = time.perf_counter()
+_marcas = {}
+_lock_marcas = threading.Lock()
+
+MODULOS_PESADOS = [
+    'openai',
+    'statsmodels.tsa.statespace.sarimax',
+    'plotly.graph_objects',
+    'plotly.subplots',
+    'soundfile',
+    'scipy.signal',
+]
+
+registro = logging.getLogger("miasesor.arranque")
+
+
+def marcar(nombre, segundos=None):
+    with _lock_marcas:
+        _marcas[nombre] = round(time.perf_counter() - _INICIO if segundos is None else segundos, 4)
+
+
+def marcas():
+    with _lock_marcas:
+        return dict(_marcas)
+
+
+def restaurar_instantanea():
+    import almacen
+    import artefactos
+    import refresco
+
+    inicio = time.perf_counter()
+    directorio = artefactos.directorio_artefactos()
+    if directorio:
+        try:
+            instantanea = refresco.cargar_desde_artefactos(directorio)
+        except ValueError:
+            instantanea = None
+    else:
+        import cache_compartida
+
+        instantanea = almacen.cargar_instantanea()
+        if instantanea is not None:
+            cache_compartida.marcar_vigente()
+    if instantanea is not None and almacen.actual() is None:
+        almacen.publicar(instantanea)
+    if instantanea is not None:
+        import tablero
+
+        # En segundo plano: no retrasa el arranque.
+        tablero.materializar(instantanea)
+    marcar('restaurar_instantanea_s', time.perf_counter() - inicio)
+    marcar('datos_disponibles' if instantanea is not None else 'sin_instantanea')
+    return instantanea
+
+
+def _calentar(modulos):
+    for modulo in modulos:
+        inicio = time.perf_counter()
+        try:
+            importlib.import_module(modulo)
+        except Exception:
+            continue
+        marcar(f'importar_{modulo}_s', time.perf_counter() - inicio)
+    marcar('importaciones_calientes')
+    registro.info("Importaciones pesadas listas: %s", marcas())
+
+
+def calentar_importaciones(modulos=MODULOS_PESADOS):
+    hilo = threading.Thread(target=_calentar, args=(list(modulos),), name="calentar-importaciones", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def reportar():
+    registro.info("Arranque: %s", marcas())
+    return marcas()
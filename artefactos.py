@@ -0,0 +1,113 @@
+import json
+import os
+import shutil
+from datetime import datetime
+import almacen
+
+# Estructura de un directorio de artefactos:
+#   <directorio>/versiones/<id>/panel.json
+#   <directorio>/versiones/<id>/pronosticos.json
+#   <directorio>/versiones/<id>/metadatos.json
+#   <directorio>/ACTUAL        -> contiene el <id> vigente
+# Una versión se escribe completa en un directorio temporal y se publica
+# renombrándola; ACTUAL se reemplaza al final, así un lector nunca ve una
+# versión a medias.
+ARCHIVO_ACTUAL = "ACTUAL"
+DIRECTORIO_VERSIONES = "versiones"
+
+
+def directorio_artefactos():
+    return os.getenv("MIASESOR_ARTEFACTOS_DIR") or None
+
+
+def _id_version(instantanea):
+    return f"{instantanea.actualizado.strftime('%Y%m%dT%H%M%S')}-{instantanea.version}"
+
+
+def escribir_version(directorio, instantanea, metadatos_extra=None):
+    id_version = _id_version(instantanea)
+    versiones = os.path.join(directorio, DIRECTORIO_VERSIONES)
+    destino = os.path.join(versiones, id_version)
+    temporal = os.path.join(versiones, f".{id_version}.{os.getpid()}.tmp")
+    os.makedirs(temporal, exist_ok=True)
+
+    contenido = almacen.instantanea_a_dict(instantanea)
+    with open(os.path.join(temporal, "panel.json"), "w", encoding="utf-8") as archivo:
+        json.dump(contenido["datos"], archivo)
+    with open(os.path.join(temporal, "pronosticos.json"), "w", encoding="utf-8") as archivo:
+        json.dump(contenido["pronosticos"], archivo)
+    with open(os.path.join(temporal, "metadatos.json"), "w", encoding="utf-8") as archivo:
+        json.dump({
+            "id": id_version,
+            "version": instantanea.version,
+            "version_datos": instantanea.version_datos,
+            "version_pronosticos": instantanea.version_pronosticos,
+            "actualizado": contenido["actualizado"],
+            "series_fallidas": contenido["series_fallidas"],
+            "motores": contenido["motores"],
+            "diferencias": contenido["diferencias"],
+            "sensibilidades": contenido["sensibilidades"],
+            **(metadatos_extra or {}),
+        }, archivo, ensure_ascii=False, indent=2)
+
+    if os.path.exists(destino):
+        shutil.rmtree(temporal)
+    else:
+        os.replace(temporal, destino)
+
+    puntero_temporal = os.path.join(directorio, f".{ARCHIVO_ACTUAL}.{os.getpid()}.tmp")
+    with open(puntero_temporal, "w", encoding="utf-8") as archivo:
+        archivo.write(id_version)
+    os.replace(puntero_temporal, os.path.join(directorio, ARCHIVO_ACTUAL))
+    return id_version
+
+
+def id_actual(directorio):
+    try:
+        with open(os.path.join(directorio, ARCHIVO_ACTUAL), "r", encoding="utf-8") as archivo:
+            return archivo.read().strip() or None
+    except OSError:
+        return None
+
+
+def leer_metadatos(directorio, id_version):
+    with open(os.path.join(directorio, DIRECTORIO_VERSIONES, id_version, "metadatos.json"), "r", encoding="utf-8") as archivo:
+        return json.load(archivo)
+
+
+def cargar_version(directorio, id_version=None):
+    id_version = id_version or id_actual(directorio)
+    if id_version is None:
+        return None
+    ruta = os.path.join(directorio, DIRECTORIO_VERSIONES, id_version)
+    try:
+        with open(os.path.join(ruta, "panel.json"), "r", encoding="utf-8") as archivo:
+            datos = json.load(archivo)
+        with open(os.path.join(ruta, "pronosticos.json"), "r", encoding="utf-8") as archivo:
+            pronosticos = json.load(archivo)
+        metadatos = leer_metadatos(directorio, id_version)
+    except (OSError, ValueError):
+        return None
+
+    return almacen.instantanea_desde_dict({
+        "actualizado": metadatos.get("actualizado") or datetime.now().astimezone().isoformat(),
+        "series_fallidas": metadatos.get("series_fallidas"),
+        "motores": metadatos.get("motores"),
+        "diferencias": metadatos.get("diferencias"),
+        "sensibilidades": metadatos.get("sensibilidades"),
+        "datos": datos,
+        "pronosticos": pronosticos,
+    })
+
+
+def podar_versiones(directorio, conservar=5):
+    versiones = os.path.join(directorio, DIRECTORIO_VERSIONES)
+    vigente = id_actual(directorio)
+    try:
+        ids = sorted(n for n in os.listdir(versiones) if not n.startswith("."))
+    except OSError:
+        return []
+    eliminadas = [n for n in ids[:-conservar] if n != vigente] if conservar > 0 else []
+    for id_version in eliminadas:
+        shutil.rmtree(os.path.join(versiones, id_version), ignore_errors=True)
+    return eliminadas
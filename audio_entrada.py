@@ -0,0 +1,133 @@
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import metricas
+
+# Preprocesamiento de la grabación del micrófono antes de mandarla a
+# transcribir: mono, recorte de silencios al inicio y al final, 16 kHz (lo
+# que usa internamente el modelo de transcripción) y codificación
+# comprimida. Si algo falla se sube el archivo original tal cual.
+FRECUENCIA_OBJETIVO = 16000
+DURACION_MAXIMA_DEFAULT_S = 120
+VENTANA_MS = 30
+# Una ventana es voz si su energía está a menos de RANGO_DB del pico de la
+# grabación y por encima del piso absoluto.
+RANGO_DB = 35.0
+PISO_DB = -55.0
+MARGEN_S = 0.25
+# Opus a 16 kHz pesa decenas de veces menos que WAV PCM; FLAC es el respaldo sin
+# pérdidas si la libsndfile instalada no trae Opus.
+FORMATOS = [
+    ("OGG", "OPUS", ".ogg"),
+    ("FLAC", "PCM_16", ".flac"),
+]
+
+
+def a_mono(datos):
+    if datos.ndim == 1:
+        return datos
+    return datos.mean(axis=1)
+
+
+def limites_voz(datos, frecuencia):
+    # VAD por energía: RMS por ventanas de VENTANA_MS en dBFS.
+    muestras_ventana = max(1, int(frecuencia * VENTANA_MS / 1000))
+    n_ventanas = len(datos) // muestras_ventana
+    if n_ventanas == 0:
+        return None
+    ventanas = datos[:n_ventanas * muestras_ventana].reshape(n_ventanas, muestras_ventana)
+    energia_db = 10 * np.log10(np.mean(ventanas.astype(np.float64) ** 2, axis=1) + 1e-12)
+
+    umbral = max(energia_db.max() - RANGO_DB, PISO_DB)
+    voz = np.flatnonzero(energia_db > umbral)
+    if len(voz) == 0:
+        return None
+
+    margen = int(MARGEN_S * frecuencia)
+    inicio = max(0, voz[0] * muestras_ventana - margen)
+    fin = min(len(datos), (voz[-1] + 1) * muestras_ventana + margen)
+    return inicio, fin
+
+
+def remuestrear(datos, frecuencia, frecuencia_objetivo=FRECUENCIA_OBJETIVO):
+    if frecuencia == frecuencia_objetivo:
+        return datos
+    from math import gcd
+    from scipy.signal import resample_poly
+
+    divisor = gcd(int(frecuencia), int(frecuencia_objetivo))
+    return resample_poly(datos, frecuencia_objetivo // divisor, int(frecuencia) // divisor).astype(np.float32)
+
+
+def _codificar(datos, frecuencia):
+    import soundfile as sf
+
+    for formato, subtipo, extension in FORMATOS:
+        descriptor, ruta = tempfile.mkstemp(suffix=extension)
+        os.close(descriptor)
+        try:
+            sf.write(ruta, datos, frecuencia, format=formato, subtype=subtipo)
+            return ruta
+        except Exception:
+            os.remove(ruta)
+    return None
+
+
+def duracion_maxima_s():
+    return float(os.getenv("MIASESOR_AUDIO_MAX_S") or DURACION_MAXIMA_DEFAULT_S)
+
+
+def preparar_audio(ruta, duracion_maxima=None):
+    # Devuelve (ruta_a_subir, info). ruta_a_subir es None si la grabación no
+    # tiene voz; si es un archivo nuevo, info["temporal"] es True y quien
+    # llama debe borrarlo.
+    import soundfile as sf
+
+    inicio_proceso = time.perf_counter()
+    info = {"bytes_original": os.path.getsize(ruta), "temporal": False}
+    try:
+        datos, frecuencia = sf.read(ruta, dtype="float32", always_2d=True)
+    except Exception:
+        return ruta, info
+
+    datos = a_mono(datos)
+    info["duracion_original_s"] = round(len(datos) / frecuencia, 3)
+
+    limites = limites_voz(datos, frecuencia)
+    if limites is None:
+        info["sin_voz"] = True
+        return None, info
+    datos = datos[limites[0]:limites[1]]
+    datos = datos[:int((duracion_maxima or duracion_maxima_s()) * frecuencia)]
+
+    datos = remuestrear(datos, frecuencia)
+    # El remuestreo puede salirse ligeramente de [-1, 1].
+    np.clip(datos, -1.0, 1.0, out=datos)
+
+    ruta_procesada = _codificar(datos, FRECUENCIA_OBJETIVO)
+    if ruta_procesada is None:
+        return ruta, info
+
+    info.update({
+        "temporal": True,
+        "duracion_s": round(len(datos) / FRECUENCIA_OBJETIVO, 3),
+        "bytes": os.path.getsize(ruta_procesada),
+        "preproceso_s": round(time.perf_counter() - inicio_proceso, 4),
+    })
+    metricas.observar('audio_preproceso', info["preproceso_s"])
+    metricas.contar('audio_bytes', info["bytes_original"], etapa='original')
+    metricas.contar('audio_bytes', info["bytes"], etapa='procesado')
+    return ruta_procesada, info
+
+
+if __name__ == "__main__":
+    # Comparación sin conexión sobre grabaciones de ejemplo:
+    #   python audio_entrada.py grabacion1.wav grabacion2.wav
+    for ruta in sys.argv[1:]:
+        ruta_procesada, info = preparar_audio(ruta)
+        reduccion = info["bytes_original"] / info["bytes"] if info.get("bytes") else None
+        print(f"{ruta}: {info}" + (f" (x{reduccion:.1f} más ligero)" if reduccion else ""))
+        if info.get("temporal"):
+            os.remove(ruta_procesada)
@@ -1,5 +1,6 @@
 import os
 import json
+import time
 import requests
 import pandas as pd
 import numpy as np
@@ -8,49 +9,87 @@ from statsmodels.tsa.statespace.sarimax import SARIMAX
 import warnings
 warnings.filterwarnings('ignore')
 from dotenv import load_dotenv
+import metricas
 
 load_dotenv()
 
+URL_SIE = 'https://www.banxico.org.mx/SieAPIRest/service/v1/series/{serie}/datos/{fechainicio}/{fechafin}/'
+
+def solicitar_datos_serie(serie, fechainicio, fechafin, headers, timeout=30):
+    # Devuelve la lista de observaciones del SIE ([] si el rango no tiene
+    # datos) o None si la respuesta no se pudo usar. Las excepciones de
+    # requests se propagan.
+    url = URL_SIE.format(serie=serie, fechainicio=fechainicio, fechafin=fechafin)
+    with metricas.cronometro('sie_solicitud', serie=serie):
+        response = requests.get(url, headers=headers, timeout=timeout)
+    if response.status_code != 200:
+        metricas.contar('sie_respuestas', serie=serie, resultado='http_error')
+        return None
+    
+    if not response.text or response.text.strip() == '':
+        metricas.contar('sie_respuestas', serie=serie, resultado='vacia')
+        return None
+    
+    try:
+        raw_data = response.json()
+    except (ValueError, json.JSONDecodeError):
+        metricas.contar('sie_respuestas', serie=serie, resultado='json_invalido')
+        return None
+    
+    if 'bmx' in raw_data and 'series' in raw_data['bmx'] and len(raw_data['bmx']['series']) > 0:
+        serie_data = raw_data['bmx']['series'][0]
+        if 'datos' in serie_data and len(serie_data['datos']) > 0:
+            metricas.contar('sie_respuestas', serie=serie, resultado='ok')
+            return serie_data['datos']
+    metricas.contar('sie_respuestas', serie=serie, resultado='sin_datos')
+    return []
+
+
+def datos_a_dataframe(datos, nombre, serie=None):
+    with metricas.cronometro('sie_parseo', serie=serie or nombre):
+        df = pd.DataFrame(datos)
+        
+        df['dato'] = df['dato'].replace('N/E', np.nan).astype(float)
+        df['fecha'] = pd.to_datetime(df['fecha'], dayfirst=True, errors='coerce')
+        df.dropna(subset=['fecha'], inplace=True)
+        df.set_index('fecha', inplace=True)
+        df.rename(columns={'dato': nombre}, inplace=True)
+    return df[[nombre]]
+
+
 def descarga_bmx_series(series_dict, fechainicio, fechafin, token):
     headers = {'Bmx-Token': token} if token else {}
     all_data = []
     
     for serie, nombre in series_dict.items():
-        url = f'https://www.banxico.org.mx/SieAPIRest/service/v1/series/{serie}/datos/{fechainicio}/{fechafin}/'
         try:
-            response = requests.get(url, headers=headers, timeout=30)
-            if response.status_code != 200:
-                continue
-            
-            if not response.text or response.text.strip() == '':
-                continue
-            
-            try:
-                raw_data = response.json()
-            except (ValueError, json.JSONDecodeError):
-                continue
-            
-            if 'bmx' in raw_data and 'series' in raw_data['bmx'] and len(raw_data['bmx']['series']) > 0:
-                serie_data = raw_data['bmx']['series'][0]
-                if 'datos' in serie_data and len(serie_data['datos']) > 0:
-                    data = serie_data['datos']
-                    df = pd.DataFrame(data)
-                    
-                    df['dato'] = df['dato'].replace('N/E', np.nan).astype(float)
-                    df['fecha'] = pd.to_datetime(df['fecha'], dayfirst=True, errors='coerce')
-                    df.dropna(subset=['fecha'], inplace=True)
-                    df.set_index('fecha', inplace=True)
-                    df.rename(columns={'dato': nombre}, inplace=True)
-                    all_data.append(df[[nombre]])
+            datos = solicitar_datos_serie(serie, fechainicio, fechafin, headers)
         except requests.exceptions.RequestException:
+            metricas.contar('sie_respuestas', serie=serie, resultado='excepcion')
             continue
+        if datos:
+            all_data.append(datos_a_dataframe(datos, nombre, serie))
     
     if all_data:
         return pd.concat(all_data, axis=1, join='outer')
     return None
 
 
-def obtener_datos_banxico(fecha_inicio=None, fecha_fin=None, incluir_exogenas=True):
+def obtener_version_datos(anterior=None, **kwargs):
+    # Descarga el panel y lo devuelve como versión inmutable identificada
+    # por su contenido, con las diferencias respecto a `anterior` (el panel
+    # de la versión vigente, si la hay).
+    from versiones import VersionDatos
+
+    df = obtener_datos_banxico(**kwargs)
+    if df is None or len(df) == 0:
+        return None
+    version = VersionDatos(df, anterior)
+    metricas.contar('datos_versiones', tipo=version.diferencias["tipo"])
+    return version
+
+
+def obtener_datos_banxico(fecha_inicio=None, fecha_fin=None, incluir_exogenas=True, por_tramos=None):
     token_banxico = os.getenv('BANXICO_API_KEY', '')
     if not token_banxico or token_banxico.strip() == '':
         raise ValueError("BANXICO_API_KEY no está configurada. Configura tu token en el archivo .env")
@@ -76,7 +115,18 @@ def obtener_datos_banxico(fecha_inicio=None, fecha_fin=None, incluir_exogenas=Tr
                 'SP1': 'INPC'
             })
         
-        df_final_raw = descarga_bmx_series(series_banxico_dict, fecha_inicio, fecha_fin, token_banxico)
+        # Los rangos de más de un año se piden por tramos anuales en paralelo
+        # y con los años cerrados guardados en disco (descarga_historica.py).
+        if por_tramos is None:
+            por_tramos = fecha_inicio[:4] != fecha_fin[:4]
+        
+        if por_tramos:
+            from descarga_historica import descargar_historico, DescargaIncompleta
+            df_final_raw, tramos_fallidos = descargar_historico(series_banxico_dict, fecha_inicio, fecha_fin, token_banxico)
+            if tramos_fallidos:
+                raise DescargaIncompleta(tramos_fallidos)
+        else:
+            df_final_raw = descarga_bmx_series(series_banxico_dict, fecha_inicio, fecha_fin, token_banxico)
         
         if df_final_raw is None or len(df_final_raw) == 0:
             raise ValueError("No se pudieron descargar datos de Banxico. Verifica tu token y conexión")
@@ -91,26 +141,27 @@ def obtener_datos_banxico(fecha_inicio=None, fecha_fin=None, incluir_exogenas=Tr
         if len(cetes_28d_series) == 0:
             raise ValueError("No se encontraron datos de CETE_28D")
         
-        idx_weekly = pd.date_range(
-            start=cetes_28d_series.index.min(),
-            end=cetes_28d_series.index.max(),
-            freq='W-THU'
-        )
+        with metricas.cronometro('alineacion_semanal'):
+            idx_weekly = pd.date_range(
+                start=cetes_28d_series.index.min(),
+                end=cetes_28d_series.index.max(),
+                freq='W-THU'
+            )
         
-        df_master_weekly = pd.DataFrame(index=idx_weekly)
-        temp_df_processed = pd.merge(
-            df_master_weekly, 
-            df_final_raw, 
-            left_index=True, 
-            right_index=True, 
-            how='left'
-        )
+            df_master_weekly = pd.DataFrame(index=idx_weekly)
+            temp_df_processed = pd.merge(
+                df_master_weekly, 
+                df_final_raw, 
+                left_index=True, 
+                right_index=True, 
+                how='left'
+            )
         
-        for col in columns_to_ffill:
-            if col in temp_df_processed.columns:
-                temp_df_processed[col] = temp_df_processed[col].ffill()
+            for col in columns_to_ffill:
+                if col in temp_df_processed.columns:
+                    temp_df_processed[col] = temp_df_processed[col].ffill()
         
-        df_banxico_processed = temp_df_processed.dropna()
+            df_banxico_processed = temp_df_processed.dropna()
         
         if len(df_banxico_processed) == 0:
             raise ValueError("No hay datos válidos después del procesamiento")
@@ -161,7 +212,10 @@ def generar_pronostico_sarimax(df, serie_pronosticar='CETE_28D', semanas_pronost
             enforce_invertibility=False
         )
         
-        modelo_ajustado = modelo.fit(disp=False, maxiter=200)
+        inicio_ajuste = time.perf_counter()
+        with metricas.cronometro('sarimax_ajuste', serie=serie_pronosticar):
+            modelo_ajustado = modelo.fit(disp=False, maxiter=200)
+        segundos_ajuste = time.perf_counter() - inicio_ajuste
         
         if exog_future is not None:
             pronostico = modelo_ajustado.forecast(steps=semanas_pronostico, exog=exog_future)
@@ -185,11 +239,13 @@ def generar_pronostico_sarimax(df, serie_pronosticar='CETE_28D', semanas_pronost
             "rmse": np.sqrt(modelo_ajustado.mse) if hasattr(modelo_ajustado, 'mse') else None,
             "r2": modelo_ajustado.rsquared if hasattr(modelo_ajustado, 'rsquared') else None,
             "serie_pronosticada": serie_pronosticar,
-            "variables_exogenas_usadas": exog_vars if exog is not None else []
+            "variables_exogenas_usadas": exog_vars if exog is not None else [],
+            "segundos_ajuste": segundos_ajuste
         }
         
         return df_pronostico, estadisticas, modelo_ajustado
         
     except Exception as e:
+        metricas.contar('sarimax_fallos', serie=serie_pronosticar)
         return None, None, None
 
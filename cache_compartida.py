@@ -0,0 +1,139 @@
+import os
+import threading
+import almacen
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Coordinación entre varios procesos de la app en el mismo host que comparten
+# MIASESOR_CACHE_DIR. Un candado de archivo (flock) elige al proceso que
+# descarga y ajusta; los demás esperan a que suelte el candado y cargan la
+# instantánea que dejó en disco (escrita con rename atómico), así N procesos
+# cuestan un solo refresco.
+ARCHIVO_CANDADO = "refresco.lock"
+
+
+class CandadoArchivo:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._archivo = None
+        self._lock = threading.Lock()
+
+    def adquirir(self, bloquear=True):
+        if not self._lock.acquire(blocking=bloquear):
+            return False
+        if fcntl is None:
+            return True
+        try:
+            os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+            self._archivo = open(self.ruta, "a+")
+            fcntl.flock(self._archivo.fileno(), fcntl.LOCK_EX | (0 if bloquear else fcntl.LOCK_NB))
+            return True
+        except OSError:
+            if self._archivo is not None:
+                self._archivo.close()
+                self._archivo = None
+            self._lock.release()
+            if bloquear:
+                raise
+            return False
+
+    def liberar(self):
+        if self._archivo is not None:
+            fcntl.flock(self._archivo.fileno(), fcntl.LOCK_UN)
+            self._archivo.close()
+            self._archivo = None
+        self._lock.release()
+
+    def __enter__(self):
+        self.adquirir()
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self.liberar()
+        return False
+
+
+_candado = None
+_firma_cargada = None
+_lock_modulo = threading.Lock()
+
+
+def candado_refresco():
+    global _candado
+    with _lock_modulo:
+        ruta = os.path.join(almacen.directorio_cache(), ARCHIVO_CANDADO)
+        if _candado is None or _candado.ruta != ruta:
+            _candado = CandadoArchivo(ruta)
+        return _candado
+
+
+def ruta_instantanea():
+    return os.path.join(almacen.directorio_cache(), almacen.ARCHIVO_INSTANTANEA)
+
+
+def _firma(ruta):
+    try:
+        estado = os.stat(ruta)
+    except OSError:
+        return None
+    return (estado.st_mtime_ns, estado.st_size)
+
+
+def marcar_vigente(ruta=None):
+    # La instantánea en disco ya es la que tiene este proceso (la acaba de
+    # guardar o de restaurar): no hace falta volver a leerla.
+    global _firma_cargada
+    with _lock_modulo:
+        _firma_cargada = _firma(ruta or ruta_instantanea())
+
+
+def vigente_en_disco():
+    # La instantánea vigente si la del disco ya está cargada en este proceso
+    # (por ejemplo, la cargó antes la sincronización periódica).
+    with _lock_modulo:
+        cargada = _firma_cargada
+    if cargada is None or _firma(ruta_instantanea()) != cargada:
+        return None
+    return almacen.actual()
+
+
+def sincronizar(al_cargar=None):
+    # Carga la instantánea del disco si otro proceso publicó una versión
+    # distinta a la vigente en este. Un stat por llamada si no hay cambios.
+    global _firma_cargada
+    ruta = ruta_instantanea()
+    firma = _firma(ruta)
+    with _lock_modulo:
+        if firma is None or firma == _firma_cargada:
+            return None
+
+    instantanea = almacen.cargar_instantanea(ruta)
+    with _lock_modulo:
+        _firma_cargada = firma
+    if instantanea is None:
+        return None
+
+    vigente = almacen.actual()
+    if vigente is not None and vigente.actualizado >= instantanea.actualizado:
+        return None
+    if vigente is not None and vigente.version == instantanea.version:
+        # Otro proceso refrescó y el panel no cambió: se conservan los
+        # objetos vigentes (y las cachés que cuelgan de ellos) con la fecha
+        # de actualización nueva.
+        instantanea = almacen.Instantanea(
+            vigente.datos,
+            vigente.pronosticos,
+            vigente.series_fallidas,
+            instantanea.actualizado,
+            origen=instantanea.origen,
+            motores=vigente.motores,
+            diferencias=instantanea.diferencias,
+            sensibilidades=vigente.sensibilidades
+        )
+        return almacen.publicar(instantanea)
+    if al_cargar is not None:
+        al_cargar(instantanea)
+    return almacen.publicar(instantanea)
@@ -0,0 +1,265 @@
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import metricas
+
+# Caché local de respuestas para preguntas que llegan sin historial (la
+# primera de una sesión): "¿qué son los CETES?" se responde igual para todos
+# mientras no cambien el prompt ni los datos. La llave incluye la versión
+# del prompt de sistema, que ya depende de los datos, así que una
+# actualización deja fuera las respuestas anteriores para las sesiones nuevas.
+#
+# Además de la coincidencia exacta del texto normalizado se buscan casi
+# duplicados con un índice TF-IDF de n-gramas de caracteres (similitud
+# coseno). Los números de la pregunta tienen que coincidir exactamente:
+# "10,000 a 28 días" y "20,000 a 28 días" se parecen mucho como texto. Lo
+# mismo las palabras de negación: "¿no conviene invertir?" es la pregunta
+# contraria a "¿conviene invertir?".
+MAX_RESPUESTAS_DEFAULT = 256
+TTL_S_DEFAULT = 6 * 3600
+UMBRAL_SIMILITUD = 0.85
+TAMANO_NGRAMA = 3
+# Versiones del prompt con respuestas guardadas a la vez (vigente y anterior).
+MAX_VERSIONES = 2
+MAX_VERSIONES_DESCARTADAS = 32
+PALABRAS_POLARIDAD = frozenset({"no", "nunca", "sin", "ni", "tampoco", "jamas", "ningun", "ninguna", "ninguno", "nada"})
+
+_NO_ALFANUMERICO = re.compile(r"[^0-9a-zñ ]+")
+_ESPACIOS = re.compile(r"\s+")
+_NUMEROS = re.compile(r"\d+")
+# Coma de miles ("10,000"); una coma decimal ("1,5") separa números.
+_SEPARADOR_MILES = re.compile(r"(?<=\d),(?=\d{3}\b)")
+
+
+def normalizar(texto):
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    # Se quitan los acentos pero no la tilde de la ñ.
+    texto = "".join(c for c in texto if c == "\u0303" or not unicodedata.combining(c))
+    texto = unicodedata.normalize("NFC", texto)
+    texto = _NO_ALFANUMERICO.sub(" ", _SEPARADOR_MILES.sub("", texto))
+    return _ESPACIOS.sub(" ", texto).strip()
+
+
+def numeros(texto):
+    return tuple(_NUMEROS.findall(texto))
+
+
+def polaridad(texto):
+    return tuple(palabra for palabra in texto.split() if palabra in PALABRAS_POLARIDAD)
+
+
+def ngramas(texto):
+    relleno = f" {texto} "
+    conteo = {}
+    for i in range(len(relleno) - TAMANO_NGRAMA + 1):
+        ngrama = relleno[i:i + TAMANO_NGRAMA]
+        conteo[ngrama] = conteo.get(ngrama, 0) + 1
+    return conteo
+
+
+def version_prompt(prompt):
+    return hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class _Entrada:
+    __slots__ = ("pregunta", "numeros", "polaridad", "ngramas", "respuesta", "audio", "creada")
+
+    def __init__(self, pregunta, respuesta, audio):
+        self.pregunta = pregunta
+        self.numeros = numeros(pregunta)
+        self.polaridad = polaridad(pregunta)
+        self.ngramas = ngramas(pregunta)
+        self.respuesta = respuesta
+        self.audio = audio
+        self.creada = time.monotonic()
+
+
+class _Respuestas:
+    # Respuestas guardadas con una misma versión del prompt.
+
+    def __init__(self):
+        self.entradas = OrderedDict()
+        # Índice invertido n-grama -> preguntas que lo contienen; también da
+        # la frecuencia de documento para el IDF.
+        self.indice = {}
+
+    def agregar(self, entrada):
+        if entrada.pregunta in self.entradas:
+            self.quitar(entrada.pregunta)
+        self.entradas[entrada.pregunta] = entrada
+        for ngrama in entrada.ngramas:
+            self.indice.setdefault(ngrama, set()).add(entrada.pregunta)
+
+    def quitar(self, pregunta):
+        entrada = self.entradas.pop(pregunta)
+        for ngrama in entrada.ngramas:
+            preguntas = self.indice.get(ngrama)
+            if preguntas is not None:
+                preguntas.discard(pregunta)
+                if not preguntas:
+                    del self.indice[ngrama]
+
+    def _pesos(self, conteo):
+        total = len(self.entradas) + 1
+        pesos = {
+            ngrama: frecuencia * (math.log(total / (1 + len(self.indice.get(ngrama, ())))) + 1)
+            for ngrama, frecuencia in conteo.items()
+        }
+        norma = math.sqrt(sum(peso * peso for peso in pesos.values())) or 1.0
+        return pesos, norma
+
+    def mas_parecida(self, pregunta):
+        # Solo se puntúan las preguntas que comparten algún n-grama.
+        consulta, norma_consulta = self._pesos(ngramas(pregunta))
+        candidatas = set()
+        for ngrama in consulta:
+            candidatas.update(self.indice.get(ngrama, ()))
+        clave_numeros = numeros(pregunta)
+        clave_polaridad = polaridad(pregunta)
+        mejor, similitud = None, 0.0
+        for candidata in candidatas:
+            entrada = self.entradas[candidata]
+            if entrada.numeros != clave_numeros or entrada.polaridad != clave_polaridad:
+                continue
+            pesos, norma = self._pesos(entrada.ngramas)
+            producto = sum(consulta[ngrama] * peso for ngrama, peso in pesos.items() if ngrama in consulta)
+            valor = producto / (norma_consulta * norma)
+            if valor > similitud:
+                mejor, similitud = candidata, valor
+        return mejor, similitud
+
+
+class CacheRespuestas:
+    # Las respuestas se guardan por versión del prompt. Se conservan las
+    # MAX_VERSIONES más recientes: tras un refresco, las sesiones que siguen
+    # con el prompt anterior no borran las respuestas de la versión nueva ni
+    # al revés. Una versión ya descartada no vuelve a abrirse.
+
+    def __init__(self, max_respuestas=MAX_RESPUESTAS_DEFAULT, ttl_s=TTL_S_DEFAULT, umbral=UMBRAL_SIMILITUD):
+        self.max_respuestas = max_respuestas
+        self.ttl_s = ttl_s
+        self.umbral = umbral
+        self._versiones = OrderedDict()
+        self._descartadas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _respuestas(self, version):
+        respuestas = self._versiones.get(version)
+        if respuestas is None and version not in self._descartadas:
+            respuestas = self._versiones[version] = _Respuestas()
+            while len(self._versiones) > MAX_VERSIONES:
+                descartada, _ = self._versiones.popitem(last=False)
+                self._descartadas[descartada] = True
+            while len(self._descartadas) > MAX_VERSIONES_DESCARTADAS:
+                self._descartadas.popitem(last=False)
+        return respuestas
+
+    def _vigente(self, entrada):
+        return time.monotonic() - entrada.creada < self.ttl_s
+
+    def buscar(self, version, pregunta):
+        pregunta = normalizar(pregunta)
+        if not pregunta:
+            return None
+        with self._lock:
+            respuestas = self._versiones.get(version)
+            entrada = respuestas.entradas.get(pregunta) if respuestas is not None else None
+            resultado = "exacta"
+            if entrada is None:
+                candidata, similitud = respuestas.mas_parecida(pregunta) if respuestas is not None else (None, 0.0)
+                if candidata is None or similitud < self.umbral:
+                    metricas.contar('cache_respuestas', resultado='fallo')
+                    return None
+                entrada = respuestas.entradas[candidata]
+                resultado = "similar"
+            if not self._vigente(entrada):
+                respuestas.quitar(entrada.pregunta)
+                metricas.contar('cache_respuestas', resultado='expirada')
+                return None
+            respuestas.entradas.move_to_end(entrada.pregunta)
+        metricas.contar('cache_respuestas', resultado=resultado)
+        return entrada
+
+    def guardar(self, version, pregunta, respuesta, audio=None):
+        pregunta = normalizar(pregunta)
+        if not pregunta or not respuesta or self.max_respuestas <= 0:
+            return
+        with self._lock:
+            respuestas = self._respuestas(version)
+            if respuestas is None:
+                return
+            respuestas.agregar(_Entrada(pregunta, respuesta, audio))
+            while len(respuestas.entradas) > self.max_respuestas:
+                respuestas.quitar(next(iter(respuestas.entradas)))
+            metricas.fijar('cache_respuestas_entradas', sum(len(r.entradas) for r in self._versiones.values()))
+
+
+_cache = None
+_lock_cache = threading.Lock()
+
+
+def obtener_cache_respuestas():
+    global _cache
+    with _lock_cache:
+        if _cache is None:
+            # MIASESOR_CACHE_RESPUESTAS_MAX=0 desactiva la caché.
+            maximo = os.getenv("MIASESOR_CACHE_RESPUESTAS_MAX")
+            _cache = CacheRespuestas(
+                max_respuestas=int(maximo) if maximo else MAX_RESPUESTAS_DEFAULT,
+                ttl_s=float(os.getenv("MIASESOR_CACHE_RESPUESTAS_TTL_S") or TTL_S_DEFAULT),
+            )
+        return _cache
+
+
+# Pares medidos al fijar UMBRAL_SIMILITUD: (preguntas guardadas, consulta,
+# guardada que debe encontrar o None). python cache_respuestas.py los
+# comprueba.
+GUARDADAS_REGRESION = (
+    "que es cetesdirecto",
+    "que son los cetes",
+    "cual es la tasa real de los cetes hoy",
+    "que pronostico hay para la proxima subasta",
+    "como afecta la tasa de banxico a los cetes",
+    "diferencia entre tasa real y nominal",
+    "¿Conviene invertir en CETES ahora?",
+    "¿Cuánto gano si invierto 15 millones a 28 días?",
+    "¿Cuánto gano con 10,000 pesos a 28 días?",
+)
+PARES_REGRESION = (
+    ("cetesdirecto que es", "que es cetesdirecto"),
+    ("cual es la tasa real de cetes hoy", "cual es la tasa real de los cetes hoy"),
+    ("diferencia entre la tasa real y la nominal", "diferencia entre tasa real y nominal"),
+    ("¿Cuánto gano con 10000 pesos a 28 días?", "cuanto gano con 10000 pesos a 28 dias"),
+    ("cual es la tasa nominal de los cetes hoy", None),
+    ("como afecta la tasa de la fed a los cetes", None),
+    ("¿No conviene invertir en CETES ahora?", None),
+    ("¿Cuánto gano si invierto 1,5 millones a 28 días?", None),
+    ("¿Cuánto gano con 20,000 pesos a 28 días?", None),
+)
+
+
+def comprobar_regresiones():
+    # Devuelve la lista de pares que no dieron el resultado esperado.
+    cache = CacheRespuestas()
+    for pregunta in GUARDADAS_REGRESION:
+        cache.guardar("regresion", pregunta, pregunta)
+    fallidos = []
+    for consulta, esperada in PARES_REGRESION:
+        encontrada = cache.buscar("regresion", consulta)
+        obtenida = encontrada.pregunta if encontrada is not None else None
+        if obtenida != esperada:
+            fallidos.append((consulta, esperada, obtenida))
+    return fallidos
+
+
+if __name__ == "__main__":
+    fallidos = comprobar_regresiones()
+    for consulta, esperada, obtenida in fallidos:
+        print(f"{consulta!r}: se esperaba {esperada!r}, se obtuvo {obtenida!r}")
+    print("ok" if not fallidos else f"{len(fallidos)} pares fallidos")
+    raise SystemExit(1 if fallidos else 0)
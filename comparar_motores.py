@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+import refresco
+from pronostico_respaldo import pronosticos_respaldo
+
+# Comparación fuera de muestra de los motores de pronóstico: en cada origen
+# se ajusta con los datos hasta esa semana, se pronostican `horizonte`
+# semanas y se comparan contra lo observado después.
+#
+#   python comparar_motores.py --origenes 6 --procesos 4
+#
+# El motor "respaldo" evalúa solo la cascada de pronostico_respaldo.py.
+
+
+def _origenes(n_datos, horizonte, n_origenes, paso):
+    ultimo = n_datos - horizonte
+    return sorted(ultimo - i * paso for i in range(n_origenes) if ultimo - i * paso > 104)
+
+
+def evaluar_motor(df, motor, origenes, horizonte, procesos, presupuesto_s=None):
+    errores = {serie: [] for serie in refresco.SERIES_CETES}
+    cubiertos = []
+    invertidas = []
+    tiempos = []
+    fallidas = 0
+    usados = {}
+
+    for origen in origenes:
+        entrenamiento = df.iloc[:origen]
+        real = df.iloc[origen:origen + horizonte]
+        inicio = time.perf_counter()
+        if motor == "respaldo":
+            pronosticos, motores = pronosticos_respaldo(entrenamiento, refresco.SERIES_CETES, horizonte)
+            exitosas = list(pronosticos)
+            series_fallidas = [serie for serie in refresco.SERIES_CETES if serie not in pronosticos]
+        else:
+            pronosticos, exitosas, series_fallidas, _, motores, _ = refresco.generar_pronosticos(
+                entrenamiento, semanas_pronostico=horizonte, procesos=procesos, motor=motor, presupuesto_s=presupuesto_s
+            )
+        tiempos.append(time.perf_counter() - inicio)
+        fallidas += len(series_fallidas)
+        for usado in motores.values():
+            usados[usado] = usados.get(usado, 0) + 1
+
+        for serie in exitosas:
+            pronostico = pronosticos[serie]
+            observado = real[serie].to_numpy()
+            errores[serie].append(np.abs(pronostico["pronostico"].to_numpy() - observado))
+            cubiertos.append((observado >= pronostico["limite_inferior"].to_numpy()) &
+                             (observado <= pronostico["limite_superior"].to_numpy()))
+        if 'CETE_28D' in pronosticos and 'CETE_364D' in pronosticos:
+            invertidas.append(pronosticos['CETE_364D']["pronostico"].to_numpy() < pronosticos['CETE_28D']["pronostico"].to_numpy())
+
+    resultado = {
+        "ajuste_s_promedio": round(float(np.mean(tiempos)), 3),
+        "ajuste_s_total": round(float(np.sum(tiempos)), 3),
+        "series_fallidas": fallidas,
+        "motores_usados": usados,
+        "mae": {},
+    }
+    for serie, lista in errores.items():
+        if lista:
+            matriz = np.vstack(lista)
+            resultado["mae"][serie] = {
+                "h1": round(float(matriz[:, 0].mean()), 4),
+                "h4": round(float(matriz[:, min(3, horizonte - 1)].mean()), 4),
+                f"h{horizonte}": round(float(matriz[:, -1].mean()), 4),
+                "promedio": round(float(matriz.mean()), 4),
+            }
+    if cubiertos:
+        resultado["cobertura_95"] = round(float(np.mean(np.concatenate(cubiertos))), 3)
+    if invertidas:
+        resultado["semanas_curva_invertida"] = round(float(np.mean(np.concatenate(invertidas))), 3)
+    return resultado
+
+
+def main(argv=None):
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Compara los motores de pronóstico con una validación por orígenes móviles")
+    parser.add_argument("--motores", default=",".join(refresco.MOTORES_PRONOSTICO + ("respaldo",)), help="Motores separados por coma")
+    parser.add_argument("--origenes", type=int, default=6, help="Número de orígenes de pronóstico")
+    parser.add_argument("--paso", type=int, default=13, help="Semanas entre orígenes")
+    parser.add_argument("--horizonte", type=int, default=refresco.SEMANAS_PRONOSTICO)
+    parser.add_argument("--procesos", type=int, default=1, help="Procesos para los ajustes SARIMAX por plazo")
+    parser.add_argument("--presupuesto", type=float, default=None,
+                        help="Segundos por ajuste SARIMAX antes de usar la cascada de respaldo (0 = sin límite)")
+    parser.add_argument("--panel", help="Panel semanal en CSV; si no se da, se descarga de Banxico")
+    parser.add_argument("--artefactos", help="Usa el panel de la versión vigente de un directorio de artefactos")
+    parser.add_argument("--simulado", action="store_true", help="Usa el SIE simulado de prueba_carga.py")
+    args = parser.parse_args(argv)
+
+    if args.panel:
+        df = pd.read_csv(args.panel, index_col=0, parse_dates=True)
+    elif args.artefactos:
+        import artefactos
+        instantanea = artefactos.cargar_version(args.artefactos)
+        if instantanea is None:
+            print(json.dumps({"error": f"No hay artefactos en {args.artefactos}"}, ensure_ascii=False), file=sys.stderr)
+            return 1
+        df = instantanea.datos
+    else:
+        import banxico_data
+        if args.simulado:
+            import prueba_carga
+            os.environ["BANXICO_API_KEY"] = os.environ.get("BANXICO_API_KEY") or "simulado"
+            banxico_data.requests.get = prueba_carga.SIEFalso(0, 1000)
+        df = banxico_data.obtener_datos_banxico()
+
+    origenes = _origenes(len(df), args.horizonte, args.origenes, args.paso)
+    if not origenes:
+        print(json.dumps({"error": "No hay suficiente historia para los orígenes pedidos"}, ensure_ascii=False), file=sys.stderr)
+        return 1
+
+    resultado = {
+        "semanas_datos": len(df),
+        "origenes": [df.index[o - 1].strftime('%Y-%m-%d') for o in origenes],
+        "horizonte": args.horizonte,
+        "motores": {},
+    }
+    for motor in [m.strip() for m in args.motores.split(",") if m.strip()]:
+        resultado["motores"][motor] = evaluar_motor(df, motor, origenes, args.horizonte, args.procesos, args.presupuesto)
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import hashlib
+import json
+from types import SimpleNamespace
+
+
+class Conversacion:
+    # Historial de una sesión, guardado una sola vez en dos formas que solo
+    # crecen por el final:
+    #   - mensajes: listos para la API de chat; mensajes[0] es el prompt de
+    #     sistema, que se reemplaza en cada turno.
+    #   - vista: lo que muestra gr.Chatbot (formato "messages").
+    # La huella se encadena mensaje a mensaje, así que agregar un mensaje o
+    # calcular la clave de coalescencia no recorre el historial.
+    __slots__ = ("mensajes", "vista", "_huella")
+
+    def __init__(self):
+        self.mensajes = [{"role": "system", "content": ""}]
+        self.vista = []
+        self._huella = b""
+
+    def __len__(self):
+        return len(self.mensajes) - 1
+
+    def _encadenar(self, mensaje):
+        contenido = json.dumps(mensaje, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+        self._huella = hashlib.blake2b(self._huella + contenido, digest_size=16).digest()
+
+    def _agregar(self, mensaje):
+        self.mensajes.append(mensaje)
+        self._encadenar(mensaje)
+
+    def fijar_sistema(self, prompt):
+        if self.mensajes[0]["content"] != prompt:
+            self.mensajes[0] = {"role": "system", "content": prompt}
+
+    def agregar_usuario(self, texto, mostrado=None):
+        self._agregar({"role": "user", "content": texto})
+        self.vista.append({"role": "user", "content": mostrado or texto})
+
+    def agregar_asistente(self, texto, enviar=True):
+        # enviar=False: solo se muestra (avisos y errores que no deben
+        # formar parte del contexto del modelo).
+        if not texto:
+            return
+        if enviar:
+            self._agregar({"role": "assistant", "content": texto})
+        self.vista.append({"role": "assistant", "content": texto})
+
+    def agregar_llamadas(self, llamadas, contenido=None):
+        self._agregar({"role": "assistant", "content": contenido or None, "tool_calls": llamadas})
+
+    def agregar_resultados(self, resultados):
+        for resultado in resultados:
+            self._agregar(resultado)
+
+    def clave(self):
+        prompt = self.mensajes[0]["content"].encode("utf-8")
+        return hashlib.blake2b(self._huella + hashlib.blake2b(prompt, digest_size=16).digest(), digest_size=16).hexdigest()
+
+
+def acumular_llamadas(acumuladas, deltas):
+    # En streaming una llamada a herramienta llega en fragmentos: el primero
+    # trae id y nombre, los siguientes pedazos de los argumentos, todos con el
+    # mismo índice.
+    for delta in deltas:
+        indice = getattr(delta, "index", None)
+        if indice is None:
+            indice = len(acumuladas)
+        llamada = acumuladas.setdefault(indice, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+        if getattr(delta, "id", None):
+            llamada["id"] = delta.id
+        if getattr(delta, "type", None):
+            llamada["type"] = delta.type
+        funcion = getattr(delta, "function", None)
+        if funcion is not None:
+            if getattr(funcion, "name", None):
+                llamada["function"]["name"] += funcion.name
+            if getattr(funcion, "arguments", None):
+                llamada["function"]["arguments"] += funcion.arguments
+    return acumuladas
+
+
+def llamadas_como_objetos(llamadas):
+    # handle_tool_calls espera la forma de los objetos del SDK.
+    return [
+        SimpleNamespace(
+            id=llamada["id"],
+            type=llamada["type"],
+            function=SimpleNamespace(name=llamada["function"]["name"], arguments=llamada["function"]["arguments"])
+        )
+        for llamada in llamadas
+    ]
@@ -0,0 +1,216 @@
+import copy
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from versiones import version_datos
+
+PLAZOS_DIAS = {
+    'CETE_28D': 28,
+    'CETE_91D': 91,
+    'CETE_182D': 182,
+    'CETE_364D': 364,
+}
+
+# Rejilla de lambda (en años) para Nelson-Siegel. Con lambda fijo el modelo
+# es lineal en las betas, así que cada punto de la rejilla se resuelve para
+# todas las semanas con una sola pseudo-inversa.
+LAMBDAS_DEFAULT = np.geomspace(0.1, 3.0, 60)
+PENALIZACION_DEFAULT = 1e-3
+COLUMNAS_PARAMETROS = ['beta0', 'beta1', 'beta2', 'lambda', 'rmse']
+# Curvas por versión del panel, como los motores de analitica.py.
+MAX_CURVAS = 4
+
+
+def cargas_nelson_siegel(plazos_anios, lambdas):
+    # Devuelve las cargas de nivel, pendiente y curvatura con forma
+    # (len(lambdas), len(plazos), 3).
+    tau = np.asarray(plazos_anios, dtype=np.float64)[None, :] / np.asarray(lambdas, dtype=np.float64)[:, None]
+    decaimiento = np.exp(-tau)
+    pendiente = (1.0 - decaimiento) / tau
+    curvatura = pendiente - decaimiento
+    return np.stack([np.ones_like(tau), pendiente, curvatura], axis=-1)
+
+
+def ajustar_nelson_siegel(tasas, plazos_dias, lambdas=LAMBDAS_DEFAULT, penalizacion=PENALIZACION_DEFAULT):
+    # tasas: arreglo (semanas, plazos). Ajuste por mínimos cuadrados de todas
+    # las semanas y todos los lambdas a la vez; para cada semana se conserva
+    # el lambda con menor error penalizado.
+    tasas = np.asarray(tasas, dtype=np.float64)
+    plazos_anios = np.asarray(plazos_dias, dtype=np.float64) / 365.0
+    cargas = cargas_nelson_siegel(plazos_anios, lambdas)
+
+    # Con cuatro plazos cortos las cargas de pendiente y curvatura son casi
+    # colineales; una penalización ridge sobre beta1 y beta2 evita betas
+    # explosivas sin mover el nivel.
+    ridge = np.diag([0.0, penalizacion, penalizacion])
+    normales = np.einsum('lpk,lpj->lkj', cargas, cargas) + ridge[None, :, :]
+    resolvente = np.linalg.solve(normales, np.transpose(cargas, (0, 2, 1)))
+
+    betas = np.einsum('lkp,np->lnk', resolvente, tasas)
+    ajustadas = np.einsum('lpk,lnk->lnp', cargas, betas)
+    sse = ((ajustadas - tasas[None, :, :]) ** 2).sum(axis=-1)
+    objetivo = sse + penalizacion * (betas[:, :, 1:] ** 2).sum(axis=-1)
+
+    mejor = np.argmin(objetivo, axis=0)
+    semanas = np.arange(tasas.shape[0])
+    parametros = np.empty((tasas.shape[0], len(COLUMNAS_PARAMETROS)))
+    parametros[:, :3] = betas[mejor, semanas]
+    parametros[:, 3] = np.asarray(lambdas)[mejor]
+    parametros[:, 4] = np.sqrt(sse[mejor, semanas] / tasas.shape[1])
+    return parametros
+
+
+def tasas_interpoladas(parametros, plazos_dias):
+    # parametros: DataFrame con beta0, beta1, beta2 y lambda (una fila por
+    # semana). Devuelve un DataFrame semanas x plazos con la tasa de la curva.
+    plazos_dias = np.atleast_1d(np.asarray(plazos_dias, dtype=np.float64))
+    tau = (plazos_dias[None, :] / 365.0) / parametros['lambda'].to_numpy()[:, None]
+    decaimiento = np.exp(-tau)
+    pendiente = (1.0 - decaimiento) / tau
+    curvatura = pendiente - decaimiento
+    tasas = (
+        parametros['beta0'].to_numpy()[:, None]
+        + parametros['beta1'].to_numpy()[:, None] * pendiente
+        + parametros['beta2'].to_numpy()[:, None] * curvatura
+    )
+    return pd.DataFrame(tasas, index=parametros.index, columns=[int(p) if float(p).is_integer() else float(p) for p in plazos_dias])
+
+
+class CurvaRendimiento:
+    # Parámetros Nelson-Siegel por semana. Cada semana se ajusta de forma
+    # independiente, así que agregar semanas nuevas solo ajusta las nuevas.
+
+    def __init__(self, lambdas=LAMBDAS_DEFAULT, penalizacion=PENALIZACION_DEFAULT):
+        self.lambdas = np.asarray(lambdas, dtype=np.float64)
+        self.penalizacion = penalizacion
+        self.series = []
+        self.parametros = None
+        self.version = None
+        self._tasas = None
+
+    def _ajustar(self, datos_df):
+        tasas = datos_df[self.series].to_numpy(dtype=np.float64)
+        plazos = [PLAZOS_DIAS[s] for s in self.series]
+        return pd.DataFrame(
+            ajustar_nelson_siegel(tasas, plazos, self.lambdas, self.penalizacion),
+            index=datos_df.index,
+            columns=COLUMNAS_PARAMETROS
+        )
+
+    def calcular(self, datos_df):
+        self.series = [s for s in PLAZOS_DIAS if s in datos_df.columns]
+        if len(self.series) < 3:
+            raise ValueError("Se necesitan al menos tres plazos de CETES para ajustar la curva")
+        datos = datos_df[self.series].dropna()
+        self.parametros = self._ajustar(datos)
+        self._tasas = datos
+        self.version = version_datos(datos_df)
+        return self
+
+    def _es_extension(self, datos):
+        if self.parametros is None or len(datos) < len(self._tasas):
+            return False
+        n = len(self._tasas)
+        previos = datos.iloc[:n]
+        return previos.index.equals(self._tasas.index) and np.array_equal(previos.to_numpy(), self._tasas.to_numpy())
+
+    def extiende(self, datos_df):
+        if not self.series or not all(s in datos_df.columns for s in self.series):
+            return False
+        return self._es_extension(datos_df[self.series].dropna())
+
+    def copia(self):
+        # actualizar reemplaza parametros y _tasas en lugar de modificarlos,
+        # así que basta una copia superficial.
+        return copy.copy(self)
+
+    def actualizar(self, datos_df):
+        version = version_datos(datos_df)
+        if self.parametros is not None and version == self.version:
+            return self
+        if self.series and all(s in datos_df.columns for s in self.series):
+            datos = datos_df[self.series].dropna()
+            if self._es_extension(datos):
+                nuevas = datos.iloc[len(self._tasas):]
+                if len(nuevas) > 0:
+                    self.parametros = pd.concat([self.parametros, self._ajustar(nuevas)])
+                    self._tasas = datos
+                self.version = version
+                return self
+        return self.calcular(datos_df)
+
+    def tasas(self, plazos_dias, fechas=None):
+        parametros = self.parametros if fechas is None else self.parametros.loc[fechas]
+        return tasas_interpoladas(parametros, plazos_dias)
+
+    def resumen(self, plazos_dias=None):
+        if self.parametros is None or len(self.parametros) == 0:
+            return None
+        ultima = self.parametros.iloc[[-1]]
+        fila = ultima.iloc[0]
+        observadas = self._tasas.iloc[-1]
+        diferencial = float(observadas[self.series[-1]] - observadas[self.series[0]])
+        resumen = {
+            "fecha": str(ultima.index[0].date()),
+            "parametros": {
+                "nivel_largo_plazo": round(float(fila['beta0']), 4),
+                "pendiente": round(float(fila['beta1']), 4),
+                "curvatura": round(float(fila['beta2']), 4),
+                "lambda_anios": round(float(fila['lambda']), 4),
+                "error_ajuste": round(float(fila['rmse']), 4),
+            },
+            "tasas_observadas": {s: round(float(observadas[s]), 4) for s in self.series},
+            "diferencial_364_28": round(diferencial, 4),
+            "forma": "invertida" if diferencial < 0 else "normal (ascendente)",
+        }
+        if plazos_dias:
+            interpoladas = tasas_interpoladas(ultima, plazos_dias).iloc[0]
+            plazo_maximo = max(PLAZOS_DIAS[s] for s in self.series)
+            resumen["tasas_interpoladas"] = {
+                f"{plazo}_dias": {
+                    "tasa": round(float(tasa), 4),
+                    "extrapolado": bool(plazo > plazo_maximo or plazo < min(PLAZOS_DIAS[s] for s in self.series))
+                }
+                for plazo, tasa in interpoladas.items()
+            }
+        return resumen
+
+
+_curvas = OrderedDict()
+_lock_curva = threading.Lock()
+
+
+def curva_para(datos_df):
+    # Una curva publicada en _curvas no se vuelve a modificar; una versión
+    # nueva parte de la curva de la que es extensión o se ajusta completa.
+    if datos_df is None or len(datos_df) == 0:
+        return None
+    version = version_datos(datos_df)
+    with _lock_curva:
+        curva = _curvas.get(version)
+        if curva is not None:
+            _curvas.move_to_end(version)
+            return curva
+        candidatas = list(reversed(_curvas.values()))
+
+    base = next((c for c in candidatas if c.extiende(datos_df)), None)
+    curva = base.copia() if base is not None else CurvaRendimiento()
+    curva.actualizar(datos_df)
+
+    with _lock_curva:
+        curva = _curvas.setdefault(version, curva)
+        _curvas.move_to_end(version)
+        while len(_curvas) > MAX_CURVAS:
+            _curvas.popitem(last=False)
+    return curva
+
+
+def resumen_curva(datos_df, plazos_dias=None):
+    curva = curva_para(datos_df)
+    return curva.resumen(plazos_dias) if curva is not None else None
+
+
+def curvas_en_fechas(datos_df, fechas, plazos_dias):
+    curva = curva_para(datos_df)
+    return curva.tasas(plazos_dias, fechas) if curva is not None else None
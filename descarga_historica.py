@@ -0,0 +1,169 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import pandas as pd
+import requests
+import almacen
+import metricas
+from banxico_data import solicitar_datos_serie, datos_a_dataframe
+
+# Descarga por tramos anuales para rangos largos. Cada (serie, año) es una
+# solicitud independiente al SIE: se descargan en paralelo con un límite de
+# hilos, se reintentan por separado y los años ya cerrados se guardan en
+# disco, así que un segundo intento solo pide los tramos que faltaron y un
+# refresco semanal solo pide el año en curso y los más recientes ya
+# cerrados. Banxico revisa datos publicados (el INPC, por ejemplo): los
+# últimos tramos cerrados se vuelven a pedir en cada refresco y los demás
+# cuando su copia en disco vence.
+PARALELISMO_DEFAULT = 4
+REINTENTOS_DEFAULT = 3
+ESPERA_REINTENTO_S = 1.0
+TIMEOUT_TRAMO_S = 30
+# Un tramo que termina hace menos de esto puede seguir recibiendo datos o
+# revisiones y no se guarda.
+DIAS_TRAMO_ABIERTO = 30
+# Tramos cerrados más recientes que se vuelven a pedir en cada refresco.
+TRAMOS_REVISABLES_DEFAULT = 2
+TTL_TRAMO_DIAS_DEFAULT = 30
+
+
+class DescargaIncompleta(ValueError):
+    def __init__(self, fallidos):
+        self.fallidos = fallidos
+        detalle = ", ".join(f"{serie} {inicio}/{fin}" for serie, inicio, fin in fallidos[:5])
+        if len(fallidos) > 5:
+            detalle += f" y {len(fallidos) - 5} más"
+        super().__init__(f"No se pudieron descargar {len(fallidos)} tramos del SIE ({detalle}). Vuelve a intentarlo: solo se pedirán los tramos faltantes.")
+
+
+def directorio_tramos():
+    return os.path.join(almacen.directorio_cache(), "sie")
+
+
+def paralelismo_default():
+    return int(os.getenv("MIASESOR_DESCARGA_PARALELISMO") or PARALELISMO_DEFAULT)
+
+
+def tramos_revisables_default():
+    return int(os.getenv("MIASESOR_DESCARGA_TRAMOS_REVISABLES") or TRAMOS_REVISABLES_DEFAULT)
+
+
+def ttl_tramo_dias_default():
+    return float(os.getenv("MIASESOR_DESCARGA_TTL_DIAS") or TTL_TRAMO_DIAS_DEFAULT)
+
+
+def tramos_anuales(fechainicio, fechafin):
+    inicio = datetime.strptime(fechainicio, '%Y-%m-%d').date()
+    fin = datetime.strptime(fechafin, '%Y-%m-%d').date()
+    tramos = []
+    while inicio <= fin:
+        cierre = min(date(inicio.year, 12, 31), fin)
+        tramos.append((inicio.isoformat(), cierre.isoformat()))
+        inicio = cierre + timedelta(days=1)
+    return tramos
+
+
+def _ruta_tramo(directorio, serie, inicio, fin):
+    return os.path.join(directorio, serie, f"{inicio}_{fin}.json")
+
+
+def _tramo_cerrado(fin, hoy):
+    return datetime.strptime(fin, '%Y-%m-%d').date() < hoy - timedelta(days=DIAS_TRAMO_ABIERTO)
+
+
+def _tramo_vigente(ruta, ttl_s, ahora):
+    try:
+        return ahora - os.path.getmtime(ruta) < ttl_s
+    except OSError:
+        return False
+
+
+def _leer_tramo(ruta):
+    try:
+        with open(ruta, "r", encoding="utf-8") as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        return None
+
+
+def _descargar_tramo(serie, inicio, fin, headers, reintentos):
+    for intento in range(reintentos):
+        try:
+            datos = solicitar_datos_serie(serie, inicio, fin, headers, timeout=TIMEOUT_TRAMO_S)
+        except requests.exceptions.RequestException:
+            metricas.contar('sie_respuestas', serie=serie, resultado='excepcion')
+            datos = None
+        if datos is not None:
+            return datos
+        if intento < reintentos - 1:
+            time.sleep(ESPERA_REINTENTO_S * 2 ** intento)
+    return None
+
+
+def descargar_historico(series_dict, fechainicio, fechafin, token, paralelismo=None,
+                        directorio=None, reintentos=REINTENTOS_DEFAULT, revisables=None, ttl_dias=None):
+    # Devuelve (DataFrame con una columna por serie, tramos fallidos).
+    headers = {'Bmx-Token': token} if token else {}
+    directorio = directorio or directorio_tramos()
+    hoy = date.today()
+    ahora = time.time()
+    revisables = tramos_revisables_default() if revisables is None else revisables
+    ttl_s = (ttl_tramo_dias_default() if ttl_dias is None else ttl_dias) * 86400
+
+    tramos = tramos_anuales(fechainicio, fechafin)
+    cerrados = [tramo for tramo in tramos if _tramo_cerrado(tramo[1], hoy)]
+    por_revisar = set(cerrados[-revisables:]) if revisables > 0 else set()
+    datos_por_tramo = {}
+    # Copias en disco de los tramos que se vuelven a pedir: si la descarga
+    # falla se usan en lugar de dar el tramo por perdido.
+    respaldos = {}
+    pendientes = []
+    for serie in series_dict:
+        for inicio, fin in tramos:
+            ruta = _ruta_tramo(directorio, serie, inicio, fin)
+            guardado = _leer_tramo(ruta) if _tramo_cerrado(fin, hoy) else None
+            if guardado is not None and (inicio, fin) not in por_revisar and _tramo_vigente(ruta, ttl_s, ahora):
+                datos_por_tramo[(serie, inicio, fin)] = guardado
+            else:
+                if guardado is not None:
+                    respaldos[(serie, inicio, fin)] = guardado
+                pendientes.append((serie, inicio, fin))
+    metricas.contar('sie_tramos', len(datos_por_tramo), origen='disco')
+
+    def descargar(tramo):
+        serie, inicio, fin = tramo
+        datos = _descargar_tramo(serie, inicio, fin, headers, reintentos)
+        if datos is not None and _tramo_cerrado(fin, hoy):
+            try:
+                almacen.escribir_json_atomico(_ruta_tramo(directorio, serie, inicio, fin), datos)
+            except OSError:
+                pass
+        return datos
+
+    fallidos = []
+    vencidos = 0
+    if pendientes:
+        with ThreadPoolExecutor(max_workers=max(1, paralelismo or paralelismo_default())) as ejecutor:
+            for tramo, datos in zip(pendientes, ejecutor.map(descargar, pendientes)):
+                if datos is not None:
+                    datos_por_tramo[tramo] = datos
+                elif tramo in respaldos:
+                    datos_por_tramo[tramo] = respaldos[tramo]
+                    vencidos += 1
+                else:
+                    fallidos.append(tramo)
+    metricas.contar('sie_tramos', len(pendientes) - len(fallidos) - vencidos, origen='sie')
+    metricas.contar('sie_tramos', vencidos, origen='disco_vencido')
+    metricas.contar('sie_tramos', len(fallidos), origen='fallido')
+
+    columnas = []
+    for serie, nombre in series_dict.items():
+        datos = [dato for inicio, fin in tramos for dato in datos_por_tramo.get((serie, inicio, fin)) or []]
+        if datos:
+            df = datos_a_dataframe(datos, nombre, serie)
+            columnas.append(df[~df.index.duplicated(keep='last')])
+
+    df = pd.concat(columnas, axis=1, join='outer') if columnas else None
+    return df, fallidos
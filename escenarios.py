@@ -0,0 +1,308 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import almacen
+import metricas
+from versiones import version_datos
+
+# Escenarios sobre las variables exógenas ("¿y si Banxico recorta 50 pb?")
+# evaluados con los modelos que ya se ajustaron en el refresco, sin volver a
+# estimar nada:
+#   - SARIMAX es una regresión con errores SARIMA: la media pronosticada es
+#     exógenas · beta más el pronóstico de los errores, así que cambiar la
+#     trayectoria de las exógenas solo suma cambio · beta al pronóstico
+#     base. El ancho del intervalo no depende de las exógenas.
+#   - El VAR conjunto se vuelve a iterar fijando cada semana las variables
+#     del escenario en su trayectoria; las demás siguen la dinámica del
+#     modelo. El intervalo se traslada con la media.
+#   - Los modelos de respaldo no usan exógenas: el escenario no los mueve.
+# Un escenario se reduce a cambios acumulados por semana respecto al último
+# valor observado; su huella junto con la versión de los pronósticos es la
+# llave de la caché.
+VARIABLES_ESCENARIO = {
+    "tasa_objetivo_pb": ("Tasa_Objetivo", "pb"),
+    "tasa_fed_pb": ("Tasa_FED", "pb"),
+    "tipo_cambio_pct": ("Tipo_Cambio_Fix", "pct"),
+    "inpc_pct": ("INPC", "pct"),
+}
+LIMITES_CAMBIO = {"pb": (-2000.0, 2000.0), "pct": (-90.0, 500.0)}
+MAX_ESCENARIOS_LOTE = 8
+MAX_ESCENARIOS_CACHE_DEFAULT = 512
+
+
+def sensibilidad_sarimax(modelo, exog_vars, base):
+    # Coeficientes de las exógenas y el valor con el que se pronosticó (el
+    # último observado, repetido en todo el horizonte).
+    if modelo is None or not exog_vars:
+        return None
+    parametros = modelo.params
+    coeficientes = {var: float(parametros[var]) for var in exog_vars if var in parametros.index}
+    if not coeficientes:
+        return None
+    return {
+        "motor": "sarimax",
+        "coeficientes": coeficientes,
+        "base": {var: float(base[var]) for var in coeficientes},
+    }
+
+
+def sensibilidad_conjunta(modelo, variables):
+    from modelo_conjunto import EXOGENAS_LOG
+
+    if modelo is None:
+        return None
+    return {
+        "motor": "conjunto",
+        "variables": list(variables),
+        "log": [var for var in variables if var in EXOGENAS_LOG],
+        "intercepto": np.asarray(modelo.intercept, dtype=float).tolist(),
+        "coeficientes": np.asarray(modelo.coefs, dtype=float).tolist(),
+        "historia": np.asarray(modelo.endog[-modelo.k_ar:], dtype=float).tolist(),
+    }
+
+
+def trayectoria(valor, semanas):
+    # Un número aplica desde la primera semana; una lista da el cambio
+    # acumulado semana por semana y su último valor se mantiene.
+    valores = [valor] if isinstance(valor, (int, float)) else list(valor or [])
+    if not valores:
+        return None
+    arreglo = np.asarray(valores[:semanas], dtype=float)
+    return np.concatenate([arreglo, np.repeat(arreglo[-1:], semanas - len(arreglo))])
+
+
+def normalizar_escenario(escenario, semanas):
+    # Devuelve ({parámetro: cambios por semana}, error).
+    cambios = {}
+    for parametro, valor in escenario.items():
+        if parametro not in VARIABLES_ESCENARIO or valor is None:
+            continue
+        try:
+            ruta = trayectoria(valor, semanas)
+        except (TypeError, ValueError):
+            return None, f"{parametro} debe ser un número o una lista de números"
+        if ruta is None:
+            continue
+        minimo, maximo = LIMITES_CAMBIO[VARIABLES_ESCENARIO[parametro][1]]
+        if not np.isfinite(ruta).all() or ruta.min() < minimo or ruta.max() > maximo:
+            return None, f"{parametro} fuera de rango ({minimo:g} a {maximo:g})"
+        cambios[parametro] = ruta
+    if not cambios:
+        return None, f"El escenario no cambia ninguna variable ({', '.join(VARIABLES_ESCENARIO)})"
+    return cambios, None
+
+
+def clave_escenario(cambios):
+    h = hashlib.blake2b(digest_size=8)
+    for parametro in sorted(cambios):
+        h.update(parametro.encode("utf-8"))
+        # + 0.0 convierte -0.0 en 0.0.
+        h.update((np.round(cambios[parametro], 6) + 0.0).tobytes())
+    return h.hexdigest()
+
+
+def _cambio_en_nivel(cambios, unidad, nivel):
+    # pb -> puntos porcentuales de la tasa; pct -> proporción del nivel.
+    return cambios / 100 if unidad == "pb" else nivel * cambios / 100
+
+
+def _efecto_sarimax(sensibilidad, lote, semanas):
+    # Devuelve (escenarios, semanas): lo que cada escenario suma al
+    # pronóstico base.
+    efecto = np.zeros((len(lote), semanas))
+    for parametro, (variable, unidad) in VARIABLES_ESCENARIO.items():
+        beta = sensibilidad["coeficientes"].get(variable)
+        if beta is None:
+            continue
+        cambios = np.array([escenario.get(parametro, np.zeros(semanas)) for escenario in lote])
+        efecto += beta * _cambio_en_nivel(cambios, unidad, sensibilidad["base"][variable])
+    return efecto
+
+
+def _medias_conjunto(sensibilidad, lote, semanas):
+    # Recursión del VAR para todos los escenarios a la vez. Devuelve
+    # (escenarios, semanas, variables) en las unidades del sistema.
+    variables = sensibilidad["variables"]
+    intercepto = np.asarray(sensibilidad["intercepto"])
+    coeficientes = np.asarray(sensibilidad["coeficientes"])
+    historia = np.asarray(sensibilidad["historia"])
+    rezagos = len(historia)
+
+    fijos = np.zeros((len(lote), semanas, len(variables)), dtype=bool)
+    valores = np.zeros(fijos.shape)
+    for parametro, (variable, unidad) in VARIABLES_ESCENARIO.items():
+        if variable not in variables:
+            continue
+        j = variables.index(variable)
+        en_log = variable in sensibilidad["log"]
+        nivel = np.exp(historia[-1, j]) if en_log else historia[-1, j]
+        for s, escenario in enumerate(lote):
+            if parametro not in escenario:
+                continue
+            nuevo = nivel + _cambio_en_nivel(escenario[parametro], unidad, nivel)
+            fijos[s, :, j] = True
+            with np.errstate(invalid='ignore', divide='ignore'):
+                valores[s, :, j] = np.log(nuevo) if en_log else nuevo
+
+    estado = np.repeat(historia[None], len(lote), axis=0)
+    medias = np.empty(fijos.shape)
+    for h in range(semanas):
+        siguiente = intercepto + sum(estado[:, -1 - i] @ coeficientes[i].T for i in range(rezagos))
+        siguiente = np.where(fijos[:, h], valores[:, h], siguiente)
+        medias[:, h] = siguiente
+        estado = np.concatenate([estado[:, 1:], siguiente[:, None]], axis=1)
+    return medias
+
+
+def pronosticar_escenarios(pronosticos, sensibilidades, lote):
+    # lote: lista de escenarios normalizados. Devuelve una lista de
+    # {serie: DataFrame} con el pronóstico condicional de cada escenario.
+    sensibilidades = sensibilidades or {}
+    efectos = {}
+    conjuntos = {}
+    for serie, df_pronostico in pronosticos.items():
+        semanas = len(df_pronostico)
+        sensibilidad = sensibilidades.get(serie)
+        if sensibilidad is None:
+            efectos[serie] = np.zeros((len(lote), semanas))
+        elif sensibilidad["motor"] == "conjunto":
+            # Un solo VAR para todos los plazos: se itera una vez por lote.
+            clave = id(sensibilidad)
+            if clave not in conjuntos:
+                medias = _medias_conjunto(sensibilidad, [{}] + lote, semanas)
+                conjuntos[clave] = medias[1:] - medias[:1]
+            efectos[serie] = conjuntos[clave][:, :, sensibilidad["variables"].index(serie)]
+        else:
+            efectos[serie] = _efecto_sarimax(sensibilidad, lote, semanas)
+
+    return [
+        {serie: df_pronostico.add(efectos[serie][s], axis=0) for serie, df_pronostico in pronosticos.items()}
+        for s in range(len(lote))
+    ]
+
+
+class CacheEscenarios:
+    def __init__(self, max_escenarios=MAX_ESCENARIOS_CACHE_DEFAULT):
+        self.max_escenarios = max_escenarios
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def evaluar(self, version, pronosticos, sensibilidades, lote):
+        # lote: lista de (clave, escenario normalizado). Los que no están en
+        # la caché se calculan juntos en una sola pasada.
+        resultados = {}
+        faltantes = {}
+        with self._lock:
+            for clave, escenario in lote:
+                llave = (version, clave)
+                if llave in self._entradas:
+                    self._entradas.move_to_end(llave)
+                    resultados[clave] = self._entradas[llave]
+                else:
+                    faltantes[clave] = escenario
+        if len(faltantes) < len(lote):
+            metricas.contar('escenarios', len(lote) - len(faltantes), resultado='acierto')
+
+        if faltantes:
+            metricas.contar('escenarios', len(faltantes), resultado='calculado')
+            with metricas.cronometro('escenarios_lote'):
+                calculados = pronosticar_escenarios(pronosticos, sensibilidades, list(faltantes.values()))
+            with self._lock:
+                for clave, condicional in zip(faltantes, calculados):
+                    resultados[clave] = condicional
+                    if self.max_escenarios > 0:
+                        self._entradas[(version, clave)] = condicional
+                while len(self._entradas) > self.max_escenarios:
+                    self._entradas.popitem(last=False)
+        return [resultados[clave] for clave, _ in lote]
+
+
+_cache = None
+_lock_cache = threading.Lock()
+
+
+def obtener_cache_escenarios():
+    global _cache
+    with _lock_cache:
+        if _cache is None:
+            maximo = os.getenv("MIASESOR_ESCENARIOS_CACHE_MAX")
+            _cache = CacheEscenarios(int(maximo) if maximo else MAX_ESCENARIOS_CACHE_DEFAULT)
+        return _cache
+
+
+def instantanea_de(pronosticos_df):
+    # Los modelos viven en la instantánea vigente; la sesión solo tiene los
+    # DataFrames de pronóstico.
+    instantanea = almacen.actual()
+    if instantanea is None or pronosticos_df is None:
+        return None
+    if instantanea.pronosticos is pronosticos_df or instantanea.version_pronosticos == version_datos(pronosticos_df):
+        return instantanea
+    return None
+
+
+def _redondear(valor, decimales=3):
+    return round(float(valor), decimales) if np.isfinite(valor) else None
+
+
+def resumen_escenarios(instantanea, escenarios):
+    if instantanea is None or not instantanea.pronosticos:
+        return {"error": "No hay pronósticos cargados. Pide al usuario que actualice los datos."}
+    if not instantanea.sensibilidades:
+        return {"error": "Los modelos de esta versión de los pronósticos no permiten simular escenarios. Pide al usuario que actualice los datos."}
+    if not escenarios:
+        return {"error": "Indica al menos un escenario."}
+    if len(escenarios) > MAX_ESCENARIOS_LOTE:
+        return {"error": f"Se pueden simular hasta {MAX_ESCENARIOS_LOTE} escenarios a la vez."}
+
+    pronosticos = instantanea.pronosticos
+    semanas = max(len(df_pronostico) for df_pronostico in pronosticos.values())
+    lote = []
+    for i, escenario in enumerate(escenarios):
+        if not isinstance(escenario, dict):
+            return {"error": "Cada escenario debe ser un objeto con los cambios de las variables."}
+        nombre = str(escenario.get("nombre") or f"Escenario {i + 1}")
+        cambios, error = normalizar_escenario(escenario, semanas)
+        if error:
+            return {"error": f"{nombre}: {error}"}
+        lote.append((nombre, clave_escenario(cambios), cambios))
+
+    condicionales = obtener_cache_escenarios().evaluar(
+        instantanea.version_pronosticos, pronosticos, instantanea.sensibilidades,
+        [(clave, cambios) for _, clave, cambios in lote]
+    )
+
+    resultado = []
+    for (nombre, clave, cambios), condicional in zip(lote, condicionales):
+        plazos = {}
+        for serie, base in pronosticos.items():
+            escenario = condicional[serie]
+            semana_4 = min(4, len(base)) - 1
+            plazos[serie] = {
+                "motor": instantanea.motores.get(serie),
+                "usa_exogenas": serie in instantanea.sensibilidades,
+                "fecha_final": base.index[-1].strftime('%Y-%m-%d'),
+                "base_final": _redondear(base["pronostico"].iloc[-1]),
+                "escenario_semana_4": _redondear(escenario["pronostico"].iloc[semana_4]),
+                "escenario_final": _redondear(escenario["pronostico"].iloc[-1]),
+                "diferencia_pb_final": _redondear((escenario["pronostico"].iloc[-1] - base["pronostico"].iloc[-1]) * 100, 1),
+                "intervalo_95_final": [
+                    _redondear(escenario["limite_inferior"].iloc[-1]),
+                    _redondear(escenario["limite_superior"].iloc[-1]),
+                ],
+            }
+        resultado.append({
+            "nombre": nombre,
+            "clave": clave,
+            "supuestos_final": {parametro: _redondear(ruta[-1], 2) for parametro, ruta in cambios.items()},
+            "plazos": plazos,
+        })
+    return {
+        "version": instantanea.version,
+        "horizonte_semanas": semanas,
+        "escenarios": resultado,
+        "nota": "Pronósticos condicionales de los modelos ajustados en la última actualización. "
+                "Las variables indicadas quedan fijas en su trayectoria; las no indicadas siguen el pronóstico base.",
+    }
@@ -0,0 +1,383 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from versiones import version_datos
+from analitica import estadisticas_moviles
+from curva_rendimiento import PLAZOS_DIAS, curvas_en_fechas
+from series_derivadas import serie_derivada
+
+SERIES_CETES = ['CETE_28D', 'CETE_91D', 'CETE_182D', 'CETE_364D']
+
+TIPOS_GRAFICA = ["Histórica y Pronósticos", "Comparativa de Plazos", "Análisis de Tendencia", "Curva de Rendimiento", "Tasas Reales y Diferenciales"]
+# Gráficas que no dependen del plazo seleccionado.
+TIPOS_SIN_PLAZO = ("Comparativa de Plazos", "Curva de Rendimiento", "Tasas Reales y Diferenciales")
+TIPO_CON_RECOMENDACION = "Histórica y Pronósticos"
+
+ETIQUETAS_CETES = {
+    'CETE_28D': 'CETES a 28 Días',
+    'CETE_91D': 'CETES a 91 Días',
+    'CETE_182D': 'CETES a 182 Días',
+    'CETE_364D': 'CETES a 364 Días'
+}
+
+COLORES_CETES = {
+    'CETE_28D': '#2E86AB',
+    'CETE_91D': '#F18F01',
+    'CETE_182D': '#C73E1D',
+    'CETE_364D': '#A23B72'
+}
+
+# El área de trazado de gr.Plot ronda los 600-800 px de ancho: más puntos
+# que pixeles no se distinguen y solo inflan el JSON enviado al navegador.
+PUNTOS_OBJETIVO = 700
+# A partir de este número de puntos por traza se usa WebGL (Scattergl).
+UMBRAL_WEBGL = 500
+VENTANA_TENDENCIA = 12
+# Semanas atrás contra las que se compara la curva más reciente.
+REZAGOS_CURVA = {0: '#2E86AB', 13: '#F18F01', 52: '#A23B72'}
+MAX_FIGURAS_CACHE = 128
+
+_cache_figuras = OrderedDict()
+_lock_cache = threading.Lock()
+
+
+def indices_lttb(x, y, puntos):
+    # Largest-Triangle-Three-Buckets: conserva la forma visual de la serie
+    # (picos y valles) con un número fijo de puntos.
+    n = len(y)
+    if puntos >= n or puntos < 3:
+        return np.arange(n)
+
+    indices = np.empty(puntos, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    limites = np.linspace(1, n - 1, puntos - 1).astype(np.int64)
+
+    a = 0
+    for i in range(puntos - 2):
+        ini, fin = limites[i], limites[i + 1]
+        if i + 2 < len(limites):
+            sig_ini, sig_fin = limites[i + 1], limites[i + 2]
+            prom_x = x[sig_ini:sig_fin].mean()
+            prom_y = y[sig_ini:sig_fin].mean()
+        else:
+            prom_x, prom_y = x[n - 1], y[n - 1]
+
+        area = np.abs(
+            (x[a] - prom_x) * (y[ini:fin] - y[a]) - (x[a] - x[ini:fin]) * (prom_y - y[a])
+        )
+        a = ini + int(np.argmax(area))
+        indices[i + 1] = a
+
+    return indices
+
+
+def reducir_serie(serie, puntos=PUNTOS_OBJETIVO):
+    serie = serie.dropna()
+    if len(serie) <= puntos:
+        return serie
+
+    x = serie.index.asi8.astype(np.float64) if isinstance(serie.index, pd.DatetimeIndex) else np.arange(len(serie), dtype=np.float64)
+    y = serie.to_numpy(dtype=np.float64)
+    return serie.iloc[indices_lttb(x, y, puntos)]
+
+
+def _traza(serie, marcadores=None, **kwargs):
+    import plotly.graph_objects as go
+
+    reducida = reducir_serie(serie)
+    larga = len(reducida) > UMBRAL_WEBGL
+    if marcadores is not None and len(reducida) == len(serie.dropna()) and not larga:
+        kwargs['mode'] = 'lines+markers'
+        kwargs['marker'] = marcadores
+    else:
+        kwargs['mode'] = 'lines'
+
+    clase = go.Scattergl if larga else go.Scatter
+    return clase(x=reducida.index, y=reducida.to_numpy(), **kwargs)
+
+
+def _resolver_serie(datos_df, tipo_cetes):
+    if tipo_cetes in datos_df.columns:
+        return tipo_cetes
+    for serie in SERIES_CETES:
+        if serie in datos_df.columns:
+            return serie
+    return None
+
+
+def _pronostico_de(pronosticos_df, tipo_cetes):
+    if pronosticos_df is None:
+        return None
+    if isinstance(pronosticos_df, dict):
+        return pronosticos_df.get(tipo_cetes)
+    if hasattr(pronosticos_df, 'columns') and 'pronostico' in pronosticos_df.columns:
+        return pronosticos_df
+    return None
+
+
+def _grafica_historica(datos_df, pronosticos_df, tipo_cetes):
+    import plotly.graph_objects as go
+
+    etiqueta = ETIQUETAS_CETES.get(tipo_cetes, tipo_cetes)
+    fig = go.Figure()
+
+    fig.add_trace(_traza(
+        datos_df[tipo_cetes],
+        marcadores=dict(size=4),
+        name=f'Datos Históricos ({etiqueta})',
+        line=dict(color=COLORES_CETES.get(tipo_cetes, '#2E86AB'), width=2)
+    ))
+
+    pronostico_actual = _pronostico_de(pronosticos_df, tipo_cetes)
+    if (pronostico_actual is not None and len(pronostico_actual) > 0 and
+        'pronostico' in pronostico_actual.columns):
+        fig.add_trace(go.Scatter(
+            x=pronostico_actual.index,
+            y=pronostico_actual['pronostico'],
+            mode='lines+markers',
+            name='Pronóstico',
+            line=dict(color='#A23B72', width=2.5, dash='dash'),
+            marker=dict(size=5, symbol='square')
+        ))
+
+        if 'limite_inferior' in pronostico_actual.columns and 'limite_superior' in pronostico_actual.columns:
+            fig.add_trace(go.Scatter(
+                x=pronostico_actual.index.tolist() + pronostico_actual.index.tolist()[::-1],
+                y=pronostico_actual['limite_superior'].tolist() + pronostico_actual['limite_inferior'].tolist()[::-1],
+                fill='toself',
+                fillcolor='rgba(162, 59, 114, 0.2)',
+                line=dict(color='rgba(255,255,255,0)'),
+                name='Intervalo de Confianza (95%)',
+                showlegend=True
+            ))
+
+    fig.update_layout(
+        title=f'{etiqueta} - Datos Históricos y Pronósticos',
+        xaxis_title='Fecha',
+        yaxis_title='Tasa de Interés (%)',
+        hovermode='x unified',
+        template='plotly_white',
+        height=600,
+        legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01)
+    )
+    return fig
+
+
+def _grafica_comparativa(datos_df):
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    for serie in SERIES_CETES:
+        if serie in datos_df.columns:
+            fig.add_trace(_traza(
+                datos_df[serie],
+                name=ETIQUETAS_CETES.get(serie, serie),
+                line=dict(color=COLORES_CETES.get(serie, '#000000'), width=2)
+            ))
+
+    fig.update_layout(
+        title='Comparativa de CETES por Plazo',
+        xaxis_title='Fecha',
+        yaxis_title='Tasa de Interés (%)',
+        hovermode='x unified',
+        template='plotly_white',
+        height=600,
+        legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01)
+    )
+    return fig
+
+
+def _grafica_tendencia(datos_df, tipo_cetes):
+    from plotly.subplots import make_subplots
+
+    etiqueta = ETIQUETAS_CETES.get(tipo_cetes, tipo_cetes)
+    fig = make_subplots(
+        rows=2, cols=1,
+        subplot_titles=('Tendencia con Media Móvil', 'Análisis de Volatilidad'),
+        vertical_spacing=0.1,
+        row_heights=[0.6, 0.4]
+    )
+
+    serie = datos_df[tipo_cetes]
+    fig.add_trace(_traza(
+        serie,
+        name=f'Tasa Semanal ({etiqueta})',
+        line=dict(color='#2E86AB', width=1.5),
+        opacity=0.6
+    ), row=1, col=1)
+
+    estadisticas = estadisticas_moviles(datos_df, tipo_cetes, VENTANA_TENDENCIA)
+    if estadisticas is not None and len(serie) >= VENTANA_TENDENCIA:
+        fig.add_trace(_traza(
+            estadisticas['media'],
+            name=f'Media Móvil ({VENTANA_TENDENCIA} semanas)',
+            line=dict(color='#A23B72', width=2.5)
+        ), row=1, col=1)
+
+        fig.add_trace(_traza(
+            estadisticas['desviacion'],
+            name=f'Volatilidad ({VENTANA_TENDENCIA} semanas)',
+            line=dict(color='#F18F01', width=2),
+            fill='tozeroy',
+            fillcolor='rgba(241, 143, 1, 0.3)'
+        ), row=2, col=1)
+
+    fig.update_xaxes(title_text="Fecha", row=2, col=1)
+    fig.update_yaxes(title_text="Tasa de Interés (%)", row=1, col=1)
+    fig.update_yaxes(title_text="Desviación Estándar (%)", row=2, col=1)
+
+    fig.update_layout(
+        title=f'Análisis de Tendencia - {etiqueta}',
+        hovermode='x unified',
+        template='plotly_white',
+        height=800,
+        legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01)
+    )
+    return fig
+
+
+def _grafica_curva(datos_df):
+    import plotly.graph_objects as go
+
+    series = [s for s in PLAZOS_DIAS if s in datos_df.columns]
+    datos = datos_df[series].dropna()
+    if len(series) < 3 or len(datos) == 0:
+        return None
+
+    plazos = np.arange(7, 366, 7)
+    fechas = [datos.index[-1 - rezago] for rezago in REZAGOS_CURVA if rezago < len(datos)]
+    curvas = curvas_en_fechas(datos_df, fechas, plazos)
+
+    fig = go.Figure()
+    for (rezago, color), fecha in zip(REZAGOS_CURVA.items(), fechas):
+        nombre = 'Última semana' if rezago == 0 else f'Hace {rezago} semanas'
+        fig.add_trace(go.Scatter(
+            x=plazos,
+            y=curvas.loc[fecha].to_numpy(),
+            mode='lines',
+            name=f'{nombre} ({fecha.date()})',
+            line=dict(color=color, width=2.5 if rezago == 0 else 1.5, dash=None if rezago == 0 else 'dot')
+        ))
+
+    fig.add_trace(go.Scatter(
+        x=[PLAZOS_DIAS[s] for s in series],
+        y=datos.iloc[-1].to_numpy(),
+        mode='markers',
+        name='Tasas observadas (última subasta)',
+        marker=dict(color='#2E86AB', size=9, symbol='circle-open', line=dict(width=2))
+    ))
+
+    fig.update_layout(
+        title='Curva de Rendimiento de CETES (Nelson-Siegel)',
+        xaxis_title='Plazo (días)',
+        yaxis_title='Tasa de Interés (%)',
+        hovermode='x unified',
+        template='plotly_white',
+        height=600,
+        legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01)
+    )
+    return fig
+
+
+def _grafica_tasas_reales(datos_df):
+    from plotly.subplots import make_subplots
+
+    fig = make_subplots(
+        rows=2, cols=1,
+        subplot_titles=('Tasas Reales e Inflación', 'Diferenciales'),
+        vertical_spacing=0.1,
+        row_heights=[0.6, 0.4]
+    )
+
+    inflacion = serie_derivada(datos_df, 'Inflacion_Anual')
+    if inflacion is not None:
+        fig.add_trace(_traza(
+            inflacion,
+            name='Inflación Anual',
+            line=dict(color='#555555', width=2, dash='dot')
+        ), row=1, col=1)
+
+    for serie in SERIES_CETES:
+        tasa_real = serie_derivada(datos_df, f"Tasa_Real_{serie.replace('CETE_', '')}")
+        if tasa_real is not None:
+            fig.add_trace(_traza(
+                tasa_real,
+                name=f'Tasa Real {ETIQUETAS_CETES.get(serie, serie)}',
+                line=dict(color=COLORES_CETES.get(serie, '#000000'), width=1.5)
+            ), row=1, col=1)
+
+    diferenciales = {
+        'Diferencial_364_28': ('364 - 28 días', '#A23B72'),
+        'Diferencial_28D_Objetivo': ('28 días - Tasa Objetivo', '#2E86AB'),
+        'Diferencial_Objetivo_FED': ('Tasa Objetivo - Tasa FED', '#F18F01'),
+    }
+    for nombre, (etiqueta, color) in diferenciales.items():
+        diferencial = serie_derivada(datos_df, nombre)
+        if diferencial is not None:
+            fig.add_trace(_traza(
+                diferencial,
+                name=etiqueta,
+                line=dict(color=color, width=1.5)
+            ), row=2, col=1)
+
+    fig.update_xaxes(title_text="Fecha", row=2, col=1)
+    fig.update_yaxes(title_text="Tasa (%)", row=1, col=1)
+    fig.update_yaxes(title_text="Puntos Porcentuales", row=2, col=1)
+
+    fig.update_layout(
+        title='Tasas Reales y Diferenciales',
+        hovermode='x unified',
+        template='plotly_white',
+        height=800,
+        legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01)
+    )
+    return fig
+
+
+def _clave_figura(datos_df, pronosticos_df, tipo, tipo_cetes):
+    if tipo in TIPOS_SIN_PLAZO:
+        return (version_datos(datos_df), None, tipo, None)
+    if tipo == "Histórica y Pronósticos":
+        return (version_datos(datos_df), version_datos(pronosticos_df), tipo, tipo_cetes)
+    return (version_datos(datos_df), None, tipo, tipo_cetes)
+
+
+def generar_grafica(datos_df, pronosticos_df, tipo, tipo_cetes):
+    if datos_df is None:
+        return None
+    try:
+        tipo_cetes = _resolver_serie(datos_df, tipo_cetes)
+        if tipo_cetes is None:
+            return None
+
+        clave = _clave_figura(datos_df, pronosticos_df, tipo, tipo_cetes)
+        with _lock_cache:
+            fig = _cache_figuras.get(clave)
+            if fig is not None:
+                _cache_figuras.move_to_end(clave)
+                return fig
+
+        if tipo == "Histórica y Pronósticos":
+            fig = _grafica_historica(datos_df, pronosticos_df, tipo_cetes)
+        elif tipo == "Comparativa de Plazos":
+            fig = _grafica_comparativa(datos_df)
+        elif tipo == "Análisis de Tendencia":
+            fig = _grafica_tendencia(datos_df, tipo_cetes)
+        elif tipo == "Curva de Rendimiento":
+            fig = _grafica_curva(datos_df)
+        elif tipo == "Tasas Reales y Diferenciales":
+            fig = _grafica_tasas_reales(datos_df)
+        else:
+            return None
+        if fig is None:
+            return None
+
+        with _lock_cache:
+            _cache_figuras[clave] = fig
+            while len(_cache_figuras) > MAX_FIGURAS_CACHE:
+                _cache_figuras.popitem(last=False)
+        return fig
+    except Exception:
+        return None
@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import threading
+import time
+
+# Buckets en segundos: cubren desde una llamada a herramienta (milisegundos)
+# hasta un ajuste SARIMAX estacional (minutos).
+BUCKETS_DEFAULT = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+PREFIJO = "miasesor"
+
+registro = logging.getLogger("miasesor.metricas")
+
+_habilitado = os.getenv("MIASESOR_METRICAS", "1").strip().lower() not in ("0", "false", "no")
+_lock = threading.Lock()
+_histogramas = {}
+_contadores = {}
+_medidores = {}
+
+
+def habilitado():
+    return _habilitado
+
+
+def configurar(habilitar):
+    global _habilitado
+    _habilitado = bool(habilitar)
+
+
+def reiniciar():
+    with _lock:
+        _histogramas.clear()
+        _contadores.clear()
+        _medidores.clear()
+
+
+def _clave(nombre, etiquetas):
+    return (nombre, tuple(sorted((k, str(v)) for k, v in etiquetas.items())))
+
+
+def observar(nombre, segundos, **etiquetas):
+    if not _habilitado:
+        return
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        histograma = _histogramas.get(clave)
+        if histograma is None:
+            histograma = _histogramas[clave] = [[0] * len(BUCKETS_DEFAULT), 0.0, 0]
+        for i, limite in enumerate(BUCKETS_DEFAULT):
+            if segundos <= limite:
+                histograma[0][i] += 1
+        histograma[1] += segundos
+        histograma[2] += 1
+    if registro.isEnabledFor(logging.INFO):
+        registro.info(json.dumps({"metrica": nombre, "segundos": round(segundos, 6), **etiquetas}, ensure_ascii=False, default=str))
+
+
+def contar(nombre, valor=1, **etiquetas):
+    if not _habilitado:
+        return
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        _contadores[clave] = _contadores.get(clave, 0) + valor
+
+
+def fijar(nombre, valor, **etiquetas):
+    # Medidor: guarda el último valor (p. ej. profundidad de una cola).
+    if not _habilitado:
+        return
+    clave = _clave(nombre, etiquetas)
+    with _lock:
+        _medidores[clave] = valor
+
+
+class _Cronometro:
+    __slots__ = ("nombre", "etiquetas", "inicio")
+
+    def __init__(self, nombre, etiquetas):
+        self.nombre = nombre
+        self.etiquetas = etiquetas
+        self.inicio = None
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        etiquetas = self.etiquetas
+        if tipo is not None:
+            etiquetas = {**etiquetas, "resultado": "error"}
+        observar(self.nombre, time.perf_counter() - self.inicio, **etiquetas)
+        return False
+
+
+class _CronometroNulo:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        return False
+
+
+_CRONOMETRO_NULO = _CronometroNulo()
+
+
+def cronometro(nombre, **etiquetas):
+    if not _habilitado:
+        return _CRONOMETRO_NULO
+    return _Cronometro(nombre, etiquetas)
+
+
+def _formatear_etiquetas(etiquetas, extra=None):
+    pares = list(etiquetas) + list(extra or [])
+    if not pares:
+        return ""
+    contenido = ",".join(
+        f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in pares
+    )
+    return "{" + contenido + "}"
+
+
+def exponer_prometheus():
+    with _lock:
+        histogramas = {clave: (list(h[0]), h[1], h[2]) for clave, h in _histogramas.items()}
+        contadores = dict(_contadores)
+        medidores = dict(_medidores)
+
+    lineas = []
+    for nombre in sorted({clave[0] for clave in histogramas}):
+        metrica = f"{PREFIJO}_{nombre}_segundos"
+        lineas.append(f"# TYPE {metrica} histogram")
+        for (n, etiquetas), (buckets, suma, total) in sorted(histogramas.items()):
+            if n != nombre:
+                continue
+            for limite, cuenta in zip(BUCKETS_DEFAULT, buckets):
+                lineas.append(f"{metrica}_bucket{_formatear_etiquetas(etiquetas, [('le', limite)])} {cuenta}")
+            lineas.append(f"{metrica}_bucket{_formatear_etiquetas(etiquetas, [('le', '+Inf')])} {total}")
+            lineas.append(f"{metrica}_sum{_formatear_etiquetas(etiquetas)} {suma}")
+            lineas.append(f"{metrica}_count{_formatear_etiquetas(etiquetas)} {total}")
+
+    for nombre in sorted({clave[0] for clave in contadores}):
+        metrica = f"{PREFIJO}_{nombre}_total"
+        lineas.append(f"# TYPE {metrica} counter")
+        for (n, etiquetas), valor in sorted(contadores.items()):
+            if n == nombre:
+                lineas.append(f"{metrica}{_formatear_etiquetas(etiquetas)} {valor}")
+
+    for nombre in sorted({clave[0] for clave in medidores}):
+        metrica = f"{PREFIJO}_{nombre}"
+        lineas.append(f"# TYPE {metrica} gauge")
+        for (n, etiquetas), valor in sorted(medidores.items()):
+            if n == nombre:
+                lineas.append(f"{metrica}{_formatear_etiquetas(etiquetas)} {valor}")
+
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import metricas
+
+SERIES_CETES = ['CETE_28D', 'CETE_91D', 'CETE_182D', 'CETE_364D']
+# Las exógenas entran al sistema como variables endógenas más: así el
+# modelo también las pronostica y no hace falta suponer que se quedan en su
+# último valor durante las 13 semanas.
+VARIABLES_EXOGENAS = ['Tasa_Objetivo', 'Tasa_FED', 'INPC', 'Tipo_Cambio_Fix']
+# Niveles con tendencia multiplicativa: entran en logaritmo.
+EXOGENAS_LOG = {'INPC', 'Tipo_Cambio_Fix'}
+REZAGOS_MAXIMOS = 4
+
+
+def _sistema(df, series, exog_vars):
+    sistema = df[series + exog_vars].ffill().bfill().astype(float)
+    for var in exog_vars:
+        if var in EXOGENAS_LOG:
+            sistema[var] = np.log(sistema[var])
+    return sistema
+
+
+def generar_pronosticos_conjuntos(df, semanas_pronostico=4, series=None, rezagos_maximos=REZAGOS_MAXIMOS,
+                                  usar_exogenas=True, nivel_confianza=0.95):
+    # VAR en niveles (el caso VARMAX(p, 0)) sobre los cuatro plazos y las
+    # exógenas, estimado por mínimos cuadrados: una sola estimación produce
+    # los cuatro pronósticos y respeta la relación entre plazos que hay en
+    # los datos. El número de rezagos se elige por AIC.
+    from statsmodels.tsa.api import VAR
+
+    series = [s for s in (series or SERIES_CETES) if s in df.columns] if df is not None else []
+    try:
+        if df is None or len(df) == 0 or len(series) == 0:
+            return None, None, None
+
+        exog_vars = [var for var in VARIABLES_EXOGENAS if var in df.columns] if usar_exogenas else []
+        sistema = _sistema(df, series, exog_vars)
+
+        with metricas.cronometro('var_ajuste', series=len(series)):
+            modelo = VAR(sistema.to_numpy())
+            rezagos = modelo.select_order(maxlags=rezagos_maximos, trend='c').aic or 1
+            modelo_ajustado = modelo.fit(max(1, rezagos), trend='c')
+
+        historia = sistema.to_numpy()[-modelo_ajustado.k_ar:]
+        media, inferior, superior = modelo_ajustado.forecast_interval(
+            historia, steps=semanas_pronostico, alpha=1 - nivel_confianza
+        )
+
+        fecha_inicio_pronostico = df.index[-1] + pd.Timedelta(weeks=1)
+        fechas_pronostico = pd.date_range(start=fecha_inicio_pronostico, periods=semanas_pronostico, freq='W-THU')
+
+        pronosticos_dict = {}
+        for i, serie in enumerate(series):
+            pronosticos_dict[serie] = pd.DataFrame({
+                "pronostico": media[:, i],
+                "limite_inferior": inferior[:, i],
+                "limite_superior": superior[:, i]
+            }, index=fechas_pronostico)
+
+        estadisticas = {
+            "aic": modelo_ajustado.aic,
+            "bic": modelo_ajustado.bic,
+            "rezagos": modelo_ajustado.k_ar,
+            "series_pronosticadas": series,
+            "variables_exogenas_usadas": exog_vars,
+            "estable": bool(modelo_ajustado.is_stable()),
+        }
+
+        return pronosticos_dict, estadisticas, modelo_ajustado
+
+    except Exception:
+        metricas.contar('var_fallos')
+        return None, None, None
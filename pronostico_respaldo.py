@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+# Cascada de modelos baratos para cuando SARIMAX se pasa de su presupuesto de
+# tiempo o no converge. Todos se estiman para todas las series a la vez con
+# álgebra de numpy, sin optimizador numérico, así que tardan milisegundos.
+# Por plazo se elige el de menor AIC sobre los mismos residuos de un paso
+# entre los que dieron un resultado finito; "ingenuo" siempre está
+# disponible, así que todo plazo con al menos tres observaciones tiene
+# pronóstico.
+MOTORES_RESPALDO = ("arima", "suavizamiento", "deriva", "ingenuo")
+Z_95 = 1.959963984540054
+ALFAS_SUAVIZAMIENTO = np.linspace(0.05, 1.0, 20)
+OBSERVACIONES_MINIMAS = 3
+
+
+def _arima(Y, semanas):
+    # ARIMA(1,1,0) con deriva por mínimos cuadrados sobre las diferencias:
+    # d_t = c + phi * d_{t-1} + e_t.
+    d = np.diff(Y, axis=0)
+    x, y = d[:-1], d[1:]
+    x_media, y_media = x.mean(axis=0), y.mean(axis=0)
+    varianza_x = ((x - x_media) ** 2).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        phi = ((x - x_media) * (y - y_media)).sum(axis=0) / varianza_x
+    c = y_media - phi * x_media
+    residuos = y - c - phi * x
+    phi = np.where(np.abs(phi) < 1, phi, np.nan)
+
+    pasos = np.empty((semanas, Y.shape[1]))
+    ultima = d[-1]
+    for h in range(semanas):
+        ultima = c + phi * ultima
+        pasos[h] = ultima
+    media = Y[-1] + np.cumsum(pasos, axis=0)
+
+    # Pesos psi del nivel: psi_j = sum_{i<=j} phi^i.
+    potencias = phi[None, :] ** np.arange(semanas)[:, None]
+    psi = np.cumsum(potencias, axis=0)
+    varianza_residual = (residuos ** 2).sum(axis=0) / max(1, len(residuos) - 2)
+    varianza = varianza_residual * np.cumsum(psi ** 2, axis=0)
+    return media, varianza, residuos, 3
+
+
+def _suavizamiento(Y, semanas):
+    # Suavizamiento exponencial simple con alfa elegido por rejilla: las
+    # alfas y las series se recorren juntas en una sola recursión.
+    alfas = ALFAS_SUAVIZAMIENTO[:, None]
+    nivel = np.repeat(Y[:1], len(ALFAS_SUAVIZAMIENTO), axis=0)
+    errores = np.empty((len(Y) - 1,) + nivel.shape)
+    for t in range(1, len(Y)):
+        errores[t - 1] = Y[t] - nivel
+        nivel = nivel + alfas * errores[t - 1]
+    mejor = np.argmin((errores ** 2).sum(axis=0), axis=0)
+    columnas = np.arange(Y.shape[1])
+    alfa = ALFAS_SUAVIZAMIENTO[mejor]
+    residuos = errores[:, mejor, columnas]
+
+    media = np.repeat(nivel[mejor, columnas][None, :], semanas, axis=0)
+    varianza_residual = (residuos ** 2).sum(axis=0) / max(1, len(residuos) - 1)
+    h = np.arange(semanas)[:, None]
+    varianza = varianza_residual * (1 + h * alfa ** 2)
+    return media, varianza, residuos, 2
+
+
+def _deriva(Y, semanas):
+    d = np.diff(Y, axis=0)
+    deriva = d.mean(axis=0)
+    residuos = d - deriva
+    h = np.arange(1, semanas + 1)[:, None]
+    media = Y[-1] + h * deriva
+    varianza_residual = (residuos ** 2).sum(axis=0) / max(1, len(residuos) - 1)
+    varianza = varianza_residual * h * (1 + h / len(Y))
+    return media, varianza, residuos, 1
+
+
+def _ingenuo(Y, semanas):
+    residuos = np.diff(Y, axis=0)
+    h = np.arange(1, semanas + 1)[:, None]
+    media = np.repeat(Y[-1:], semanas, axis=0)
+    varianza = (residuos ** 2).mean(axis=0) * h
+    return media, varianza, residuos, 0
+
+
+MODELOS = {
+    "arima": _arima,
+    "suavizamiento": _suavizamiento,
+    "deriva": _deriva,
+    "ingenuo": _ingenuo,
+}
+
+
+def pronosticos_respaldo(df, series, semanas_pronostico=4):
+    # Devuelve ({serie: DataFrame}, {serie: motor}); las series sin
+    # suficientes observaciones se omiten.
+    series = [serie for serie in series if serie in df.columns]
+    if not series:
+        return {}, {}
+    panel = df[series].ffill().dropna()
+    if len(panel) < OBSERVACIONES_MINIMAS:
+        return {}, {}
+    Y = panel.to_numpy(dtype=float)
+
+    # Los residuos de todos los modelos se comparan sobre la misma muestra
+    # (la del ARIMA, que pierde dos observaciones).
+    n = len(Y) - 2
+    candidatos = {}
+    for motor in MOTORES_RESPALDO:
+        with np.errstate(all='ignore'):
+            media, varianza, residuos, parametros = MODELOS[motor](Y, semanas_pronostico)
+            residuos = residuos[-n:]
+            aic = n * np.log((residuos ** 2).mean(axis=0)) + 2 * (parametros + 1)
+        validos = np.isfinite(media).all(axis=0) & np.isfinite(varianza).all(axis=0) & np.isfinite(aic)
+        candidatos[motor] = (media, np.sqrt(np.maximum(varianza, 0)), np.where(validos, aic, np.inf))
+
+    fecha_inicio_pronostico = df.index[-1] + pd.Timedelta(weeks=1)
+    fechas_pronostico = pd.date_range(start=fecha_inicio_pronostico, periods=semanas_pronostico, freq='W-THU')
+
+    pronosticos = {}
+    elegidos = {}
+    for i, serie in enumerate(series):
+        motor = min(MOTORES_RESPALDO, key=lambda m: candidatos[m][2][i])
+        if not np.isfinite(candidatos[motor][2][i]):
+            # Serie constante: el AIC no está definido, pero el último
+            # valor sigue siendo un pronóstico válido.
+            motor = "ingenuo"
+        media, desviacion, _ = candidatos[motor]
+        pronosticos[serie] = pd.DataFrame({
+            "pronostico": media[:, i],
+            "limite_inferior": media[:, i] - Z_95 * desviacion[:, i],
+            "limite_superior": media[:, i] + Z_95 * desviacion[:, i]
+        }, index=fechas_pronostico)
+        elegidos[serie] = motor
+    return pronosticos, elegidos
@@ -0,0 +1,372 @@
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+# Generador de carga para los caminos de chat (safe_respond/process_message)
+# y de refresco (actualizar_datos). OpenAI y el SIE de Banxico se sustituyen
+# por dobles locales con latencia configurable, así que no se consume cuota
+# ni red. Las llamadas van directo a los handlers, sin la cola de Gradio:
+# mide la capacidad de los handlers, no el concurrency_limit de los eventos.
+
+PREGUNTAS = [
+    "¿Qué son los CETES?",
+    "¿Cuánto gano si invierto 10,000 pesos a 28 días?",
+    "¿Conviene más CETES a 364 días o a 28 días?",
+    "¿Cuál es la tasa real de los CETES hoy?",
+    "¿Qué pronóstico hay para la próxima subasta?",
+    "¿Cómo afecta la tasa de Banxico a los CETES?",
+]
+
+
+class _Delta(SimpleNamespace):
+    pass
+
+
+def _chunk(content=None, role=None, tool_calls=None, finish_reason=None):
+    delta = _Delta(content=content, role=role, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=finish_reason)])
+
+
+class LimiteTasaFalso(Exception):
+    # Misma forma que openai.RateLimitError para lo que revisa admision_openai.
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("429 Too Many Requests (simulado)")
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)} if retry_after else {})
+
+
+class OpenAIFalso:
+    # Imita la parte del SDK de OpenAI que usa app.py. Con prob_429 o
+    # limite_rpm responde 429 como el proveedor bajo ráfagas.
+
+    def __init__(self, latencia_primer_token=0.3, latencia_token=0.01, tokens=80,
+                 latencia_tts=0.2, latencia_transcripcion=0.3, prob_herramienta=0.0,
+                 prob_429=0.0, limite_rpm=None):
+        self.latencia_primer_token = latencia_primer_token
+        self.latencia_token = latencia_token
+        self.tokens = tokens
+        self.latencia_tts = latencia_tts
+        self.latencia_transcripcion = latencia_transcripcion
+        self.prob_herramienta = prob_herramienta
+        self.prob_429 = prob_429
+        self.limite_rpm = limite_rpm
+        self.errores_429 = 0
+        self.llamadas_chat = 0
+        self._llamadas = {}
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+        self.audio = SimpleNamespace(
+            speech=SimpleNamespace(create=self._tts),
+            transcriptions=SimpleNamespace(create=self._transcribir),
+        )
+
+    def _quizas_429(self, endpoint):
+        with self._lock:
+            ahora = time.monotonic()
+            llamadas = [t for t in self._llamadas.get(endpoint, []) if ahora - t < 60]
+            excedido = self.limite_rpm is not None and len(llamadas) >= self.limite_rpm
+            if not excedido:
+                llamadas.append(ahora)
+            self._llamadas[endpoint] = llamadas
+            if excedido or random.random() < self.prob_429:
+                self.errores_429 += 1
+                raise LimiteTasaFalso()
+
+    def _chat(self, model=None, messages=None, tools=None, stream=True, **kwargs):
+        self._quizas_429("chat")
+        with self._lock:
+            self.llamadas_chat += 1
+        ya_hubo_herramienta = any(m.get("role") == "tool" for m in messages or [])
+        usar_herramienta = tools and not ya_hubo_herramienta and random.random() < self.prob_herramienta
+        return self._stream(usar_herramienta)
+
+    def _stream(self, usar_herramienta):
+        time.sleep(self.latencia_primer_token)
+        if usar_herramienta:
+            # Como la API real: id y nombre en el primer fragmento y los
+            # argumentos repartidos en los siguientes, todos con index=0.
+            yield _chunk(role="assistant", tool_calls=[SimpleNamespace(
+                index=0, id=f"call_{random.randrange(10 ** 9)}", type="function",
+                function=SimpleNamespace(name="calcular_rendimiento", arguments=""),
+            )])
+            for parte in ('{"monto": 10000, ', '"tasa": 10.5, ', '"plazo": 28}'):
+                yield _chunk(tool_calls=[SimpleNamespace(
+                    index=0, id=None, type=None, function=SimpleNamespace(name=None, arguments=parte),
+                )])
+            yield _chunk(finish_reason="tool_calls")
+            return
+        yield _chunk(role="assistant", content="")
+        for i in range(self.tokens):
+            time.sleep(self.latencia_token)
+            yield _chunk(content=f"palabra{i} ")
+        yield _chunk(finish_reason="stop")
+
+    def _tts(self, model=None, voice=None, input=None, **kwargs):
+        self._quizas_429("tts")
+        time.sleep(self.latencia_tts)
+        contenido = b"\x00" * min(len(input or "") * 40, 200_000)
+        return SimpleNamespace(read=lambda: contenido)
+
+    def _transcribir(self, model=None, file=None, **kwargs):
+        self._quizas_429("transcripcion")
+        time.sleep(self.latencia_transcripcion)
+        return SimpleNamespace(text=random.choice(PREGUNTAS))
+
+
+def _serie_sie(serie, semanas, semilla):
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range(end=pd.Timestamp.today().normalize(), periods=semanas, freq='W-THU')
+    if serie == 'SP1':
+        valores = 80 * np.exp(np.cumsum(np.full(semanas, 0.04 / 52) + rng.normal(0, 0.001, semanas)))
+    elif serie == 'SF43718':
+        valores = 17 + np.cumsum(rng.normal(0, 0.1, semanas))
+    elif serie == 'SI237':
+        valores = np.clip(2 + np.cumsum(rng.normal(0, 0.05, semanas)), 0, 6)
+    else:
+        valores = np.clip(7 + np.cumsum(rng.normal(0, 0.08, semanas)), 2, 14)
+    return [{"fecha": f.strftime('%d/%m/%Y'), "dato": f"{v:.4f}"} for f, v in zip(fechas, valores)]
+
+
+class SIEFalso:
+    # Sustituto de requests.get para las URLs del SIE de Banxico.
+
+    def __init__(self, latencia=0.2, semanas=1000, prob_falla=0.0):
+        self.latencia = latencia
+        self.semanas = semanas
+        self.prob_falla = prob_falla
+        self.solicitudes = 0
+        self._series = {}
+        self._respuestas = {}
+
+    def __call__(self, url, headers=None, timeout=None, **kwargs):
+        time.sleep(self.latencia)
+        self.solicitudes += 1
+        if random.random() < self.prob_falla:
+            return SimpleNamespace(status_code=503, text="", json=lambda: {})
+        serie, _, inicio, fin = url.split('/series/')[1].split('/')[:4]
+        clave = (serie, inicio, fin)
+        if clave not in self._respuestas:
+            if serie not in self._series:
+                self._series[serie] = _serie_sie(serie, self.semanas, abs(hash(serie)) % 2 ** 32)
+            desde, hasta = pd.Timestamp(inicio), pd.Timestamp(fin)
+            datos = [d for d in self._series[serie] if desde <= pd.Timestamp(datetime.strptime(d["fecha"], '%d/%m/%Y')) <= hasta]
+            self._respuestas[clave] = json.dumps({"bmx": {"series": [{"idSerie": serie, "datos": datos}]}})
+        texto = self._respuestas[clave]
+        return SimpleNamespace(status_code=200, text=texto, json=lambda: json.loads(texto))
+
+
+def _pronostico_falso(latencia):
+    def generar(df, serie_pronosticar='CETE_28D', semanas_pronostico=4, **kwargs):
+        time.sleep(latencia)
+        ultimo = float(df[serie_pronosticar].iloc[-1])
+        fechas = pd.date_range(start=df.index[-1] + pd.Timedelta(weeks=1), periods=semanas_pronostico, freq='W-THU')
+        ancho = np.linspace(0.1, 0.8, semanas_pronostico)
+        df_pronostico = pd.DataFrame({
+            "pronostico": np.full(semanas_pronostico, ultimo),
+            "limite_inferior": ultimo - ancho,
+            "limite_superior": ultimo + ancho,
+        }, index=fechas)
+        return df_pronostico, {"serie_pronosticada": serie_pronosticar}, None
+    return generar
+
+
+def _rss_pico_mb():
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KiB y macOS bytes.
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def _percentiles(latencias):
+    if not latencias:
+        return {"n": 0}
+    valores = np.asarray(latencias)
+    return {
+        "n": int(len(valores)),
+        "p50_s": round(float(np.percentile(valores, 50)), 4),
+        "p95_s": round(float(np.percentile(valores, 95)), 4),
+        "p99_s": round(float(np.percentile(valores, 99)), 4),
+        "max_s": round(float(valores.max()), 4),
+    }
+
+
+def preparar_entorno(args):
+    os.environ.setdefault("OPENAI_API_KEY", "prueba-carga")
+    os.environ["BANXICO_API_KEY"] = os.environ.get("BANXICO_API_KEY") or "prueba-carga"
+    os.environ["MIASESOR_CACHE_DIR"] = args.directorio_cache
+
+    import app
+    import banxico_data
+
+    app._cliente_openai = OpenAIFalso(
+        latencia_primer_token=args.latencia_primer_token,
+        latencia_token=args.latencia_token,
+        tokens=args.tokens,
+        latencia_tts=args.latencia_tts,
+        prob_herramienta=args.prob_herramienta,
+        prob_429=args.prob_429,
+        limite_rpm=args.limite_rpm,
+    )
+    banxico_data.requests.get = SIEFalso(args.latencia_sie, args.semanas)
+    if not args.sarimax_real:
+        # Los ajustes con presupuesto corren en procesos nuevos que no ven
+        # este reemplazo; sin presupuesto se ajusta en el mismo proceso.
+        os.environ["MIASESOR_PRESUPUESTO_AJUSTE_S"] = "0"
+        banxico_data.generar_pronostico_sarimax = _pronostico_falso(args.latencia_ajuste)
+    return app
+
+
+# Argumentos de ejemplo para la prueba de humo de las herramientas.
+ARGUMENTOS_HERRAMIENTAS = {
+    "calcular_rendimiento": {"monto": 10000, "tasa": 10.5, "plazo": 28},
+    "consultar_analitica": {"serie": "CETE_28D"},
+    "consultar_curva": {"plazos_dias": [60, 120]},
+    "consultar_series_derivadas": {},
+    "simular_escenarios": {"escenarios": [{"nombre": "Recorte", "tasa_objetivo_pb": [-50]}]},
+}
+
+
+def comprobar_herramientas(datos, pronosticos):
+    # Prueba de humo: cada herramienta declarada en tooling.tools se llama
+    # una vez con las métricas encendidas. Devuelve {herramienta: "ok" o
+    # el problema encontrado}.
+    import metricas
+    from tooling import handle_tool_calls, tools
+
+    habilitadas = metricas.habilitado()
+    metricas.configurar(True)
+    resultado = {}
+    try:
+        for herramienta in tools:
+            nombre = herramienta["function"]["name"]
+            llamada = SimpleNamespace(id=f"humo_{nombre}", type="function", function=SimpleNamespace(
+                name=nombre, arguments=json.dumps(ARGUMENTOS_HERRAMIENTAS.get(nombre, {}))
+            ))
+            try:
+                respuesta = handle_tool_calls([llamada], datos, pronosticos)
+                json.loads(respuesta[0]["content"])
+            except Exception as e:
+                resultado[nombre] = f"{type(e).__name__}: {e}"
+                continue
+            if f'funcion="{nombre}"' not in metricas.exponer_prometheus():
+                resultado[nombre] = "no registró la métrica herramienta"
+            else:
+                resultado[nombre] = "ok"
+    finally:
+        metricas.configurar(habilitadas)
+    return resultado
+
+
+def ejecutar_carga(args):
+    app = preparar_entorno(args)
+
+    latencias = {"chat": [], "refresco": []}
+    errores = {"chat": 0, "refresco": 0}
+    tamanos_estado = []
+    cpu_por_turno = [[] for _ in range(args.turnos)]
+    saturadas = [0]
+    lock = threading.Lock()
+
+    # Primer refresco fuera de la medición: las sesiones arrancan con datos
+    # precargados, como en producción.
+    app.actualizar_datos()
+    herramientas = comprobar_herramientas(*app.datos_vigentes(None, None))
+    if args.solo_herramientas:
+        return {"herramientas": herramientas}
+
+    def sesion(indice):
+        rng = random.Random(args.semilla + indice)
+        conversacion = None
+        for turno in range(args.turnos):
+            if rng.random() < args.prob_refresco:
+                inicio = time.perf_counter()
+                _, estado, _, _, _ = app.actualizar_datos()
+                duracion = time.perf_counter() - inicio
+                with lock:
+                    latencias["refresco"].append(duracion)
+                    errores["refresco"] += estado.startswith("❌")
+
+            datos, pronosticos = app.datos_vigentes(None, None)
+            inicio = time.perf_counter()
+            inicio_cpu = time.thread_time()
+            vista, _, _, error, conversacion = app.safe_respond(rng.choice(PREGUNTAS), None, conversacion, datos, pronosticos)
+            cpu = time.thread_time() - inicio_cpu
+            duracion = time.perf_counter() - inicio
+            ultimo = vista[-1] if vista else {}
+            respuesta = str(ultimo.get("content") or "") if isinstance(ultimo, dict) else ""
+            with lock:
+                latencias["chat"].append(duracion)
+                cpu_por_turno[turno].append(cpu)
+                errores["chat"] += bool(error) or respuesta.startswith("Error")
+                saturadas[0] += respuesta == app.MENSAJE_SATURACION
+            time.sleep(rng.uniform(0, args.pausa))
+
+        with lock:
+            if conversacion is not None:
+                tamanos_estado.append(len(json.dumps(conversacion.mensajes, ensure_ascii=False).encode('utf-8')))
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sesiones) as ejecutor:
+        list(ejecutor.map(sesion, range(args.sesiones)))
+    duracion_total = time.perf_counter() - inicio
+
+    return {
+        "sesiones": args.sesiones,
+        "turnos_por_sesion": args.turnos,
+        "duracion_s": round(duracion_total, 3),
+        "throughput_chat_por_s": round(len(latencias["chat"]) / duracion_total, 3),
+        "chat": {**_percentiles(latencias["chat"]), "errores": errores["chat"], "saturadas": saturadas[0]},
+        "refresco": {**_percentiles(latencias["refresco"]), "errores": errores["refresco"]},
+        # CPU local por turno (sin la espera al proveedor) al inicio y al
+        # final de las conversaciones: no debe crecer con el historial.
+        "chat_cpu_ms_primer_turno": round(float(np.mean(cpu_por_turno[0])) * 1000, 3) if cpu_por_turno and cpu_por_turno[0] else 0,
+        "chat_cpu_ms_ultimo_turno": round(float(np.mean(cpu_por_turno[-1])) * 1000, 3) if cpu_por_turno and cpu_por_turno[-1] else 0,
+        "estado_final_kb_promedio": round(float(np.mean(tamanos_estado)) / 1024, 2) if tamanos_estado else 0,
+        "rss_pico_mb": round(_rss_pico_mb(), 1),
+        "openai_429": app._cliente_openai.errores_429,
+        "openai_chat_llamadas": app._cliente_openai.llamadas_chat,
+        "herramientas": herramientas,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de Mi Asesor CETES con OpenAI y SIE simulados")
+    parser.add_argument("--sesiones", type=int, default=20, help="Sesiones concurrentes simuladas")
+    parser.add_argument("--turnos", type=int, default=5, help="Mensajes por sesión")
+    parser.add_argument("--pausa", type=float, default=0.5, help="Pausa máxima entre mensajes (s)")
+    parser.add_argument("--prob-refresco", type=float, default=0.05, help="Probabilidad de forzar actualización antes de un mensaje")
+    parser.add_argument("--prob-herramienta", type=float, default=0.2, help="Probabilidad de que el modelo llame una herramienta")
+    parser.add_argument("--prob-429", type=float, default=0.0, help="Probabilidad de que OpenAI simulado responda 429")
+    parser.add_argument("--limite-rpm", type=int, default=None, help="Solicitudes por minuto por endpoint antes de que OpenAI simulado responda 429")
+    parser.add_argument("--latencia-primer-token", type=float, default=0.3)
+    parser.add_argument("--latencia-token", type=float, default=0.01)
+    parser.add_argument("--tokens", type=int, default=80)
+    parser.add_argument("--latencia-tts", type=float, default=0.2)
+    parser.add_argument("--latencia-sie", type=float, default=0.2, help="Latencia por serie del SIE simulado (s)")
+    parser.add_argument("--latencia-ajuste", type=float, default=0.5, help="Latencia del pronóstico simulado por serie (s)")
+    parser.add_argument("--semanas", type=int, default=1000, help="Semanas de historia del SIE simulado")
+    parser.add_argument("--sarimax-real", action="store_true", help="Ajusta SARIMAX de verdad en lugar del pronóstico simulado")
+    parser.add_argument("--directorio-cache", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "prueba_carga"))
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--solo-herramientas", action="store_true",
+                        help="Solo corre la prueba de humo de las herramientas del chat y termina")
+    args = parser.parse_args(argv)
+
+    resultado = ejecutar_carga(args)
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    return resultado
+
+
+if __name__ == "__main__":
+    main()
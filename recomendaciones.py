@@ -0,0 +1,81 @@
+from graficas import SERIES_CETES, ETIQUETAS_CETES
+
+UMBRAL_CAUTELA = 0.5
+
+
+def evaluar_recomendacion(datos_df, pronosticos_df, tipo_cetes):
+    # Devuelve los números de la recomendación; si no se puede calcular,
+    # un diccionario con la llave "error" y el mensaje para el usuario.
+    if datos_df is None or len(datos_df) == 0:
+        return {"error": "⚠️ No hay datos históricos disponibles para generar una recomendación."}
+
+    if pronosticos_df is None:
+        return {"error": "⚠️ No hay pronósticos disponibles. Actualiza los datos para obtener recomendaciones."}
+
+    if tipo_cetes not in datos_df.columns:
+        for serie in SERIES_CETES:
+            if serie in datos_df.columns:
+                tipo_cetes = serie
+                break
+        else:
+            return {"error": "⚠️ No se encontró la serie de CETES especificada."}
+
+    pronostico_actual = None
+    if isinstance(pronosticos_df, dict):
+        pronostico_actual = pronosticos_df.get(tipo_cetes)
+        if pronostico_actual is None:
+            return {"error": f"⚠️ No hay pronóstico disponible para {tipo_cetes}. Actualiza los datos."}
+    elif hasattr(pronosticos_df, 'columns') and 'pronostico' in pronosticos_df.columns:
+        pronostico_actual = pronosticos_df
+    else:
+        return {"error": "⚠️ Los pronósticos no tienen el formato esperado."}
+
+    if pronostico_actual is None or len(pronostico_actual) == 0:
+        return {"error": f"⚠️ No hay pronóstico disponible para {tipo_cetes}."}
+
+    if 'pronostico' not in pronostico_actual.columns:
+        return {"error": "⚠️ Los pronósticos no tienen el formato esperado."}
+
+    tasa_actual = float(datos_df[tipo_cetes].iloc[-1])
+    pronostico_proxima = float(pronostico_actual['pronostico'].iloc[0])
+    change = pronostico_proxima - tasa_actual
+
+    if change > UMBRAL_CAUTELA:
+        recommendation = "🤔 ESPERAR"
+        explanation = f"Se predice un alza significativa en la próxima subasta (> {UMBRAL_CAUTELA:.2f}pp). Esperar podría darte un mayor rendimiento."
+    elif change < -UMBRAL_CAUTELA:
+        recommendation = "✅ ¡INVERTIR AHORA!"
+        explanation = f"La tasa actual es atractiva. Nuestro modelo predice que podría bajar pronto (< -{UMBRAL_CAUTELA:.2f}pp), ¡asegura este rendimiento!"
+    else:
+        recommendation = "⚖️ INVERTIR (ESTABLE)"
+        explanation = "El cambio previsto es mínimo. Invierte ahora para evitar que tu capital pierda tiempo en efectivo."
+
+    return {
+        "plazo": tipo_cetes,
+        "nombre": ETIQUETAS_CETES.get(tipo_cetes, tipo_cetes),
+        "recomendacion": recommendation,
+        "explicacion": explanation,
+        "tasa_actual": tasa_actual,
+        "pronostico_proxima": pronostico_proxima,
+        "cambio": change,
+    }
+
+
+def generar_recomendacion(datos_df, pronosticos_df, tipo_cetes):
+    resultado = evaluar_recomendacion(datos_df, pronosticos_df, tipo_cetes)
+    if "error" in resultado:
+        return resultado["error"]
+
+    change = resultado["cambio"]
+    if change > UMBRAL_CAUTELA:
+        cambio = f"+{change:.2f}"
+    elif change < -UMBRAL_CAUTELA:
+        cambio = f"{change:.2f}"
+    else:
+        cambio = f"{change:+.2f}"
+    return (
+        f"### {resultado['recomendacion']}\n\n{resultado['explicacion']}\n\n"
+        f"**Tasa actual:** {resultado['tasa_actual']:.2f}%\n"
+        f"**Pronóstico próxima subasta:** {resultado['pronostico_proxima']:.2f}%\n"
+        f"**Cambio previsto:** {cambio} puntos porcentuales"
+    )
@@ -0,0 +1,100 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+import artefactos
+import refresco
+
+# Ejecución sin interfaz del pipeline de datos: descarga el SIE de Banxico,
+# ajusta los pronósticos en paralelo y publica una versión nueva de
+# artefactos. Pensado para cron en una máquina aparte; la app web con
+# MIASESOR_ARTEFACTOS_DIR apuntando al mismo directorio solo los lee.
+#
+#   python refrescar_datos.py --salida /srv/miasesor/artefactos --procesos 4
+
+
+def main(argv=None):
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Descarga datos de Banxico, ajusta pronósticos y publica artefactos")
+    parser.add_argument("--salida", default=artefactos.directorio_artefactos() or "artefactos",
+                        help="Directorio de artefactos (default: MIASESOR_ARTEFACTOS_DIR o ./artefactos)")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1,
+                        help="Procesos para ajustar los pronósticos en paralelo")
+    parser.add_argument("--motor", choices=refresco.MOTORES_PRONOSTICO, default=None,
+                        help="Motor de pronóstico (default: MIASESOR_MOTOR_PRONOSTICO o sarimax)")
+    parser.add_argument("--presupuesto", type=float, default=None,
+                        help="Segundos por ajuste SARIMAX antes de usar la cascada de respaldo "
+                             "(default: MIASESOR_PRESUPUESTO_AJUSTE_S o 300; 0 = sin límite)")
+    parser.add_argument("--semanas", type=int, default=refresco.SEMANAS_PRONOSTICO, help="Semanas a pronosticar")
+    parser.add_argument("--conservar", type=int, default=5, help="Versiones que se conservan en el directorio")
+    parser.add_argument("--permitir-fallidas", action="store_true",
+                        help="Publica aunque alguna serie no se haya podido pronosticar")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    inicio = time.perf_counter()
+    # La versión publicada sirve de base para las diferencias; si el panel
+    # no cambió no se vuelve a ajustar ni se escribe una versión nueva.
+    id_anterior = artefactos.id_actual(args.salida)
+    anterior = artefactos.cargar_version(args.salida, id_anterior) if id_anterior else None
+    try:
+        instantanea, tiempos = refresco.construir_instantanea(
+            procesos=args.procesos, semanas_pronostico=args.semanas, motor=args.motor,
+            presupuesto_s=args.presupuesto, anterior=anterior
+        )
+    except Exception as e:
+        print(json.dumps({"ok": False, "error": str(e)}, ensure_ascii=False), file=sys.stderr)
+        return 1
+
+    if instantanea.pronosticos is None or (instantanea.series_fallidas and not args.permitir_fallidas):
+        print(json.dumps({"ok": False, "error": "Series sin pronóstico", "series_fallidas": instantanea.series_fallidas},
+                         ensure_ascii=False), file=sys.stderr)
+        return 1
+
+    duracion = round(time.perf_counter() - inicio, 3)
+    if anterior is not None and instantanea.version == anterior.version:
+        print(json.dumps({
+            "ok": True,
+            "id": id_anterior,
+            "sin_cambios": True,
+            "directorio": os.path.abspath(args.salida),
+            "diferencias": instantanea.diferencias,
+            "duracion_s": duracion,
+        }, ensure_ascii=False, indent=2))
+        return 0
+
+    os.makedirs(args.salida, exist_ok=True)
+    id_version = artefactos.escribir_version(args.salida, instantanea, {
+        "duracion_s": duracion,
+        "ajuste_s": tiempos,
+        "procesos": args.procesos,
+        "motor": args.motor or refresco.motor_pronostico(),
+        "presupuesto_ajuste_s": refresco.presupuesto_ajuste_s() if args.presupuesto is None else args.presupuesto,
+        "semanas_pronostico": args.semanas,
+    })
+    eliminadas = artefactos.podar_versiones(args.salida, args.conservar)
+
+    print(json.dumps({
+        "ok": True,
+        "id": id_version,
+        "directorio": os.path.abspath(args.salida),
+        "semanas_datos": len(instantanea.datos),
+        "series_fallidas": instantanea.series_fallidas,
+        "motores": instantanea.motores,
+        "diferencias": instantanea.diferencias,
+        "duracion_s": duracion,
+        "ajuste_s": tiempos,
+        "versiones_eliminadas": eliminadas,
+    }, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,528 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import almacen
+import artefactos
+import cache_compartida
+import metricas
+
+SERIES_CETES = ['CETE_28D', 'CETE_91D', 'CETE_182D', 'CETE_364D']
+SEMANAS_PRONOSTICO = 13
+
+# Banxico celebra la subasta primaria de CETES los martes y publica los
+# resultados esa misma tarde; por defecto se refresca después de la publicación.
+DIA_REFRESCO_DEFAULT = 1
+HORA_REFRESCO_DEFAULT = "18:00"
+REINTENTO_MINUTOS_DEFAULT = 30
+# En modo de solo lectura solo se revisa si hay una versión nueva publicada.
+INTERVALO_ARTEFACTOS_HORAS = 0.25
+ZONA_HORARIA = "America/Mexico_City"
+# Cada cuánto el programador revisa si otro proceso publicó una instantánea.
+SINCRONIZACION_SEGUNDOS = 60
+# "sarimax": un modelo por plazo; "conjunto": un VAR para los cuatro plazos
+# (modelo_conjunto.py).
+MOTORES_PRONOSTICO = ("sarimax", "conjunto")
+MOTOR_PRONOSTICO_DEFAULT = "sarimax"
+# Segundos de reloj por ajuste SARIMAX; si se agota (o el ajuste falla) el
+# plazo se pronostica con la cascada de pronostico_respaldo.py. 0 desactiva
+# el límite.
+PRESUPUESTO_AJUSTE_S_DEFAULT = 300
+# Los procesos de ajuste no se crean con fork: la app tiene hilos (Gradio,
+# uvicorn, el programador) y un fork hereda los candados que tengan tomados.
+# Con forkserver cada proceso parte de un servidor limpio que ya importó
+# los módulos pesados.
+METODO_PROCESOS = "forkserver"
+MODULOS_PRECARGADOS = ["refresco", "banxico_data"]
+# Tiempo máximo para que los procesos de un lote estén listos; el
+# presupuesto de cada ajuste empieza a contar después.
+ARRANQUE_PROCESOS_S = 120
+
+
+def _ajustar_serie(df, serie, semanas_pronostico):
+    from banxico_data import generar_pronostico_sarimax
+
+    inicio = time.perf_counter()
+    df_pronostico, estadisticas, modelo = generar_pronostico_sarimax(
+        df,
+        serie_pronosticar=serie,
+        semanas_pronostico=semanas_pronostico,
+        usar_exogenas=True
+    )
+    segundos = time.perf_counter() - inicio
+    fallo = df_pronostico is None
+    # Solo modelo.fit, como la métrica sarimax_ajuste del mismo proceso;
+    # segundos incluye además la preparación y el pronóstico.
+    segundos_ajuste = (estadisticas or {}).get("segundos_ajuste")
+    sensibilidad = None
+    if df_pronostico is not None and estadisticas:
+        from escenarios import sensibilidad_sarimax
+
+        exog_vars = estadisticas.get("variables_exogenas_usadas") or []
+        sensibilidad = sensibilidad_sarimax(modelo, exog_vars, df[exog_vars].iloc[-1] if exog_vars else None)
+    return df_pronostico, segundos, sensibilidad, fallo, segundos_ajuste
+
+
+def _registrar_ajuste_remoto(serie, resultado):
+    # Las métricas que banxico_data registra dentro de otro proceso se
+    # pierden con él; se registran aquí con lo que devolvió el proceso.
+    _, _, _, fallo, segundos_ajuste = resultado
+    if segundos_ajuste is not None:
+        metricas.observar('sarimax_ajuste', segundos_ajuste, serie=serie)
+    if fallo:
+        metricas.contar('sarimax_fallos', serie=serie)
+    return resultado
+
+
+def _contexto_procesos():
+    import multiprocessing
+
+    contexto = multiprocessing.get_context(METODO_PROCESOS)
+    if METODO_PROCESOS == "forkserver":
+        contexto.set_forkserver_preload(MODULOS_PRECARGADOS)
+    return contexto
+
+
+def _iniciar_trabajador(barrera):
+    # statsmodels se importa antes de que empiece a contar el presupuesto.
+    import banxico_data
+
+    try:
+        barrera.wait(ARRANQUE_PROCESOS_S)
+    except Exception:
+        pass
+
+
+def motor_pronostico():
+    motor = (os.getenv("MIASESOR_MOTOR_PRONOSTICO") or MOTOR_PRONOSTICO_DEFAULT).strip().lower()
+    return motor if motor in MOTORES_PRONOSTICO else MOTOR_PRONOSTICO_DEFAULT
+
+
+def presupuesto_ajuste_s():
+    valor = os.getenv("MIASESOR_PRESUPUESTO_AJUSTE_S")
+    return float(valor) if valor else PRESUPUESTO_AJUSTE_S_DEFAULT
+
+
+def _pronosticos_conjuntos(df, semanas_pronostico):
+    from modelo_conjunto import generar_pronosticos_conjuntos
+
+    inicio = time.perf_counter()
+    pronosticos_dict, estadisticas, modelo = generar_pronosticos_conjuntos(
+        df,
+        semanas_pronostico=semanas_pronostico,
+        series=SERIES_CETES
+    )
+    if pronosticos_dict is None:
+        return None, None, None
+    from escenarios import sensibilidad_conjunta
+
+    sensibilidad = sensibilidad_conjunta(
+        modelo, estadisticas["series_pronosticadas"] + estadisticas["variables_exogenas_usadas"]
+    )
+    return pronosticos_dict, round(time.perf_counter() - inicio, 3), sensibilidad
+
+
+def _ajustes_con_presupuesto(df, series, semanas_pronostico, procesos, presupuesto_s):
+    # Cada ajuste corre en un proceso que se puede matar: un hilo no se
+    # puede interrumpir a media optimización. Las series se ajustan en
+    # lotes de P procesos y cada lote tiene presupuesto_s segundos; si
+    # alguno se agota se matan los procesos y el siguiente lote arranca con
+    # procesos nuevos. El tiempo total queda acotado por lotes * presupuesto_s.
+    import multiprocessing
+    from threading import BrokenBarrierError
+
+    contexto = _contexto_procesos()
+    trabajadores = max(1, min(procesos, len(series)))
+    resultados = {}
+    pool = None
+    try:
+        for i in range(0, len(series), trabajadores):
+            if pool is None:
+                barrera = contexto.Barrier(trabajadores + 1)
+                pool = contexto.Pool(trabajadores, initializer=_iniciar_trabajador, initargs=(barrera,))
+                try:
+                    barrera.wait(ARRANQUE_PROCESOS_S)
+                except BrokenBarrierError:
+                    # Los procesos no arrancaron: las series que faltan van
+                    # a la cascada de respaldo.
+                    metricas.contar('errores', etapa='arranque_procesos')
+                    for serie in series[i:]:
+                        resultados[serie] = (None, None, None, True, None)
+                    break
+            inicio = time.monotonic()
+            limite = inicio + presupuesto_s
+            lote = {serie: pool.apply_async(_ajustar_serie, (df, serie, semanas_pronostico)) for serie in series[i:i + trabajadores]}
+            agotado = False
+            for serie, pendiente in lote.items():
+                try:
+                    resultados[serie] = _registrar_ajuste_remoto(
+                        serie, pendiente.get(timeout=max(0.0, limite - time.monotonic()))
+                    )
+                except multiprocessing.TimeoutError:
+                    metricas.contar('sarimax_presupuesto_agotado', serie=serie)
+                    resultados[serie] = (None, time.monotonic() - inicio, None, True, None)
+                    agotado = True
+                except Exception:
+                    metricas.contar('sarimax_fallos', serie=serie)
+                    resultados[serie] = (None, None, None, True, None)
+            if agotado:
+                pool.terminate()
+                pool.join()
+                pool = None
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return resultados
+
+
+def _ajustes_sarimax(df, series, semanas_pronostico, procesos, presupuesto_s):
+    if presupuesto_s:
+        return _ajustes_con_presupuesto(df, series, semanas_pronostico, procesos, presupuesto_s)
+
+    # Con procesos > 1 cada serie se ajusta en su propio proceso: SARIMAX
+    # es CPU-bound y los cuatro plazos son independientes.
+    resultados = {}
+    if procesos > 1 and len(series) > 1:
+        with ProcessPoolExecutor(max_workers=min(procesos, len(series)), mp_context=_contexto_procesos()) as ejecutor:
+            futuros = {serie: ejecutor.submit(_ajustar_serie, df, serie, semanas_pronostico) for serie in series}
+        for serie, futuro in futuros.items():
+            try:
+                resultados[serie] = _registrar_ajuste_remoto(serie, futuro.result())
+            except Exception:
+                metricas.contar('sarimax_fallos', serie=serie)
+                resultados[serie] = (None, None, None, True, None)
+    else:
+        for serie in series:
+            try:
+                resultados[serie] = _ajustar_serie(df, serie, semanas_pronostico)
+            except Exception:
+                resultados[serie] = (None, None, None, True, None)
+    return resultados
+
+
+def generar_pronosticos(df, semanas_pronostico=SEMANAS_PRONOSTICO, procesos=1, motor=None, presupuesto_s=None):
+    # Devuelve (pronósticos, series_exitosas, series_fallidas, tiempos,
+    # motores, sensibilidades): motores dice qué modelo produjo cada
+    # pronóstico y sensibilidades guarda lo necesario para evaluar
+    # escenarios de las exógenas sin reajustar (escenarios.py).
+    series = [serie for serie in SERIES_CETES if serie in df.columns]
+    presupuesto_s = presupuesto_ajuste_s() if presupuesto_s is None else presupuesto_s
+    pronosticos_dict = {}
+    tiempos = {}
+    motores = {}
+    sensibilidades = {}
+
+    if (motor or motor_pronostico()) == "conjunto":
+        conjuntos, segundos, sensibilidad = _pronosticos_conjuntos(df, semanas_pronostico)
+        if conjuntos is not None:
+            tiempos["conjunto"] = segundos
+            for serie, df_pronostico in conjuntos.items():
+                pronosticos_dict[serie] = df_pronostico
+                motores[serie] = "conjunto"
+                if sensibilidad is not None:
+                    sensibilidades[serie] = sensibilidad
+        # Lo que el modelo conjunto no cubra se ajusta por plazo.
+
+    pendientes = [serie for serie in series if serie not in pronosticos_dict]
+    if pendientes:
+        resultados = _ajustes_sarimax(df, pendientes, semanas_pronostico, procesos, presupuesto_s)
+        for serie in pendientes:
+            df_pronostico, segundos, sensibilidad, _, _ = resultados[serie]
+            if segundos is not None:
+                tiempos[serie] = round(segundos, 3)
+            if df_pronostico is not None:
+                pronosticos_dict[serie] = df_pronostico
+                motores[serie] = "sarimax"
+                if sensibilidad is not None:
+                    sensibilidades[serie] = sensibilidad
+
+    pendientes = [serie for serie in series if serie not in pronosticos_dict]
+    if pendientes:
+        from pronostico_respaldo import pronosticos_respaldo
+
+        respaldo, motores_respaldo = pronosticos_respaldo(df, pendientes, semanas_pronostico)
+        for serie, df_pronostico in respaldo.items():
+            pronosticos_dict[serie] = df_pronostico
+            motores[serie] = motores_respaldo[serie]
+            metricas.contar('pronosticos_respaldo', serie=serie, motor=motores_respaldo[serie])
+
+    series_exitosas = [serie for serie in series if serie in pronosticos_dict]
+    series_fallidas = [serie for serie in series if serie not in pronosticos_dict]
+    return pronosticos_dict, series_exitosas, series_fallidas, tiempos, motores, sensibilidades
+
+
+def calentar_analitica(df):
+    from analitica import analitica_para
+    from curva_rendimiento import curva_para
+    from series_derivadas import tabla_derivadas
+
+    analitica_para(df)
+    curva_para(df)
+    tabla_derivadas(df)
+
+
+def preparar_instantanea(instantanea):
+    # Antes de publicar: cachés de analítica calientes y la pestaña de
+    # gráficas materializándose en segundo plano.
+    import tablero
+
+    calentar_analitica(instantanea.datos)
+    tablero.materializar(instantanea)
+
+
+def _pronosticos_reutilizables(anterior, semanas_pronostico, motor):
+    # Los pronósticos de la versión anterior sirven tal cual si el panel no
+    # cambió y todos salieron del motor pedido (uno de respaldo se vuelve a
+    # intentar con el motor principal).
+    if anterior is None or not anterior.pronosticos or anterior.series_fallidas:
+        return False
+    motor = motor or motor_pronostico()
+    return all(
+        len(df_pronostico) == semanas_pronostico and anterior.motores.get(serie) == motor
+        for serie, df_pronostico in anterior.pronosticos.items()
+    )
+
+
+def construir_instantanea(procesos=1, semanas_pronostico=SEMANAS_PRONOSTICO, motor=None, presupuesto_s=None,
+                          anterior=None):
+    # anterior: instantánea vigente. Si el panel descargado es idéntico al
+    # suyo se reutilizan sus datos y pronósticos sin volver a ajustar.
+    from banxico_data import obtener_version_datos
+
+    version = obtener_version_datos(anterior.datos if anterior is not None else None)
+    if version is None:
+        raise ValueError("No se obtuvieron datos de Banxico")
+    df = version.datos
+
+    if version.diferencias["tipo"] == "sin_cambios" and _pronosticos_reutilizables(anterior, semanas_pronostico, motor):
+        metricas.contar('pronosticos_reutilizados')
+        instantanea = almacen.Instantanea(
+            anterior.datos,
+            anterior.pronosticos,
+            [],
+            origen="banxico",
+            motores=anterior.motores,
+            diferencias=version.diferencias,
+            sensibilidades=anterior.sensibilidades
+        )
+        return instantanea, {}
+
+    pronosticos_dict, series_exitosas, series_fallidas, tiempos, motores, sensibilidades = generar_pronosticos(
+        df, semanas_pronostico=semanas_pronostico, procesos=procesos, motor=motor, presupuesto_s=presupuesto_s
+    )
+    instantanea = almacen.Instantanea(
+        df,
+        pronosticos_dict if len(pronosticos_dict) > 0 else None,
+        series_fallidas,
+        origen="banxico",
+        motores=motores,
+        diferencias=version.diferencias,
+        sensibilidades=sensibilidades
+    )
+    return instantanea, tiempos
+
+
+def cargar_desde_artefactos(directorio):
+    # Modo de solo lectura: los datos y pronósticos los produce
+    # refrescar_datos.py en otra máquina; aquí solo se cargan.
+    id_version = artefactos.id_actual(directorio)
+    if id_version is None:
+        raise ValueError(f"No hay artefactos publicados en {directorio}")
+
+    vigente = almacen.actual()
+    if vigente is not None and vigente.origen == f"artefacto:{id_version}":
+        return vigente
+
+    instantanea = artefactos.cargar_version(directorio, id_version)
+    if instantanea is None:
+        raise ValueError(f"No se pudo leer la versión {id_version} de {directorio}")
+    instantanea.origen = f"artefacto:{id_version}"
+    preparar_instantanea(instantanea)
+    return almacen.publicar(instantanea)
+
+
+def _refrescar_como_seguidor(candado):
+    # Otro proceso del host tiene el candado: se espera a que termine y se
+    # carga lo que dejó en disco en lugar de repetir descarga y ajuste.
+    with metricas.cronometro('refresco_espera_lider'):
+        candado.adquirir(bloquear=True)
+    candado.liberar()
+    instantanea = cache_compartida.sincronizar(al_cargar=preparar_instantanea)
+    if instantanea is None:
+        # sincronizar no publica nada si lo del disco ya estaba cargado o no
+        # es más nuevo que lo vigente; en ese caso la vigente es el resultado.
+        instantanea = cache_compartida.vigente_en_disco()
+    if instantanea is None:
+        raise ValueError("Otro proceso estaba actualizando los datos y no publicó una versión nueva")
+    metricas.contar('refrescos_compartidos')
+    return instantanea
+
+
+def ejecutar_refresco():
+    directorio = artefactos.directorio_artefactos()
+    if directorio:
+        return cargar_desde_artefactos(directorio)
+
+    candado = cache_compartida.candado_refresco()
+    if not candado.adquirir(bloquear=False):
+        return _refrescar_como_seguidor(candado)
+
+    try:
+        instantanea, tiempos = construir_instantanea(anterior=almacen.actual())
+        preparar_instantanea(instantanea)
+
+        # La publicación es un solo cambio de referencia: los lectores ven la
+        # versión anterior completa o la nueva completa, nunca una mezcla.
+        almacen.publicar(instantanea)
+        try:
+            almacen.guardar_instantanea(instantanea)
+            cache_compartida.marcar_vigente()
+        except OSError:
+            pass
+        return instantanea
+    finally:
+        candado.liberar()
+
+
+def _zona_horaria():
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(ZONA_HORARIA)
+    except Exception:
+        return None
+
+
+class ProgramadorRefresco:
+    def __init__(self, dia_semana=DIA_REFRESCO_DEFAULT, hora=HORA_REFRESCO_DEFAULT,
+                 intervalo_horas=None, reintento_minutos=REINTENTO_MINUTOS_DEFAULT):
+        self.dia_semana = int(dia_semana) % 7
+        self.hora, self.minuto = (int(parte) for parte in str(hora).split(":", 1))
+        self.intervalo = timedelta(hours=float(intervalo_horas)) if intervalo_horas else None
+        self.reintento = timedelta(minutes=float(reintento_minutos))
+        self.zona = _zona_horaria()
+        self.ultimo_error = None
+        self.ultima_ejecucion = None
+        self.proxima_ejecucion = None
+        self._lock_refresco = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def _ahora(self):
+        return datetime.now(self.zona) if self.zona else datetime.now().astimezone()
+
+    def calcular_proxima(self, ahora):
+        if self.intervalo is not None:
+            return ahora + self.intervalo
+        dias = (self.dia_semana - ahora.weekday()) % 7
+        candidata = ahora.replace(hour=self.hora, minute=self.minuto, second=0, microsecond=0) + timedelta(days=dias)
+        if candidata <= ahora:
+            candidata += timedelta(days=7)
+        return candidata
+
+    def esta_vigente(self, instantanea, ahora):
+        # Una instantánea restaurada de disco sigue vigente si es posterior a
+        # la última ejecución programada que ya debió ocurrir.
+        if instantanea is None:
+            return False
+        if self.intervalo is not None:
+            return instantanea.actualizado >= ahora - self.intervalo
+        return instantanea.actualizado >= self.calcular_proxima(ahora) - timedelta(days=7)
+
+    def refrescar_ahora(self):
+        # Si otro hilo ya está refrescando, se espera a que termine y se usa
+        # su resultado en lugar de lanzar una segunda descarga.
+        if not self._lock_refresco.acquire(blocking=False):
+            with self._lock_refresco:
+                pass
+            if self.ultimo_error is not None:
+                raise ValueError(self.ultimo_error)
+            return almacen.actual()
+
+        try:
+            with metricas.cronometro('refresco_total'):
+                instantanea = ejecutar_refresco()
+            self.ultimo_error = None
+            metricas.contar('refrescos', resultado='ok')
+            return instantanea
+        except Exception as e:
+            self.ultimo_error = str(e)
+            metricas.contar('refrescos', resultado='error')
+            raise
+        finally:
+            self.ultima_ejecucion = self._ahora()
+            self._lock_refresco.release()
+
+    def _intentar(self):
+        try:
+            self.refrescar_ahora()
+            return True
+        except Exception:
+            return False
+
+    def _sincronizar(self):
+        if artefactos.directorio_artefactos():
+            return None
+        try:
+            return cache_compartida.sincronizar(al_cargar=preparar_instantanea)
+        except Exception:
+            return None
+
+    def _ciclo(self):
+        # Con varios procesos sobre el mismo MIASESOR_CACHE_DIR, el que
+        # refresca deja la instantánea en disco y los demás la toman aquí;
+        # antes de una ejecución programada se revisa primero si otro
+        # proceso ya la hizo.
+        self._sincronizar()
+        exito = self.esta_vigente(almacen.actual(), self._ahora()) or self._intentar()
+        while not self._detener.is_set():
+            ahora = self._ahora()
+            self.proxima_ejecucion = self.calcular_proxima(ahora) if exito else ahora + self.reintento
+            while not self._detener.is_set():
+                espera = (self.proxima_ejecucion - self._ahora()).total_seconds()
+                if espera <= 0:
+                    break
+                if self._detener.wait(min(espera, SINCRONIZACION_SEGUNDOS)):
+                    break
+                self._sincronizar()
+            if self._detener.is_set():
+                break
+            self._sincronizar()
+            exito = self.esta_vigente(almacen.actual(), self._ahora()) or self._intentar()
+
+    def iniciar(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return self
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._ciclo, name="refresco-banxico", daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._detener.set()
+
+
+_programador = None
+_lock_programador = threading.Lock()
+
+
+def obtener_programador():
+    global _programador
+    with _lock_programador:
+        if _programador is None:
+            _programador = ProgramadorRefresco(
+                dia_semana=os.getenv("MIASESOR_REFRESCO_DIA", DIA_REFRESCO_DEFAULT),
+                hora=os.getenv("MIASESOR_REFRESCO_HORA", HORA_REFRESCO_DEFAULT),
+                intervalo_horas=os.getenv("MIASESOR_REFRESCO_INTERVALO_HORAS") or (
+                    INTERVALO_ARTEFACTOS_HORAS if artefactos.directorio_artefactos() else None
+                ),
+                reintento_minutos=os.getenv("MIASESOR_REFRESCO_REINTENTO_MINUTOS", REINTENTO_MINUTOS_DEFAULT),
+            )
+        return _programador
+
+
+def iniciar_refresco_automatico():
+    if os.getenv("MIASESOR_REFRESCO_AUTOMATICO", "1").strip().lower() in ("0", "false", "no"):
+        return None
+    return obtener_programador().iniciar()
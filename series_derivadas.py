@@ -0,0 +1,194 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+from versiones import huellas_columnas
+
+SEMANAS_POR_ANIO = 52
+PLAZOS_CETES = {
+    '28D': 'CETE_28D',
+    '91D': 'CETE_91D',
+    '182D': 'CETE_182D',
+    '364D': 'CETE_364D',
+}
+# Series guardadas por (nombre, clave): alcanza para dos versiones del panel
+# (antes y después de un refresco) sin que sus sesiones se pisen.
+MAX_SERIES_CACHE = 64
+
+
+class SerieDerivada:
+    def __init__(self, nombre, dependencias, calculo, descripcion=""):
+        self.nombre = nombre
+        self.dependencias = list(dependencias)
+        self.calculo = calculo
+        self.descripcion = descripcion
+
+
+class RegistroDerivadas:
+    # Declara series derivadas y sus dependencias. Cada serie se calcula la
+    # primera vez que se pide y se guarda junto con una clave formada por las
+    # huellas de sus entradas: solo se recalcula si alguna entrada cambió.
+
+    def __init__(self):
+        self._definiciones = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def agregar(self, nombre, dependencias, calculo, descripcion=""):
+        self._definiciones[nombre] = SerieDerivada(nombre, dependencias, calculo, descripcion)
+        return calculo
+
+    def registrar(self, nombre, dependencias, descripcion=""):
+        def decorador(calculo):
+            return self.agregar(nombre, dependencias, calculo, descripcion)
+        return decorador
+
+    def nombres(self):
+        return list(self._definiciones)
+
+    def descripcion(self, nombre):
+        definicion = self._definiciones.get(nombre)
+        return definicion.descripcion if definicion else None
+
+    def _clave(self, nombre, huellas):
+        if nombre in huellas:
+            return huellas[nombre]
+        definicion = self._definiciones.get(nombre)
+        if definicion is None:
+            return None
+        claves = [self._clave(dependencia, huellas) for dependencia in definicion.dependencias]
+        if any(clave is None for clave in claves):
+            return None
+        return hashlib.blake2b(f"{nombre}:{'|'.join(claves)}".encode('utf-8'), digest_size=8).hexdigest()
+
+    def disponible(self, datos_df, nombre):
+        return datos_df is not None and self._clave(nombre, huellas_columnas(datos_df)) is not None
+
+    def obtener(self, datos_df, nombre):
+        if datos_df is None or len(datos_df) == 0:
+            return None
+        if nombre in datos_df.columns:
+            return datos_df[nombre]
+
+        clave = self._clave(nombre, huellas_columnas(datos_df))
+        if clave is None:
+            return None
+
+        llave = (nombre, clave)
+        with self._lock:
+            serie = self._cache.get(llave)
+            if serie is not None:
+                self._cache.move_to_end(llave)
+                return serie
+
+        # El cálculo corre fuera del candado; si dos sesiones calculan la
+        # misma serie a la vez, se queda la primera que se guarde.
+        definicion = self._definiciones[nombre]
+        entradas = {dependencia: self.obtener(datos_df, dependencia) for dependencia in definicion.dependencias}
+        serie = definicion.calculo(entradas).rename(nombre)
+
+        with self._lock:
+            serie = self._cache.setdefault(llave, serie)
+            self._cache.move_to_end(llave)
+            while len(self._cache) > MAX_SERIES_CACHE:
+                self._cache.popitem(last=False)
+        return serie
+
+    def tabla(self, datos_df, nombres=None):
+        nombres = nombres or self.nombres()
+        series = [self.obtener(datos_df, nombre) for nombre in nombres if self.disponible(datos_df, nombre)]
+        if not series:
+            return None
+        return pd.concat(series, axis=1)
+
+    def resumen(self, datos_df, nombres=None):
+        resumen = {}
+        for nombre in (nombres or self.nombres()):
+            serie = self.obtener(datos_df, nombre)
+            if serie is None:
+                continue
+            serie = serie.dropna()
+            if len(serie) == 0:
+                continue
+            valores = {
+                "fecha": str(serie.index[-1].date()),
+                "actual": round(float(serie.iloc[-1]), 4),
+            }
+            if len(serie) > 4:
+                valores["hace_4_semanas"] = round(float(serie.iloc[-5]), 4)
+            if len(serie) > SEMANAS_POR_ANIO:
+                valores["hace_52_semanas"] = round(float(serie.iloc[-1 - SEMANAS_POR_ANIO]), 4)
+            valores["descripcion"] = self.descripcion(nombre)
+            resumen[nombre] = valores
+        return resumen
+
+
+registro = RegistroDerivadas()
+
+
+@registro.registrar('Inflacion_Anual', ['INPC'], "Inflación anual (%) calculada con el INPC contra 52 semanas atrás")
+def _inflacion_anual(entradas):
+    inpc = entradas['INPC']
+    return (inpc / inpc.shift(SEMANAS_POR_ANIO) - 1.0) * 100.0
+
+
+def _tasa_real(serie):
+    def calculo(entradas):
+        # Ecuación de Fisher exacta con la inflación anual observada.
+        nominal = entradas[serie] / 100.0
+        inflacion = entradas['Inflacion_Anual'] / 100.0
+        return ((1.0 + nominal) / (1.0 + inflacion) - 1.0) * 100.0
+    return calculo
+
+
+def _diferencial(serie_a, serie_b):
+    def calculo(entradas):
+        return entradas[serie_a] - entradas[serie_b]
+    return calculo
+
+
+for _plazo, _serie in PLAZOS_CETES.items():
+    registro.agregar(
+        f'Tasa_Real_{_plazo}', [_serie, 'Inflacion_Anual'], _tasa_real(_serie),
+        f"Tasa real (%) de CETES a {_plazo[:-1]} días descontando la inflación anual"
+    )
+    registro.agregar(
+        f'Diferencial_{_plazo}_Objetivo', [_serie, 'Tasa_Objetivo'], _diferencial(_serie, 'Tasa_Objetivo'),
+        f"Diferencial (pp) entre CETES a {_plazo[:-1]} días y la Tasa Objetivo de Banxico"
+    )
+    registro.agregar(
+        f'Diferencial_{_plazo}_FED', [_serie, 'Tasa_FED'], _diferencial(_serie, 'Tasa_FED'),
+        f"Diferencial (pp) entre CETES a {_plazo[:-1]} días y la Tasa FED"
+    )
+
+registro.agregar(
+    'Diferencial_364_28', ['CETE_364D', 'CETE_28D'], _diferencial('CETE_364D', 'CETE_28D'),
+    "Pendiente de la curva: diferencial (pp) entre CETES a 364 y a 28 días"
+)
+registro.agregar(
+    'Diferencial_Objetivo_FED', ['Tasa_Objetivo', 'Tasa_FED'], _diferencial('Tasa_Objetivo', 'Tasa_FED'),
+    "Diferencial (pp) entre la Tasa Objetivo de Banxico y la Tasa FED"
+)
+
+SERIES_CONTEXTO = [
+    'Inflacion_Anual',
+    'Tasa_Real_28D',
+    'Tasa_Real_364D',
+    'Diferencial_364_28',
+    'Diferencial_28D_Objetivo',
+    'Diferencial_Objetivo_FED',
+]
+
+
+def serie_derivada(datos_df, nombre):
+    return registro.obtener(datos_df, nombre)
+
+
+def tabla_derivadas(datos_df, nombres=None):
+    return registro.tabla(datos_df, nombres)
+
+
+def resumen_derivadas(datos_df, nombres=None):
+    if datos_df is None or len(datos_df) == 0:
+        return {}
+    return registro.resumen(datos_df, nombres)
@@ -0,0 +1,79 @@
+import os
+import api
+import metricas
+
+
+def crear_aplicacion(demo):
+    # Servidor HTTP propio para exponer rutas junto a la interfaz de Gradio.
+    # Las rutas se registran antes de montar Gradio en "/" para que tengan
+    # prioridad sobre las de la interfaz.
+    import gradio as gr
+    from fastapi import FastAPI
+    from fastapi.responses import PlainTextResponse
+
+    aplicacion = FastAPI(title="Mi Asesor CETES")
+
+    @aplicacion.get("/metrics", response_class=PlainTextResponse)
+    def exponer_metricas():
+        return PlainTextResponse(metricas.exponer_prometheus(), media_type="text/plain; version=0.0.4")
+
+    registrar_api(aplicacion)
+
+    return gr.mount_gradio_app(aplicacion, demo, path="/")
+
+
+def registrar_api(aplicacion):
+    # Rutas de solo lectura sobre la instantánea vigente; todo el trabajo
+    # está en api.responder, aquí solo se traduce a respuestas HTTP. Son
+    # funciones normales y no async: api.responder serializa y comprime, y
+    # Starlette las corre en su threadpool sin bloquear el bucle de eventos
+    # que también atiende a Gradio.
+    from fastapi import Request, Response
+
+    def responder(recurso, request, **parametros):
+        estado, cuerpo, cabeceras = api.responder(recurso, parametros, request.headers)
+        return Response(
+            content=cuerpo,
+            status_code=estado,
+            headers=cabeceras,
+            media_type=None if estado == 304 else "application/json"
+        )
+
+    @aplicacion.get("/api/v1/version")
+    def version(request: Request):
+        return responder("version", request)
+
+    @aplicacion.get("/api/v1/panel")
+    def panel(request: Request, semanas: int = api.SEMANAS_PANEL_DEFAULT, series: str = None):
+        series = tuple(s.strip() for s in series.split(",") if s.strip()) if series else None
+        return responder("panel", request, semanas=semanas, series=series)
+
+    @aplicacion.get("/api/v1/pronosticos")
+    def pronosticos(request: Request):
+        return responder("pronosticos", request)
+
+    @aplicacion.get("/api/v1/pronosticos/{plazo}")
+    def pronostico_plazo(request: Request, plazo: str):
+        return responder("pronosticos", request, plazo=plazo)
+
+    @aplicacion.get("/api/v1/recomendaciones")
+    def recomendaciones(request: Request):
+        return responder("recomendaciones", request)
+
+    @aplicacion.get("/api/v1/recomendaciones/{plazo}")
+    def recomendacion_plazo(request: Request, plazo: str):
+        return responder("recomendaciones", request, plazo=plazo)
+
+    @aplicacion.get("/api/v1/escenario")
+    def escenario(request: Request, tasa_objetivo_pb: str = None, tasa_fed_pb: str = None,
+                  tipo_cambio_pct: str = None, inpc_pct: str = None):
+        return responder("escenario", request, tasa_objetivo_pb=tasa_objetivo_pb, tasa_fed_pb=tasa_fed_pb,
+                         tipo_cambio_pct=tipo_cambio_pct, inpc_pct=inpc_pct)
+
+
+def ejecutar(demo):
+    import uvicorn
+
+    host = os.getenv("GRADIO_SERVER_NAME", "127.0.0.1")
+    puerto = int(os.getenv("GRADIO_SERVER_PORT", "7860"))
+    uvicorn.run(crear_aplicacion(demo), host=host, port=puerto)
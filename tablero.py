@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import metricas
+from versiones import version_datos
+from graficas import SERIES_CETES, TIPOS_GRAFICA, TIPOS_SIN_PLAZO, TIPO_CON_RECOMENDACION, generar_grafica
+from recomendaciones import generar_recomendacion
+
+# Materialización de la pestaña de gráficas: por cada versión publicada del
+# panel y los pronósticos se construyen en segundo plano todas las figuras
+# (ya serializadas a JSON, lo que gr.Plot enviaría al navegador) y las
+# recomendaciones de los cuatro plazos. Los eventos de la interfaz solo
+# consultan un diccionario; si algo aún no está listo se calcula en el
+# momento y se guarda para las demás sesiones.
+HILOS_DEFAULT = 2
+MAX_VERSIONES = 2
+
+
+def version_tablero(datos_df, pronosticos_df):
+    version = version_datos(datos_df)
+    if version is None:
+        return None
+    return f"{version}-{version_datos(pronosticos_df)}"
+
+
+def clave_grafica(tipo, tipo_cetes):
+    return (tipo, None if tipo in TIPOS_SIN_PLAZO else tipo_cetes)
+
+
+def tareas_tablero():
+    tareas = []
+    for tipo in TIPOS_GRAFICA:
+        if tipo in TIPOS_SIN_PLAZO:
+            tareas.append(("grafica", clave_grafica(tipo, None)))
+        else:
+            tareas.extend(("grafica", clave_grafica(tipo, plazo)) for plazo in SERIES_CETES)
+    tareas.extend(("recomendacion", plazo) for plazo in SERIES_CETES)
+    return tareas
+
+
+def _figura_json(datos_df, pronosticos_df, tipo, tipo_cetes):
+    fig = generar_grafica(datos_df, pronosticos_df, tipo, tipo_cetes or SERIES_CETES[0])
+    return fig.to_json() if fig is not None else None
+
+
+class Tablero:
+    def __init__(self, version):
+        self.version = version
+        self.graficas = {}
+        self.recomendaciones = {}
+        self.pendientes = 0
+        self.listo = threading.Event()
+
+
+class Materializador:
+    def __init__(self, hilos=HILOS_DEFAULT, max_versiones=MAX_VERSIONES):
+        self._ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="tablero")
+        self._max_versiones = max_versiones
+        self._tableros = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tablero(self, version, crear):
+        with self._lock:
+            tablero = self._tableros.get(version)
+            if tablero is not None:
+                self._tableros.move_to_end(version)
+                return tablero, False
+            if not crear:
+                return None, False
+            tablero = self._tableros[version] = Tablero(version)
+            while len(self._tableros) > self._max_versiones:
+                self._tableros.popitem(last=False)
+            return tablero, True
+
+    def _guardar(self, destino, clave, calcular):
+        # Se calcula fuera del candado; si otro hilo llegó antes se conserva
+        # su resultado.
+        with self._lock:
+            if clave in destino:
+                return destino[clave], True
+        valor = calcular()
+        with self._lock:
+            return destino.setdefault(clave, valor), False
+
+    def _construir(self, tablero, tarea, datos_df, pronosticos_df, inicio):
+        tipo, clave = tarea
+        try:
+            if tipo == "grafica":
+                self._guardar(tablero.graficas, clave, lambda: _figura_json(datos_df, pronosticos_df, *clave))
+            else:
+                self._guardar(tablero.recomendaciones, clave, lambda: generar_recomendacion(datos_df, pronosticos_df, clave))
+        except Exception:
+            metricas.contar('errores', etapa='tablero')
+        finally:
+            with self._lock:
+                tablero.pendientes -= 1
+                terminado = tablero.pendientes == 0
+            if terminado:
+                metricas.observar('tablero_materializacion', time.perf_counter() - inicio)
+                tablero.listo.set()
+
+    def programar(self, datos_df, pronosticos_df):
+        # Idempotente por versión: varias llamadas para la misma versión
+        # (refresco, sincronización entre procesos, arranque) encolan una
+        # sola materialización.
+        version = version_tablero(datos_df, pronosticos_df)
+        if version is None:
+            return None
+        tablero, nuevo = self._tablero(version, crear=True)
+        if not nuevo:
+            return tablero
+
+        tareas = tareas_tablero()
+        tablero.pendientes = len(tareas)
+        inicio = time.perf_counter()
+        for tarea in tareas:
+            self._ejecutor.submit(self._construir, tablero, tarea, datos_df, pronosticos_df, inicio)
+        return tablero
+
+    def consultar(self, datos_df, pronosticos_df, tipo, tipo_cetes):
+        # Devuelve (figura en JSON o None, recomendación en markdown). Solo
+        # las versiones programadas (las publicadas) tienen tablero; una
+        # sesión con un panel de otra versión recibe el resultado calculado
+        # en el momento, sin guardarlo ni desplazar al tablero vigente.
+        version = version_tablero(datos_df, pronosticos_df)
+        clave = clave_grafica(tipo, tipo_cetes)
+        tablero = self._tablero(version, crear=False)[0] if version is not None else None
+        if tablero is None:
+            metricas.contar('tablero_consultas', resultado='sin_tablero')
+            grafica = _figura_json(datos_df, pronosticos_df, *clave) if version is not None else None
+            recomendacion = generar_recomendacion(datos_df, pronosticos_df, tipo_cetes) if tipo == TIPO_CON_RECOMENDACION else ""
+            return grafica, recomendacion
+
+        grafica, acierto = self._guardar(tablero.graficas, clave, lambda: _figura_json(datos_df, pronosticos_df, *clave))
+        metricas.contar('tablero_consultas', resultado='acierto' if acierto else 'fallo')
+        if tipo != TIPO_CON_RECOMENDACION:
+            return grafica, ""
+        recomendacion, _ = self._guardar(
+            tablero.recomendaciones, tipo_cetes, lambda: generar_recomendacion(datos_df, pronosticos_df, tipo_cetes)
+        )
+        return grafica, recomendacion
+
+    def detener(self):
+        self._ejecutor.shutdown(wait=False, cancel_futures=True)
+
+
+_materializador = None
+_lock_materializador = threading.Lock()
+
+
+def obtener_materializador():
+    global _materializador
+    with _lock_materializador:
+        if _materializador is None:
+            _materializador = Materializador(hilos=int(os.getenv("MIASESOR_TABLERO_HILOS") or HILOS_DEFAULT))
+        return _materializador
+
+
+def materializar(instantanea):
+    if instantanea is None:
+        return None
+    return obtener_materializador().programar(instantanea.datos, instantanea.pronosticos)
@@ -1,7 +1,9 @@
 import json
-from openai import OpenAI
+import time
+import metricas
+from series_derivadas import registro
 
-def handle_tool_calls(tool_calls):
+def handle_tool_calls(tool_calls, datos_df=None, pronosticos_df=None):
     results = []
     for tool_call in tool_calls:
         try:
@@ -14,57 +16,144 @@ def handle_tool_calls(tool_calls):
         
         
         function_name = tool_call.function.name if hasattr(tool_call.function, 'name') else None
+        inicio = time.perf_counter()
         
-        if function_name == "calcular_rendimiento":
-            # Obtener los parámetros
-            monto = arguments.get("monto", 0)
-            tasa = arguments.get("tasa", 0)  # Tasa anual en porcentaje
-            plazo = arguments.get("plazo", 0)  # Plazo en días
+        try:
+            if function_name == "calcular_rendimiento":
+                # Obtener los parámetros
+                monto = arguments.get("monto", 0)
+                tasa = arguments.get("tasa", 0)  # Tasa anual en porcentaje
+                plazo = arguments.get("plazo", 0)  # Plazo en días
             
-            # Validar que todos los parámetros estén presentes
-            if monto <= 0 or tasa <= 0 or plazo <= 0:
-                resultado = {
-                    "error": "Parámetros inválidos. El monto, tasa y plazo deben ser mayores a cero.",
-                    "monto": monto,
-                    "tasa": tasa,
-                    "plazo": plazo
-                }
-            else:
-                # Calcular el rendimiento: Interés simple
-                # Fórmula: Rendimiento = Monto × (Tasa / 100) × (Plazo / 365)
-                rendimiento = monto * (tasa / 100) * (plazo / 365)
+                # Validar que todos los parámetros estén presentes
+                if monto <= 0 or tasa <= 0 or plazo <= 0:
+                    resultado = {
+                        "error": "Parámetros inválidos. El monto, tasa y plazo deben ser mayores a cero.",
+                        "monto": monto,
+                        "tasa": tasa,
+                        "plazo": plazo
+                    }
+                else:
+                    # Calcular el rendimiento: Interés simple
+                    # Fórmula: Rendimiento = Monto × (Tasa / 100) × (Plazo / 365)
+                    rendimiento = monto * (tasa / 100) * (plazo / 365)
                 
-                # Calcular el monto total al vencimiento
-                monto_total = monto + rendimiento
+                    # Calcular el monto total al vencimiento
+                    monto_total = monto + rendimiento
                 
-                # Calcular la tasa efectiva anual (si se mantuviera la misma tasa)
-                tasa_efectiva = tasa * (365 / plazo) if plazo < 365 else tasa
+                    # Calcular la tasa efectiva anual (si se mantuviera la misma tasa)
+                    tasa_efectiva = tasa * (365 / plazo) if plazo < 365 else tasa
                 
-                resultado = {
-                    "monto_invertido": f"${monto:,.2f} MXN",
-                    "tasa_anual": f"{tasa:.2f}%",
-                    "plazo": f"{plazo} días",
-                    "rendimiento": f"${rendimiento:,.2f} MXN",
-                    "monto_total_al_vencimiento": f"${monto_total:,.2f} MXN",
-                    "tasa_efectiva_equivalente": f"{tasa_efectiva:.2f}%",
-                    "explicacion": f"Por invertir ${monto:,.2f} MXN a una tasa del {tasa:.2f}% anual durante {plazo} días, obtendrás un rendimiento de ${rendimiento:,.2f} MXN. Al vencimiento recibirás ${monto_total:,.2f} MXN."
+                    resultado = {
+                        "monto_invertido": f"${monto:,.2f} MXN",
+                        "tasa_anual": f"{tasa:.2f}%",
+                        "plazo": f"{plazo} días",
+                        "rendimiento": f"${rendimiento:,.2f} MXN",
+                        "monto_total_al_vencimiento": f"${monto_total:,.2f} MXN",
+                        "tasa_efectiva_equivalente": f"{tasa_efectiva:.2f}%",
+                        "explicacion": f"Por invertir ${monto:,.2f} MXN a una tasa del {tasa:.2f}% anual durante {plazo} días, obtendrás un rendimiento de ${rendimiento:,.2f} MXN. Al vencimiento recibirás ${monto_total:,.2f} MXN."
+                    }
+            
+                result = {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": json.dumps(resultado, ensure_ascii=False)
                 }
+            elif function_name == "consultar_analitica":
+                from analitica import resumen_analitica, VENTANAS_DEFAULT
             
-            result = {
-                "role": "tool",
-                "tool_call_id": tool_call.id,
-                "content": json.dumps(resultado, ensure_ascii=False)
-            }
-        else:
-            # Para funciones no implementadas
+                serie = arguments.get("serie", "CETE_28D")
+                ventanas = arguments.get("ventanas") or None
+                if ventanas:
+                    ventanas = [v for v in ventanas if v in VENTANAS_DEFAULT] or None
+            
+                resumen = resumen_analitica(datos_df, serie, ventanas)
+                if resumen is None:
+                    resultado = {
+                        "error": "No hay datos históricos cargados para esa serie. Pide al usuario que actualice los datos.",
+                        "serie": serie
+                    }
+                else:
+                    resultado = resumen
+            
+                result = {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": json.dumps(resultado, ensure_ascii=False)
+                }
+            elif function_name == "consultar_curva":
+                from curva_rendimiento import resumen_curva
+            
+                plazos = [p for p in (arguments.get("plazos_dias") or []) if isinstance(p, (int, float)) and 0 < p <= 3650]
+                resumen = resumen_curva(datos_df, plazos or None)
+                if resumen is None:
+                    resultado = {
+                        "error": "No hay datos históricos cargados para ajustar la curva. Pide al usuario que actualice los datos."
+                    }
+                else:
+                    resultado = resumen
+            
+                result = {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": json.dumps(resultado, ensure_ascii=False)
+                }
+            elif function_name == "consultar_series_derivadas":
+                from series_derivadas import resumen_derivadas, SERIES_CONTEXTO
+            
+                nombres = arguments.get("series") or SERIES_CONTEXTO
+                resumen = resumen_derivadas(datos_df, nombres)
+                if not resumen:
+                    resultado = {
+                        "error": "No hay datos históricos cargados para calcular los indicadores. Pide al usuario que actualice los datos.",
+                        "series": nombres
+                    }
+                else:
+                    resultado = resumen
+            
+                result = {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": json.dumps(resultado, ensure_ascii=False)
+                }
+            elif function_name == "simular_escenarios":
+                from escenarios import instantanea_de, resumen_escenarios
+            
+                instantanea = instantanea_de(pronosticos_df)
+                if instantanea is None:
+                    resultado = {
+                        "error": "Los pronósticos de esta sesión no son los vigentes o no hay pronósticos cargados. Pide al usuario que actualice los datos."
+                    }
+                else:
+                    resultado = resumen_escenarios(instantanea, arguments.get("escenarios") or [])
+            
+                result = {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": json.dumps(resultado, ensure_ascii=False)
+                }
+            else:
+                # Para funciones no implementadas
+                result = {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": json.dumps({
+                        "error": f"Función '{function_name}' no está implementada aún"
+                    })
+                }
+        except Exception as e:
+            # Un error de una herramienta se le devuelve al modelo como
+            # resultado; no debe tumbar el turno completo.
+            metricas.contar('errores', etapa='herramienta')
             result = {
                 "role": "tool",
                 "tool_call_id": tool_call.id,
                 "content": json.dumps({
-                    "error": f"Función '{function_name}' no está implementada aún"
-                })
+                    "error": f"No se pudo ejecutar '{function_name}': {str(e)}"
+                }, ensure_ascii=False)
             }
         
+        metricas.observar('herramienta', time.perf_counter() - inicio, funcion=function_name or "desconocida")
         results.append(result)
     
     return results
@@ -94,5 +183,111 @@ tools = [
                 "required": ["monto", "tasa", "plazo"]
             }
         }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "consultar_analitica",
+            "description": "Consulta estadísticas móviles de una serie de CETES calculadas con los datos históricos de Banxico: media, desviación estándar (volatilidad), mínimo, máximo y z-score de la última tasa para ventanas de 4, 12, 26 y 52 semanas.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "serie": {
+                        "type": "string",
+                        "enum": ["CETE_28D", "CETE_91D", "CETE_182D", "CETE_364D"],
+                        "description": "Serie de CETES a consultar"
+                    },
+                    "ventanas": {
+                        "type": "array",
+                        "items": {"type": "integer", "enum": [4, 12, 26, 52]},
+                        "description": "Ventanas en semanas (opcional, por defecto todas)"
+                    }
+                },
+                "required": ["serie"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "consultar_curva",
+            "description": "Consulta la curva de rendimiento de CETES más reciente, ajustada con el modelo Nelson-Siegel sobre los plazos de 28, 91, 182 y 364 días. Retorna nivel, pendiente, curvatura, forma de la curva, diferencial 364-28 días y tasas interpoladas para plazos arbitrarios.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "plazos_dias": {
+                        "type": "array",
+                        "items": {"type": "integer"},
+                        "description": "Plazos en días para los que se quiere la tasa interpolada (ej: [60, 120, 270])"
+                    }
+                },
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "consultar_series_derivadas",
+            "description": "Consulta indicadores derivados de los datos de Banxico: inflación anual (INPC), tasa real por plazo de CETES, pendiente de la curva (364-28 días) y diferenciales contra la Tasa Objetivo de Banxico y la Tasa FED. Retorna el valor actual, hace 4 semanas y hace 52 semanas.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "series": {
+                        "type": "array",
+                        "items": {"type": "string", "enum": registro.nombres()},
+                        "description": "Indicadores a consultar (opcional, por defecto los principales)"
+                    }
+                },
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "simular_escenarios",
+            "description": "Simula escenarios hipotéticos sobre las variables que usan los modelos de pronóstico (recortes o alzas de la Tasa Objetivo de Banxico, movimientos de la Tasa FED, choques al tipo de cambio o a la inflación) y retorna el pronóstico condicional de los cuatro plazos de CETES comparado con el pronóstico base, a 4 semanas y al final del horizonte. Usa los modelos ya ajustados, sin reestimarlos. Los cambios son acumulados respecto al último valor observado; un número aplica desde la primera semana y una lista da el cambio semana por semana (el último valor se mantiene).",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "escenarios": {
+                        "type": "array",
+                        "maxItems": 8,
+                        "description": "Escenarios a comparar (hasta 8)",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "nombre": {
+                                    "type": "string",
+                                    "description": "Nombre corto del escenario (ej: 'Recorte de 50 pb')"
+                                },
+                                "tasa_objetivo_pb": {
+                                    "type": "array",
+                                    "items": {"type": "number"},
+                                    "description": "Cambio acumulado de la Tasa Objetivo en puntos base por semana (ej: [0, 0, -25, -25, -25, -25, -50] para recortes de 25 pb en las semanas 3 y 7)"
+                                },
+                                "tasa_fed_pb": {
+                                    "type": "array",
+                                    "items": {"type": "number"},
+                                    "description": "Cambio acumulado de la Tasa FED en puntos base por semana"
+                                },
+                                "tipo_cambio_pct": {
+                                    "type": "array",
+                                    "items": {"type": "number"},
+                                    "description": "Cambio acumulado del tipo de cambio FIX en porcentaje por semana (ej: [5] para una depreciación de 5% inmediata)"
+                                },
+                                "inpc_pct": {
+                                    "type": "array",
+                                    "items": {"type": "number"},
+                                    "description": "Cambio acumulado del INPC en porcentaje por semana"
+                                }
+                            }
+                        }
+                    }
+                },
+                "required": ["escenarios"]
+            }
+        }
     }
 ]
\ No newline at end of file
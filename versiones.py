@@ -0,0 +1,167 @@
+import hashlib
+import threading
+import weakref
+import numpy as np
+import pandas as pd
+
+# Huellas de contenido para DataFrames del panel y de pronósticos.
+# Los DataFrames de la app no se modifican in-place después de crearse,
+# por eso cada huella se calcula una sola vez por objeto.
+_huellas = {}
+_lock_huellas = threading.Lock()
+
+
+def _olvidar_huellas(clave):
+    with _lock_huellas:
+        _huellas.pop(clave, None)
+
+
+def _memo_por_objeto(df, tipo, calculo):
+    clave = id(df)
+    with _lock_huellas:
+        entrada = _huellas.get(clave)
+        if entrada is not None and entrada[0]() is df and tipo in entrada[1]:
+            return entrada[1][tipo]
+
+    valor = calculo(df)
+    with _lock_huellas:
+        entrada = _huellas.get(clave)
+        if entrada is None or entrada[0]() is not df:
+            entrada = (weakref.ref(df, lambda _, c=clave: _olvidar_huellas(c)), {})
+            _huellas[clave] = entrada
+        entrada[1][tipo] = valor
+    return valor
+
+
+def _huella_dataframe(df):
+    h = hashlib.blake2b(digest_size=8)
+    h.update(repr(list(df.columns)).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return h.hexdigest()
+
+
+def _huellas_columnas(df):
+    indice = pd.util.hash_pandas_object(df.index, index=False).values.tobytes()
+    huellas = {}
+    for columna in df.columns:
+        h = hashlib.blake2b(indice, digest_size=8)
+        h.update(pd.util.hash_pandas_object(df[columna], index=False).values.tobytes())
+        huellas[columna] = h.hexdigest()
+    return huellas
+
+
+def version_datos(datos):
+    if datos is None:
+        return None
+
+    if isinstance(datos, dict):
+        partes = [f"{clave}:{version_datos(valor)}" for clave, valor in sorted(datos.items())]
+        return hashlib.blake2b('|'.join(partes).encode('utf-8'), digest_size=8).hexdigest()
+
+    if not isinstance(datos, pd.DataFrame):
+        return None
+
+    return _memo_por_objeto(datos, 'version', _huella_dataframe)
+
+
+def huellas_columnas(datos_df):
+    # Huella por columna (incluye el índice): permite invalidar solo lo que
+    # depende de las columnas que cambiaron entre dos versiones del panel.
+    if datos_df is None or not isinstance(datos_df, pd.DataFrame):
+        return {}
+    return _memo_por_objeto(datos_df, 'columnas', _huellas_columnas)
+
+
+MAX_REVISIONES_DETALLE = 50
+
+
+def congelar(datos_df):
+    # Copia de solo lectura del panel: una versión publicada no puede
+    # cambiar sin cambiar su huella.
+    valores = datos_df.to_numpy(dtype=np.float64, copy=True)
+    valores.setflags(write=False)
+    return pd.DataFrame(valores, index=datos_df.index, columns=datos_df.columns, copy=False)
+
+
+def _valor_json(valor):
+    return float(valor) if np.isfinite(valor) else None
+
+
+def diferencias_datos(anterior, nuevo):
+    # Resumen compacto de lo que cambió entre dos versiones del panel.
+    # tipo: "inicial", "sin_cambios", "agregado" (solo semanas nuevas al
+    # final) o "revision" (cambiaron valores ya publicados, p. ej. el INPC
+    # revisado, o se quitaron filas o columnas).
+    version = version_datos(nuevo)
+    version_anterior = version_datos(anterior)
+    resultado = {
+        "version_anterior": version_anterior,
+        "version": version,
+        "tipo": "sin_cambios",
+        "filas_agregadas": 0,
+        "primera_fecha_agregada": None,
+        "filas_eliminadas": 0,
+        "columnas_agregadas": [],
+        "columnas_eliminadas": [],
+        "revisiones": 0,
+        "series_revisadas": [],
+        "detalle_revisiones": [],
+    }
+    if anterior is None:
+        resultado.update(
+            tipo="inicial",
+            filas_agregadas=len(nuevo),
+            primera_fecha_agregada=nuevo.index.min().strftime('%Y-%m-%d') if len(nuevo) else None,
+        )
+        return resultado
+    if version == version_anterior:
+        return resultado
+
+    columnas = [columna for columna in nuevo.columns if columna in anterior.columns]
+    fechas = anterior.index.intersection(nuevo.index)
+    agregadas = nuevo.index.difference(anterior.index)
+    eliminadas = anterior.index.difference(nuevo.index)
+
+    previos = anterior.loc[fechas, columnas].to_numpy(dtype=np.float64)
+    actuales = nuevo.loc[fechas, columnas].to_numpy(dtype=np.float64)
+    filas, posiciones = np.nonzero(~((previos == actuales) | (np.isnan(previos) & np.isnan(actuales))))
+
+    resultado.update(
+        filas_agregadas=len(agregadas),
+        primera_fecha_agregada=agregadas.min().strftime('%Y-%m-%d') if len(agregadas) else None,
+        filas_eliminadas=len(eliminadas),
+        columnas_agregadas=[str(c) for c in nuevo.columns if c not in anterior.columns],
+        columnas_eliminadas=[str(c) for c in anterior.columns if c not in nuevo.columns],
+        revisiones=int(len(filas)),
+        series_revisadas=sorted({str(columnas[j]) for j in posiciones}),
+        detalle_revisiones=[
+            {
+                "fecha": fechas[i].strftime('%Y-%m-%d'),
+                "serie": str(columnas[j]),
+                "anterior": _valor_json(previos[i, j]),
+                "nuevo": _valor_json(actuales[i, j]),
+            }
+            for i, j in zip(filas[:MAX_REVISIONES_DETALLE], posiciones[:MAX_REVISIONES_DETALLE])
+        ],
+    )
+    solo_agregado = (
+        len(filas) == 0 and len(eliminadas) == 0 and
+        not resultado["columnas_agregadas"] and not resultado["columnas_eliminadas"] and
+        list(nuevo.columns) == list(anterior.columns) and
+        len(agregadas) > 0 and agregadas.min() > anterior.index.max()
+    )
+    resultado["tipo"] = "agregado" if solo_agregado else "revision"
+    return resultado
+
+
+class VersionDatos:
+    # Panel de Banxico identificado por su contenido, junto con lo que
+    # cambió respecto a la versión anterior. Si el contenido no cambió se
+    # conserva el mismo objeto anterior, y con él todas las cachés que
+    # dependen de su identidad o de su huella.
+
+    def __init__(self, datos, anterior=None):
+        datos = congelar(datos)
+        self.diferencias = diferencias_datos(anterior, datos)
+        self.datos = anterior if self.diferencias["tipo"] == "sin_cambios" else datos
+        self.version = self.diferencias["version"]